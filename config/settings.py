@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.instrumentation.RequestMetricsMiddleware',  # Server-Timing и лог main.requests (первым — меряет все остальные)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -42,7 +43,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'main.middleware.RateLimitMiddleware',  # Rate limiting для защиты от спама
+    'main.middleware.RateLimitMiddleware',  # Rate limiting для защиты от спама (RATE_LIMITS)
 ]
 
 if DEBUG:
@@ -52,7 +53,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates + замер времени рендеринга для Server-Timing
+        'BACKEND': 'main.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -72,6 +74,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Async-версии страниц (main/async_views.py); включается ASGI-входом config/asgi.py
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
 # Если в .env задан DB_NAME — PostgreSQL (сервер), иначе SQLite (локальная разработка)
 if env('DB_NAME', default=''):
     DATABASES = {
@@ -92,6 +97,71 @@ else:
         }
     }
 
+# Кэш: в .env можно задать CACHE_URL (например, redis://127.0.0.1:6379/1),
+# чтобы кэш был общим для всех gunicorn-воркеров
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Ограничение частоты запросов (main/ratelimit.py): path — регулярное выражение от начала пути,
+# limit запросов за window секунд с одного IP. Лимит общий для всех воркеров, только если
+# кэш общий (CACHE_URL=redis://...); с LocMemCache каждый процесс считает отдельно
+RATE_LIMITS = [
+    {
+        'name': 'contact',
+        'path': r'^/api/submit-contact/$',
+        'methods': ['POST'],
+        'limit': env.int('CONTACT_RATE_LIMIT', default=3),
+        'window': 60,
+    },
+]
+
+# Время жизни кэша страниц для анонимных посетителей (сбрасывается при изменении данных)
+PAGE_CACHE_TIMEOUT = env.int('PAGE_CACHE_TIMEOUT', default=60 * 60)
+
+# Готовые sitemap-файлы (шарды по разделам + .gz), пересобираются при изменении данных
+SITEMAP_ROOT = env.str('SITEMAP_ROOT', default=str(BASE_DIR / 'sitemaps'))
+SITEMAP_PROTOCOL = 'https'
+
+# Критический CSS страниц (python manage.py build_critical_css после collectstatic).
+# Пока файла страницы нет, стили подключаются обычным блокирующим <link>
+CRITICAL_CSS_ROOT = env.str('CRITICAL_CSS_ROOT', default=str(BASE_DIR / 'critical_css'))
+
+# Резервные копии каталога (backup_catalog / restore_catalog), по папке на копию
+BACKUP_ROOT = env.str('BACKUP_ROOT', default=str(BASE_DIR / 'backups'))
+
+# Замеры запросов (main/instrumentation.py): SQL, шаблоны, кэш — в Server-Timing и лог main.requests.
+# Доля REQUEST_PROFILE_RATE запросов идет под cProfile; профиль сохраняется,
+# если запрос длился дольше REQUEST_SLOW_MS (медленные запросы в логе — WARNING)
+REQUEST_METRICS = env.bool('REQUEST_METRICS', default=True)
+# Server-Timing всем посетителям; без этого — только INTERNAL_IPS и сотрудникам
+SERVER_TIMING = env.bool('SERVER_TIMING', default=False)
+INTERNAL_IPS = env.list('INTERNAL_IPS', default=['127.0.0.1', '::1'])
+# Прокси (nginx), чей адрес в X-Forwarded-For — последний — считается адресом клиента
+TRUSTED_PROXIES = env.list('TRUSTED_PROXIES', default=['127.0.0.1', '::1'])
+REQUEST_SLOW_MS = env.int('REQUEST_SLOW_MS', default=500)
+REQUEST_PROFILE_RATE = env.float('REQUEST_PROFILE_RATE', default=0.01)
+REQUEST_PROFILE_ROOT = env.str('REQUEST_PROFILE_ROOT', default=str(BASE_DIR / 'profiles'))
+REQUEST_PROFILE_MAX_FILES = env.int('REQUEST_PROFILE_MAX_FILES', default=200)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'request': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'requests': {'class': 'logging.StreamHandler', 'formatter': 'request'},
+    },
+    'loggers': {
+        'main.requests': {
+            'handlers': ['requests'],
+            'level': env.str('REQUEST_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -136,6 +206,14 @@ TIME_ZONE = 'Asia/Tashkent'
 
 DEFAULT_IMAGE = 'default_foto.png'
 
+# Перекодирование загруженных изображений в фоновом потоке (admin не ждет PIL).
+# Зависшие в статусе pending изображения обрабатывает: python manage.py process_images
+IMAGE_PROCESSING_ASYNC = env.bool('IMAGE_PROCESSING_ASYNC', default=True)
+
+# Пересчет похожих товаров после сохранения — в фоновом потоке, запрос не ждет.
+# Если пересчет не успел (например, при перезапуске): python manage.py build_similar_products
+SIMILAR_PRODUCTS_ASYNC = env.bool('SIMILAR_PRODUCTS_ASYNC', default=True)
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static'
@@ -143,11 +221,13 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # In production, append content hash to filenames → automatic cache busting
-# (STATICFILES_STORAGE удалена в Django 5.1+, работает только через STORAGES)
+# (STATICFILES_STORAGE удалена в Django 5.1+, работает только через STORAGES).
+# collectstatic заодно минифицирует CSS/JS, создает AVIF/WebP варианты картинок
+# и .gz/.br для nginx gzip_static/brotli_static (main/storage.py)
 if not DEBUG:
     STORAGES = {
         'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
-        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+        'staticfiles': {'BACKEND': 'main.storage.OptimizedStaticFilesStorage'},
     }
 
 MEDIA_URL = '/media/'
@@ -162,6 +242,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Telegram Bot configuration
 TELEGRAM_BOT_TOKEN = env('TELEGRAM_BOT_TOKEN', default='')
 TELEGRAM_CHAT_ID = env('TELEGRAM_CHAT_ID', default='')
+TELEGRAM_API_URL = env('TELEGRAM_API_URL', default='https://api.telegram.org')
+
+# Заявки с формы отправляет команда send_contact_notifications (main/notifications.py).
+# От CONTACT_DIGEST_THRESHOLD заявок в очереди — сводным сообщением (0 — всегда по одной)
+CONTACT_DIGEST_THRESHOLD = env.int('CONTACT_DIGEST_THRESHOLD', default=5)
+CONTACT_MAX_ATTEMPTS = env.int('CONTACT_MAX_ATTEMPTS', default=10)
 
 # =============================================================================
 # SECURITY SETTINGS (для продакшена)
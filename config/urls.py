@@ -2,26 +2,12 @@ from django.conf import settings
 from django.conf.urls.i18n import i18n_patterns
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.views.i18n import set_language
 from django.views.generic import TemplateView
 from django.views.decorators.csrf import csrf_exempt
 from main.urls import api_urlpatterns
-from main.sitemaps import (
-    StaticViewSitemap,
-    ProductCategorySitemap,
-    ProductSitemap,
-    BlogPostSitemap,
-)
-
-# Sitemaps для поисковых систем
-sitemaps = {
-    'static': StaticViewSitemap,
-    'categories': ProductCategorySitemap,
-    'products': ProductSitemap,
-    'blog': BlogPostSitemap,
-}
+from main.views import sitemap_file
 
 from django.http import HttpResponse
 
@@ -34,8 +20,9 @@ urlpatterns = [
     # Это безопасно, так как set_language - встроенная Django view без побочных эффектов
     path('set-language/', csrf_exempt(set_language), name='set_language'),
 
-    # Sitemap для поисковых систем (Google, Yandex, Bing)
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='sitemap'),
+    # Sitemap для поисковых систем (Google, Yandex, Bing): индекс sitemap.xml
+    # и шарды sitemap-<раздел>-<n>.xml, заранее собранные в SITEMAP_ROOT (main/sitemap_files.py)
+    re_path(r'^(?P<filename>sitemap(?:-[a-z]+-\d+)?\.xml)$', sitemap_file, name='sitemap_file'),
 
     # robots.txt
     path('robots.txt', TemplateView.as_view(template_name='robots.txt', content_type='text/plain'), name='robots'),
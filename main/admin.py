@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group, User
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 from django.utils.html import format_html
 from django.contrib.sites.models import Site
-from .models import ProductCategory, Product, ProductImage, BlogPost
+from . import category_stats
+from .models import ProductCategory, Product, ProductImage, BlogPost, ContactMessage
 
 admin.site.unregister(Group)
 admin.site.unregister(User)
@@ -11,15 +15,58 @@ admin.site.unregister(Site)
 
 @admin.register(ProductCategory)
 class ProductCategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'is_active', 'product_count', 'created_at']
+    # Счетчики и цены хранятся в категории (main/category_stats.py) — без агрегатов на каждый список
+    list_display = ['name', 'slug', 'is_active', 'active_product_count', 'in_stock_count', 'price_range', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = [
+        'created_at', 'updated_at', 'active_product_count', 'in_stock_count', 'min_price', 'max_price',
+    ]
+
+    def price_range(self, obj):
+        if obj.min_price is None:
+            return '-'
+        if obj.min_price == obj.max_price:
+            return obj.min_price
+        return f'{obj.min_price} – {obj.max_price}'
+    price_range.short_description = 'Цены'
+    price_range.admin_order_field = 'min_price'
+
+
+class CategoryStatsAdminMixin:
+    """
+    Массовые правки (list_editable, действия, инлайны фото) пересчитывают сводки
+    затронутых категорий один раз и в той же транзакции, а не после каждого объекта
+    """
+
+    def _with_deferred_stats(self, view, request, *args, **kwargs):
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+        with transaction.atomic(using=router.db_for_write(self.model)), category_stats.deferred():
+            return view(request, *args, **kwargs)
+
+    def changelist_view(self, request, extra_context=None):
+        return self._with_deferred_stats(super().changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return self._with_deferred_stats(super().changeform_view, request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self._with_deferred_stats(super().delete_view, request, object_id, extra_context)
 
-    def product_count(self, obj):
-        return obj.products.count()
-    product_count.short_description = 'Количество товаров'
+
+def image_preview_html(obj):
+    """Превью изображения; пока файл обрабатывается в фоне — заглушка со статусом"""
+    if not obj.image:
+        return '-'
+    if not obj.image_ready:
+        return format_html(
+            '<div style="width: 100px; height: 100px; display: flex; align-items: center; '
+            'justify-content: center; background: #f0f0f0; border-radius: 4px;">⏳ {}</div>',
+            obj.get_image_status_display()
+        )
+    return format_html('<img src="{}" style="max-height: 100px;"/>', obj.image.url)
 
 
 class HasImageFilter(admin.SimpleListFilter):
@@ -33,10 +80,13 @@ class HasImageFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
+        # EXISTS по индексу product_id вместо JOIN + DISTINCT по всей таблице товаров
+        has_image = Exists(ProductImage.objects.filter(product=OuterRef('pk')))
         if self.value() == 'yes':
-            return queryset.filter(images__isnull=False).distinct()
+            return queryset.filter(has_image)
         if self.value() == 'no':
-            return queryset.filter(images__isnull=True)
+            return queryset.filter(~has_image)
+
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
@@ -48,14 +98,12 @@ class ProductImageInline(admin.TabularInline):
         js = ('main/js/admin_image_paste.js',)
 
     def image_preview(self, obj):
-        if obj.image:
-            return format_html('<img src="{}" style="max-height: 100px;"/>', obj.image.url)
-        return '-'
+        return image_preview_html(obj)
     image_preview.short_description = 'Превью'
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(CategoryStatsAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'category', 'size', 'color', 'material', 'price', 'stock', 'is_active', 'is_featured']
     list_filter = ['category', 'material', 'is_active', 'is_featured', 'created_at', HasImageFilter]
     search_fields = ['name', 'description', 'color']
@@ -63,6 +111,7 @@ class ProductAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     inlines = [ProductImageInline]
     list_editable = ['is_active', 'category', 'size', 'material', 'is_featured',]
+    list_select_related = ['category']
 
     fieldsets = (
         ('Основная информация', {
@@ -80,20 +129,29 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'category' and request is not None:
+            # list_editable: список категорий загружается один раз на запрос, а не для каждого <select>
+            choices = getattr(request, '_category_choices', None)
+            if choices is None:
+                choices = request._category_choices = list(formfield.choices)
+            formfield.choices = choices
+        return formfield
+
 
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(CategoryStatsAdminMixin, admin.ModelAdmin):
     list_display = ['product', 'is_main', 'order', 'image_preview', 'created_at']
-    list_filter = ['is_main', 'created_at']
+    list_filter = ['is_main', 'image_status', 'created_at']
     list_editable = ['is_main', 'order']
+    list_select_related = ['product']
 
     def get_queryset(self, request):
         return super().get_queryset(request).exclude(image='')
 
     def image_preview(self, obj):
-        if obj.image:
-            return format_html('<img src="{}" style="max-height: 100px;"/>', obj.image.url)
-        return '-'
+        return image_preview_html(obj)
     image_preview.short_description = 'Превью'
 
 
@@ -103,7 +161,7 @@ class BlogPostAdmin(admin.ModelAdmin):
     list_filter = ['is_published', 'created_at', 'published_at']
     search_fields = ['title', 'content', 'excerpt']
     prepopulated_fields = {'slug': ('title',)}
-    readonly_fields = ['created_at', 'updated_at', 'published_at']
+    readonly_fields = ['created_at', 'updated_at', 'published_at', 'image_status']
     list_editable = ['is_published']
 
     fieldsets = (
@@ -111,7 +169,7 @@ class BlogPostAdmin(admin.ModelAdmin):
             'fields': ('title', 'slug', 'author', 'excerpt', 'content')
         }),
         ('Изображение', {
-            'fields': ('image',)
+            'fields': ('image', 'image_status')
         }),
         ('Публикация', {
             'fields': ('is_published', 'published_at')
@@ -121,3 +179,25 @@ class BlogPostAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(ContactMessage)
+class ContactMessageAdmin(admin.ModelAdmin):
+    list_display = ['name', 'phone', 'subject', 'contact_type', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'contact_type', 'created_at']
+    search_fields = ['name', 'phone', 'email', 'company', 'subject']
+    readonly_fields = [
+        'contact_type', 'name', 'phone', 'email', 'company', 'subject', 'message', 'ip_address',
+        'status', 'attempts', 'next_attempt_at', 'last_error', 'created_at', 'sent_at',
+    ]
+    actions = ['retry_delivery']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Отправить в Telegram повторно')
+    def retry_delivery(self, request, queryset):
+        updated = queryset.exclude(status=ContactMessage.STATUS_SENT).update(
+            status=ContactMessage.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'Поставлено в очередь: {updated}')
@@ -0,0 +1,93 @@
+"""
+Async-версии страниц каталога и блога и API контактной формы.
+
+Подключаются вместо views.py, когда сайт запущен через ASGI (config/asgi.py включает ASYNC_VIEWS).
+Данные страницы загружаются async ORM; проверка формы — общая с views.py.
+Шаблоны могут обращаться к БД (ленивые связи, {% cache %}), поэтому рендерятся в синхронном потоке.
+
+Списков товаров категории и статей блога здесь нет: фильтры, счетчики (main/facets.py),
+keyset-пагинация и поиск синхронные, и async-обертка над ними только гоняла бы запрос
+через тот же единственный поток sync_to_async. Эти URL и под ASGI ведут на views.py (см. main/urls.py).
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import require_POST
+
+from . import cache as page_cache
+from . import conditional
+from .cache import cache_page_for_anonymous
+from .models import Product, ProductCategory, BlogPost, ContactMessage
+from .views import CONTACT_SUCCESS, contact_form_error, parse_contact_form
+
+logger = logging.getLogger(__name__)
+
+arender = sync_to_async(render)
+
+
+@cache_page_for_anonymous([page_cache.CATALOG, page_cache.BLOG])
+async def home(request):
+    """Главная страница"""
+    featured = Product.objects.filter(is_active=True, is_featured=True).with_main_image()[:8]
+    categories = ProductCategory.objects.filter(is_active=True).select_related('cover_image')
+    context = {
+        'featured_products': [product async for product in featured],
+        'categories': [category async for category in categories[:6]],
+        'latest_posts': [post async for post in BlogPost.objects.filter(is_published=True)[:3]],
+    }
+    return await arender(request, 'main/home.html', context)
+
+
+@cache_page_for_anonymous([page_cache.CATALOG])
+@conditional.conditional_page(conditional.catalog_state)
+async def catalog(request):
+    """Каталог - показываем категории"""
+    categories = ProductCategory.objects.filter(is_active=True).select_related('cover_image')
+    context = {
+        'categories': [category async for category in categories],
+    }
+    return await arender(request, 'main/catalog.html', context)
+
+
+@cache_page_for_anonymous([page_cache.CATALOG])
+@conditional.conditional_page(conditional.product_state)
+async def product_detail(request, slug):
+    """Детальная страница товара"""
+    product = await aget_object_or_404(
+        Product.objects.select_related('category').prefetch_related('images'),
+        slug=slug,
+        is_active=True
+    )
+    context = {
+        'product': product,
+        'related_products': await product.aget_similar(4),
+    }
+    return await arender(request, 'main/product_detail.html', context)
+
+
+@cache_page_for_anonymous([page_cache.BLOG])
+@conditional.conditional_page(conditional.post_state)
+async def blog_detail(request, slug):
+    """Детальная страница статьи"""
+    post = await aget_object_or_404(BlogPost, slug=slug, is_published=True)
+    context = {
+        'post': post,
+        'related_posts': await post.aget_related(3),
+    }
+    return await arender(request, 'main/blog_detail.html', context)
+
+
+@require_POST
+async def submit_contact_form(request):
+    """Обработка контактной формы: заявка сохраняется в очередь отправки в Telegram"""
+    try:
+        fields, error = parse_contact_form(request)
+        if error:
+            return error
+        await ContactMessage.objects.acreate(**fields)
+        return JsonResponse(CONTACT_SUCCESS)
+    except Exception as e:
+        logger.error('Ошибка отправки формы контактов: %s', e)
+        return contact_form_error('Ошибка отправки. Попробуйте позже.', status=500)
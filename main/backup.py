@@ -0,0 +1,429 @@
+"""
+Резервная копия каталога и блога вместо dumpdata в один JSON.
+
+Копия — папка:
+    manifest.json              — модели по порядку зависимостей, число строк, SHA-256 файлов
+    main.product.jsonl.gz      — по файлу на модель: строка = объект в формате сериализатора Django
+    media.jsonl.gz             — файлы изображений (оригинал и варианты) с размером и SHA-256
+    media/...                  — сами файлы, если копия снята с --with-media
+
+Снятие и восстановление идут потоком пачками по CHUNK_SIZE строк — память не зависит от размера
+каталога. Восстановление вставляет строки bulk_create (по pk: существующие строки обновляются),
+без save() и сигналов, поэтому изображения не перекодируются, а даты создания и изменения
+остаются как в копии. Можно восстановить отдельные модели или одну категорию с ее товарами и фото.
+"""
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import shutil
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+MEDIA_INDEX_NAME = 'media.jsonl.gz'
+MEDIA_DIR = 'media'
+
+CHUNK_SIZE = 1000
+COMPRESS_LEVEL = 6
+
+# Модели по умолчанию: без admin.logentry, сессий и пользователей
+DEFAULT_MODELS = (
+    'main.productcategory',
+    'main.product',
+    'main.productimage',
+    'main.blogpost',
+    'main.relatedpost',
+    'main.contactmessage',
+)
+
+# Модели, которые восстанавливаются с --category
+CATEGORY_MODELS = ('main.productcategory', 'main.product', 'main.productimage')
+
+
+class _Encoder(DjangoJSONEncoder):
+    """Даты с микросекундами: DjangoJSONEncoder обрезает их до миллисекунд, а updated_at входит в ключи кэша"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _chunks(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def get_models(labels):
+    """Модели по меткам app.model в порядке зависимостей (сначала те, на кого ссылаются)"""
+    try:
+        selected = [apps.get_model(label) for label in labels]
+    except (LookupError, ValueError) as e:
+        raise ValueError(f'Неизвестная модель: {e}')
+    return serializers.sort_dependencies([(None, selected)], allow_cycles=True)
+
+
+def file_sha256(fileobj):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(1 << 20), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _path_sha256(path):
+    with open(path, 'rb') as f:
+        return file_sha256(f)
+
+
+def media_files(obj):
+    """Имена файлов объекта в storage: поля FileField и варианты изображений (main/images.py)"""
+    from .images import VARIANT_FORMATS, variant_name
+
+    for field in obj._meta.concrete_fields:
+        if not isinstance(field, models.FileField):
+            continue
+        file = getattr(obj, field.attname)
+        if not file:
+            continue
+        yield file.storage, file.name
+        for width in getattr(obj, 'image_variants', None) or []:
+            for fmt in VARIANT_FORMATS:
+                yield file.storage, variant_name(file.name, width, fmt)
+
+
+class _HashingReader(io.RawIOBase):
+    """Считает SHA-256 сжатого файла, пока gzip его читает"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(len(buffer))
+        self.digest.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _write_manifest(target, manifest):
+    tmp = target / f'.{MANIFEST_NAME}.tmp'
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(target / MANIFEST_NAME)
+
+
+def read_manifest(source):
+    path = Path(source) / MANIFEST_NAME
+    try:
+        manifest = json.loads(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        raise ValueError(f'{path} не найден — это не папка резервной копии')
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f'Неподдерживаемая версия формата: {manifest.get("format")}')
+    return manifest
+
+
+# Снятие копии
+
+def backup(target, labels=DEFAULT_MODELS, with_media=False):
+    """Пишет копию в папку target; возвращает манифест"""
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'format': FORMAT_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'models': [],
+        'media': {'file': MEDIA_INDEX_NAME, 'count': 0, 'bytes': 0, 'missing': 0, 'included': with_media},
+    }
+    media_path = target / MEDIA_INDEX_NAME
+    with gzip.open(media_path, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL) as media_index:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Один снимок БД на все модели: строки не разойдутся, если каталог меняют во время копии
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            for model in get_models(labels):
+                entry = _backup_model(model, target, media_index, manifest['media'], with_media)
+                manifest['models'].append(entry)
+    manifest['media']['sha256'] = _path_sha256(media_path)
+    _write_manifest(target, manifest)
+    return manifest
+
+
+def _backup_model(model, target, media_index, media, with_media):
+    label = _label(model)
+    path = target / f'{label}.jsonl.gz'
+    count = 0
+    queryset = model._base_manager.order_by('pk')
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL) as f:
+        for chunk in _chunks(queryset.iterator(chunk_size=CHUNK_SIZE)):
+            for record in serializers.serialize('python', chunk):
+                f.write(json.dumps(record, cls=_Encoder, ensure_ascii=False) + '\n')
+            for obj in chunk:
+                for storage, name in media_files(obj):
+                    if not storage.exists(name):
+                        media['missing'] += 1
+                        continue
+                    with storage.open(name, 'rb') as file:
+                        digest = file_sha256(file)
+                    size = storage.size(name)
+                    media_index.write(json.dumps(
+                        {'model': label, 'pk': obj.pk, 'path': name, 'size': size, 'sha256': digest}
+                    ) + '\n')
+                    media['count'] += 1
+                    media['bytes'] += size
+                    if with_media:
+                        _copy_out(storage, name, target / MEDIA_DIR / name)
+            count += len(chunk)
+    return {'model': label, 'file': path.name, 'count': count, 'sha256': _path_sha256(path)}
+
+
+def _copy_out(storage, name, destination):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with storage.open(name, 'rb') as source, open(destination, 'wb') as f:
+        shutil.copyfileobj(source, f)
+
+
+# Восстановление
+
+class _Scope:
+    """
+    Какие строки копии восстанавливать: все или одна категория с товарами и их фото.
+    Для категории в памяти держатся только pk ее товаров и фото.
+    """
+
+    def __init__(self, category=None, category_pk=None):
+        self.category = category
+        self.category_pk = category_pk
+        self.pks = {'main.product': set(), 'main.productimage': set()}
+
+    def accepts(self, label, record):
+        if self.category is None:
+            return True
+        fields = record['fields']
+        if label == 'main.productcategory':
+            accepted = record['pk'] == self.category_pk
+        elif label == 'main.product':
+            accepted = fields['category'] == self.category_pk
+        elif label == 'main.productimage':
+            accepted = fields['product'] in self.pks['main.product']
+        else:
+            accepted = False
+        if accepted and label in self.pks:
+            self.pks[label].add(record['pk'])
+        return accepted
+
+    def existing(self, model):
+        """Строки БД, которые заменяет восстановление (для --replace)"""
+        queryset = model._base_manager.all()
+        if self.category is None:
+            return queryset
+        label = _label(model)
+        if label == 'main.productcategory':
+            return queryset.filter(pk=self.category_pk)
+        if label == 'main.product':
+            return queryset.filter(category_id=self.category_pk)
+        return queryset.filter(product__category_id=self.category_pk)
+
+    def accepts_media(self, record, labels):
+        if record['model'] not in labels:
+            return False
+        if self.category is None or record['model'] == 'main.productcategory':
+            return self.category is None or record['pk'] == self.category_pk
+        return record['pk'] in self.pks.get(record['model'], ())
+
+
+def _find_category(path, entry, slug):
+    for record in _read_records(path, entry['sha256']):
+        if record['fields']['slug'] == slug:
+            return record['pk']
+    raise ValueError(f'Категории {slug} нет в копии')
+
+
+@contextmanager
+def keep_timestamps(model):
+    """bulk_create вызывает pre_save: auto_now/auto_now_add перезаписали бы даты из копии"""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _read_records(path, expected_sha256):
+    """Строки файла модели; после последней сверяется SHA-256 файла"""
+    with open(path, 'rb') as raw:
+        reader = _HashingReader(raw)
+        with gzip.open(io.BufferedReader(reader), 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+        # Дочитываем хвост файла (после gzip-потока) для контрольной суммы
+        while reader.read(1 << 20):
+            pass
+    if reader.digest.hexdigest() != expected_sha256:
+        raise ValueError(f'{path.name}: контрольная сумма не совпадает')
+
+
+def _insert(model, objects, m2m):
+    pk_name = model._meta.pk.name
+    update_fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+    with keep_timestamps(model):
+        model._base_manager.bulk_create(
+            objects,
+            update_conflicts=bool(update_fields),
+            unique_fields=[pk_name],
+            update_fields=update_fields or None,
+        )
+    for field_name, rows in m2m.items():
+        through = model._meta.get_field(field_name).remote_field.through
+        source = model._meta.get_field(field_name).m2m_field_name()
+        through._base_manager.filter(**{f'{source}__in': [obj.pk for obj in objects]})._raw_delete(connection.alias)
+        through._base_manager.bulk_create(rows)
+
+
+def _restore_model(model, path, entry, scope, stats):
+    label = _label(model)
+    restored = 0
+    m2m_fields = [field.name for field in model._meta.many_to_many if field.remote_field.through._meta.auto_created]
+    for chunk in _chunks(_read_records(path, entry['sha256'])):
+        records = [record for record in chunk if scope.accepts(label, record)]
+        if not records:
+            continue
+        objects, m2m = [], {name: [] for name in m2m_fields}
+        for item in serializers.deserialize('python', records, ignorenonexistent=True):
+            objects.append(item.object)
+            for name in m2m_fields:
+                field = model._meta.get_field(name)
+                through = field.remote_field.through
+                for target_pk in item.m2m_data.get(name, []):
+                    m2m[name].append(through(**{
+                        f'{field.m2m_field_name()}_id': item.object.pk,
+                        f'{field.m2m_reverse_field_name()}_id': target_pk,
+                    }))
+        _insert(model, objects, m2m)
+        restored += len(objects)
+    stats['models'][label] = restored
+    return restored
+
+
+def restore(source, labels=None, category=None, replace=False):
+    """
+    Восстанавливает копию из папки source. labels — только эти модели, category — slug категории
+    (ее товары и фото). replace — сначала удалить строки этих моделей (в границах категории),
+    которых может не быть в копии. Возвращает статистику.
+    """
+    source = Path(source)
+    manifest = read_manifest(source)
+    entries = {entry['model']: entry for entry in manifest['models']}
+    labels = [label.lower() for label in (labels or entries)]
+    if category is not None:
+        labels = [label for label in labels if label in CATEGORY_MODELS]
+    missing = [label for label in labels + (['main.productcategory'] if category else []) if label not in entries]
+    if missing:
+        raise ValueError(f'В копии нет моделей: {", ".join(sorted(set(missing)))}')
+
+    scope = _Scope()
+    if category is not None:
+        entry = entries['main.productcategory']
+        scope = _Scope(category, _find_category(source / entry['file'], entry, category))
+    model_list = get_models(labels)
+    stats = {'models': {}, 'deleted': {}}
+    with transaction.atomic():
+        if replace:
+            # Сырой DELETE: без сигналов и загрузки объектов (связанные модели — раньше тех, на кого ссылаются)
+            for model in reversed(model_list):
+                stats['deleted'][_label(model)] = scope.existing(model)._raw_delete(connection.alias)
+        for model in model_list:
+            label = _label(model)
+            _restore_model(model, source / entries[label]['file'], entries[label], scope, stats)
+        _reset_sequences(model_list)
+    _after_restore(labels, scope, replace)
+    stats['media'] = restore_media(source, manifest, scope, set(labels))
+    return stats
+
+
+def _reset_sequences(model_list):
+    # PostgreSQL: после вставки с явными pk счетчик id должен продолжаться после максимального
+    sql = connection.ops.sequence_reset_sql(no_style(), model_list)
+    if sql:
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+
+
+def _after_restore(labels, scope, replace):
+    """Сброс кэшей и пересчет того, что при save() обновляют сигналы (main/signals.py)"""
+    from .signals import after_bulk_changes
+
+    categories = ()
+    if any(label in CATEGORY_MODELS for label in labels):
+        # Сводки категорий (main/category_stats.py) не входят в копию по смыслу: в ней могут не
+        # совпасть с восстановленными товарами, а обложка — ссылаться на невосстановленное фото
+        categories = None if scope.category is None else {scope.category_pk}
+    after_bulk_changes(
+        categories,
+        blog='main.blogpost' in labels,
+        # Списки из полной копии согласованы с ее товарами; после замены одной категории — нет
+        similar=scope.category is not None and replace,
+        # «Читайте также» без таблицы связей из копии строится заново
+        related='main.relatedpost' not in labels,
+    )
+
+
+def restore_media(source, manifest, scope, labels):
+    """
+    Сверяет файлы восстановленных строк с контрольными суммами копии.
+    Недостающие и измененные файлы копируются из media/ копии, если она снята с --with-media.
+    """
+    from django.core.files.storage import default_storage
+
+    stats = {'ok': 0, 'restored': 0, 'missing': [], 'mismatch': []}
+    index = source / manifest['media']['file']
+    media_dir = source / MEDIA_DIR
+    for record in _read_records(index, manifest['media']['sha256']):
+        if not scope.accepts_media(record, labels):
+            continue
+        name = record['path']
+        if default_storage.exists(name):
+            with default_storage.open(name, 'rb') as file:
+                if file_sha256(file) == record['sha256']:
+                    stats['ok'] += 1
+                    continue
+            problem = 'mismatch'
+        else:
+            problem = 'missing'
+        backup_file = media_dir / name
+        if backup_file.is_file() and _path_sha256(backup_file) == record['sha256']:
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            with open(backup_file, 'rb') as f:
+                default_storage.save(name, f)
+            stats['restored'] += 1
+        else:
+            stats[problem].append(name)
+    return stats
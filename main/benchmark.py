@@ -0,0 +1,384 @@
+"""
+Нагрузочный прогон страниц сайта (команда benchmark_urls).
+
+Для каждого адреса из main/urls.py и config/urls.py — сценарий с конкретным путем
+(slug берутся из базы: самая большая категория, товар и статья из нее, слово для поиска).
+Запросы идут в N потоков: в этом же процессе через тестовый клиент Django или
+на запущенный сервер (--base-url). Результат — JSON с p50/p95/p99, пропускной способностью
+и запросами к БД на запрос (из заголовка Server-Timing, main/instrumentation.py),
+чтобы сравнивать прогоны между коммитами (--compare). Удаленный сервер отдает Server-Timing
+адресу прогона, если он в INTERNAL_IPS сервера, или всем с SERVER_TIMING = True.
+"""
+import math
+import re
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import count
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Count
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+# Адреса, которые не нагружаем: админка, переключатель языка (редирект), файлы DEBUG
+SKIPPED_URLS = ('admin', 'set_language', 'static', 'media')
+
+CONTACT_NAME = 'Benchmark'
+CONTACT_SCENARIO = 'submit_contact'
+
+SERVER_TIMING_RE = {
+    'queries': re.compile(r'\bdb;[^,]*desc="(\d+) queries"'),
+    'db_ms': re.compile(r'\bdb;dur=([\d.]+)'),
+    'template_ms': re.compile(r'\btpl;dur=([\d.]+)'),
+}
+
+
+def url_names(patterns=None, namespace=None):
+    """Имена всех адресов проекта ('main:home', 'sitemap_file', ...) без админки"""
+    names = []
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.app_name == 'admin':
+                continue
+            inner = f'{namespace}:{pattern.namespace}' if namespace and pattern.namespace else (
+                pattern.namespace or namespace
+            )
+            names += url_names(pattern.url_patterns, inner)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.append(f'{namespace}:{pattern.name}' if namespace else pattern.name)
+    return list(dict.fromkeys(names))
+
+
+def contact_payload(i):
+    return {
+        'name': CONTACT_NAME,
+        'phone': '+998 90 123 45 67',
+        'email': 'benchmark@example.com',
+        'subject': f'Benchmark {i}',
+        'message': 'Нагрузочный тест',
+        'type': 'general',
+    }
+
+
+def scenarios(include_contact=False):
+    """
+    [{'name', 'url', 'method', 'path'}]: по нескольку на адреса с параметрами (сортировки, фильтры).
+    Отправка формы (include_contact) создает настоящие заявки в очереди Telegram — только по запросу.
+    """
+    from . import sitemap_files
+    from .models import BlogPost, Product, ProductCategory
+
+    def add(name, url, path, method='GET'):
+        items.append({'name': name, 'url': url, 'method': method, 'path': path})
+
+    items = []
+    add('home', 'main:home', reverse('main:home'))
+    add('catalog', 'main:catalog', reverse('main:catalog'))
+
+    category = (
+        ProductCategory.objects.filter(is_active=True)
+        .annotate(size=Count('products')).order_by('-size', 'id').first()
+    )
+    if category:
+        path = reverse('main:category_detail', kwargs={'slug': category.slug})
+        add('category', 'main:category_detail', path)
+        add('category_sort_price', 'main:category_detail', f'{path}?sort=price')
+        add('category_sort_name', 'main:category_detail', f'{path}?sort=-name')
+        add('category_filter', 'main:category_detail', f'{path}?material=cotton&sort=-price')
+        pages = math.ceil(category.size / 12)
+        if pages > 1:
+            add('category_last_page', 'main:category_detail', f'{path}?page={pages}')
+        product = Product.objects.filter(category=category, is_active=True).order_by('id').first()
+        if product:
+            add('product', 'main:product_detail', product.get_absolute_url())
+
+    add('blog_list', 'main:blog_list', reverse('main:blog_list'))
+    post = BlogPost.objects.filter(is_published=True).order_by('-published_at', 'id').first()
+    if post:
+        add('blog_detail', 'main:blog_detail', post.get_absolute_url())
+        word = next((w for w in re.findall(r'\w{4,}', post.content or post.title)), None)
+        if word:
+            add('blog_search', 'main:blog_list', f'{reverse("main:blog_list")}?q={word}')
+
+    add('about', 'main:about', reverse('main:about'))
+    add('contact', 'main:contact', reverse('main:contact'))
+    if include_contact:
+        add(CONTACT_SCENARIO, 'submit_contact', reverse('submit_contact'), method='POST')
+    add('sitemap_index', 'sitemap_file', reverse('sitemap_file', kwargs={'filename': 'sitemap.xml'}))
+    add('sitemap_products', 'sitemap_file', reverse(
+        'sitemap_file', kwargs={'filename': sitemap_files.shard_name('products', 1)}
+    ))
+    add('robots', 'robots', reverse('robots'))
+    add('service_worker', 'service_worker', reverse('service_worker'))
+    return items
+
+
+def percentile(sorted_values, p):
+    """Процентиль по ближайшему рангу"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def _ms(value):
+    return round(value * 1000, 2) if value is not None else None
+
+
+def parse_server_timing(header):
+    values = {}
+    for name, regex in SERVER_TIMING_RE.items():
+        match = regex.search(header or '')
+        if match:
+            values[name] = float(match.group(1))
+    return values
+
+
+def server_timing_for_all():
+    """
+    Server-Timing на все ответы на время прогона в этом процессе: адреса запросов
+    (X-Forwarded-For из _ip) не входят в INTERNAL_IPS
+    """
+    from django.test import override_settings
+
+    return override_settings(SERVER_TIMING=True)
+
+
+def site_host():
+    """Первый конкретный адрес из ALLOWED_HOSTS — Host запросов тестового клиента"""
+    return next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+
+
+def close_thread_connections():
+    # Соединения рабочих потоков; соединение основного потока остается команде
+    if threading.current_thread() is not threading.main_thread():
+        connections.close_all()
+
+
+class InProcessClient:
+    """Тестовый клиент Django; соединение с БД — свое у каждого потока"""
+
+    def __init__(self, cold):
+        from django.test import Client
+
+        self.client = Client(raise_request_exception=False, HTTP_HOST=site_host())
+        if cold:
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = 'benchmark'
+
+    def request(self, scenario, i):
+        extra = {'secure': True, 'HTTP_X_FORWARDED_FOR': _ip(i)}
+        if scenario['method'] == 'POST':
+            response = self.client.post(
+                scenario['path'], contact_payload(i), content_type='application/json', **extra
+            )
+        else:
+            response = self.client.get(scenario['path'], **extra)
+        return response.status_code, response.headers.get('Server-Timing')
+
+    def close(self):
+        close_thread_connections()
+
+
+class HttpClient:
+    """Запросы на запущенный сервер; keep-alive соединение на поток"""
+
+    def __init__(self, base_url, cold):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        # Сайт считает запрос HTTPS (X-Forwarded-Proto) — CSRF ждет Referer со схемой https
+        self.referer = re.sub(r'^http:', 'https:', self.base_url) + reverse('main:contact')
+        self.session = requests.Session()
+        self.session.headers['X-Forwarded-Proto'] = 'https'
+        if cold:
+            self.session.cookies.set(settings.SESSION_COOKIE_NAME, 'benchmark')
+        self.csrf_token = None
+
+    def request(self, scenario, i):
+        import requests
+
+        url = self.base_url + scenario['path']
+        headers = {'X-Forwarded-For': _ip(i)}
+        try:
+            if scenario['method'] == 'POST':
+                if self.csrf_token is None:
+                    self.session.get(self.base_url + reverse('main:contact'), timeout=30)
+                    self.csrf_token = self.session.cookies.get(settings.CSRF_COOKIE_NAME, '')
+                headers.update({'X-CSRFToken': self.csrf_token, 'Referer': self.referer})
+                response = self.session.post(url, json=contact_payload(i), headers=headers, timeout=30)
+            else:
+                response = self.session.get(url, headers=headers, timeout=30, allow_redirects=False)
+        except requests.exceptions.RequestException:
+            return None, None
+        return response.status_code, response.headers.get('Server-Timing')
+
+    def close(self):
+        self.session.close()
+
+
+def _ip(i):
+    # Свой адрес на каждый запрос, чтобы не упереться в RATE_LIMITS формы
+    return f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
+
+
+def run_scenario(scenario, make_client, requests_count, concurrency, warmup):
+    """Прогрев, затем requests_count запросов в concurrency потоков"""
+    # Прогрев в одном потоке: кэши, шаблоны, соединения
+    client = make_client()
+    try:
+        for i in range(warmup):
+            client.request(scenario, i)
+    finally:
+        client.close()
+
+    numbers = count(warmup)
+    end = warmup + requests_count
+    latencies, statuses, timings = [], {}, []
+    lock = threading.Lock()
+
+    def worker(_):
+        client = make_client()
+        local_latencies, local_statuses, local_timings = [], {}, []
+        try:
+            while True:
+                # next() у itertools.count атомарен под GIL — номера не повторяются
+                i = next(numbers)
+                if i >= end:
+                    break
+                started = time.perf_counter()
+                status, server_timing = client.request(scenario, i)
+                local_latencies.append(time.perf_counter() - started)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+                local_timings.append(parse_server_timing(server_timing))
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(local_latencies)
+            timings.extend(local_timings)
+            for status, n in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + n
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    queries = [t['queries'] for t in timings if 'queries' in t]
+    errors = sum(n for status, n in statuses.items() if status is None or status >= 400)
+    return {
+        'path': scenario['path'],
+        'method': scenario['method'],
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': {str(status): n for status, n in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': _ms(statistics.fmean(latencies)) if latencies else None,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'max_ms': _ms(latencies[-1]) if latencies else None,
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': int(max(queries)) if queries else None,
+        'db_ms_mean': _mean(timings, 'db_ms'),
+        'template_ms_mean': _mean(timings, 'template_ms'),
+    }
+
+
+def _mean(timings, key):
+    values = [t[key] for t in timings if key in t]
+    return round(statistics.fmean(values), 2) if values else None
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def dataset():
+    from .models import BlogPost, Product, ProductCategory, ProductImage
+
+    return {
+        'categories': ProductCategory.objects.count(),
+        'products': Product.objects.count(),
+        'images': ProductImage.objects.count(),
+        'posts': BlogPost.objects.count(),
+    }
+
+
+def run(selected=None, base_url=None, requests_count=200, concurrency=4, warmup=5, cold=False, on_result=None,
+        include_contact=False):
+    """Прогоняет сценарии (все или с именами из selected); возвращает отчет для JSON"""
+    from .models import ContactMessage
+
+    items = [s for s in scenarios(include_contact) if not selected or s['name'] in selected]
+    covered = {s['url'] for s in scenarios(include_contact=True)}
+    uncovered = [
+        name for name in url_names()
+        if name not in covered and name.split(':')[-1] not in SKIPPED_URLS
+    ]
+
+    if base_url:
+        def make_client():
+            return HttpClient(base_url, cold)
+    else:
+        def make_client():
+            return InProcessClient(cold)
+
+    started_at = timezone.now()
+    results = {}
+    try:
+        with nullcontext() if base_url else server_timing_for_all():
+            for scenario in items:
+                results[scenario['name']] = run_scenario(scenario, make_client, requests_count, concurrency, warmup)
+                if on_result:
+                    on_result(scenario['name'], results[scenario['name']])
+    finally:
+        # Заявки формы из прогона в очередь Telegram не нужны (заявки удаленного сервера — в его базе)
+        if include_contact and not base_url:
+            ContactMessage.objects.filter(name=CONTACT_NAME, created_at__gte=started_at).delete()
+
+    return {
+        'meta': {
+            'commit': _commit(),
+            'started_at': started_at.isoformat(),
+            'target': base_url or 'in-process',
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+            'cold': cold,
+            'include_contact': include_contact,
+            'concurrency': concurrency,
+            'requests': requests_count,
+            'warmup': warmup,
+            'dataset': dataset(),
+            'uncovered_urls': uncovered,
+        },
+        'results': results,
+    }
+
+
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries_mean')
+
+
+def compare(old, new):
+    """{сценарий: {метрика: [было, стало, изменение в %]}} для сценариев из обоих прогонов"""
+    diff = {}
+    for name, result in new['results'].items():
+        before = old.get('results', {}).get(name)
+        if not before:
+            continue
+        diff[name] = {}
+        for metric in COMPARED:
+            a, b = before.get(metric), result.get(metric)
+            change = round((b - a) / a * 100, 1) if a and b is not None else None
+            diff[name][metric] = [a, b, change]
+    return diff
@@ -0,0 +1,165 @@
+"""
+Кэш страниц для анонимных посетителей.
+
+Ключ страницы: хост, язык, путь, разрешенные GET-параметры и версии групп данных.
+При изменении моделей версия группы увеличивается (см. main/signals.py),
+и все страницы, зависящие от нее, перестают совпадать по ключу.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import instrumentation
+
+# Заголовки, которые хранятся вместе со страницей (валидаторы из main/conditional.py)
+STORED_HEADERS = ('ETag', 'Last-Modified')
+
+# Группы данных, от которых зависят страницы (Model.page_cache_group)
+CATALOG = 'catalog'
+BLOG = 'blog'
+
+STATS_KEYS = {
+    'hits': 'page_cache:hits',
+    'misses': 'page_cache:misses',
+}
+
+
+def _version_key(group):
+    return f'page_cache:version:{group}'
+
+
+def _new_version():
+    # Метка времени вместо 0: после вытеснения ключа версии старые страницы не «оживут»
+    return time.time_ns()
+
+
+def get_versions(groups):
+    keys = [_version_key(group) for group in groups]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*groups):
+    """Сбрасывает кэш всех страниц, зависящих от групп"""
+    for group in groups:
+        key = _version_key(group)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def _count(stat):
+    key = STATS_KEYS[stat]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    values = cache.get_many(STATS_KEYS.values())
+    return {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
+
+
+def _is_cacheable(request, params):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    # С сессией (например, админ) — всегда свежая страница
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return False
+    # Неизвестные параметры (utm и т.п.) попадают в canonical — такие страницы не кэшируем
+    return all(name in params for name in request.GET)
+
+
+def _page_key(request, groups, params):
+    query = '&'.join(f'{name}={",".join(request.GET.getlist(name))}' for name in params)
+    versions = '.'.join(str(v) for v in get_versions(groups))
+    raw = f'{request.get_host()}|{request.LANGUAGE_CODE}|{request.path}|{query}|{versions}'
+    return 'page_cache:page:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def _cached_response(request, groups, params):
+    """(ключ, ответ из кэша или None); ключ None — страницу кэшировать нельзя"""
+    if not _is_cacheable(request, params):
+        return None, None
+    key = _page_key(request, groups, params)
+    cached = cache.get(key)
+    instrumentation.record_cache('page', cached is not None)
+    if cached is None:
+        _count('misses')
+        return key, None
+    _count('hits')
+    content, content_type, headers = cached
+    response = HttpResponse(content, content_type=content_type, headers=headers)
+    response['X-Page-Cache'] = 'HIT'
+    if headers:
+        # Страница в кэше не новее данных (ключ включает версии групп) — ее валидаторы актуальны
+        response = get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+            response=response,
+        )
+    return key, response
+
+
+def _store_response(request, key, response):
+    # Не кэшируем ответы с cookie и страницы, где выдавался CSRF-токен
+    if (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    ):
+        headers = {name: response[name] for name in STORED_HEADERS if name in response}
+        cache.set(key, (response.content, response['Content-Type'], headers), settings.PAGE_CACHE_TIMEOUT)
+    response['X-Page-Cache'] = 'MISS'
+
+
+def cache_page_for_anonymous(groups, params=()):
+    """
+    Кэширует ответ view для анонимных GET-запросов.
+    groups — группы данных, от которых зависит страница; params — GET-параметры, влияющие на вывод.
+    Поддерживает и синхронные, и async view.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(_cached_response)(request, groups, params)
+                if response is not None:
+                    return response
+                response = await view(request, *args, **kwargs)
+                if key is not None:
+                    await sync_to_async(_store_response)(request, key, response)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, response = _cached_response(request, groups, params)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if key is not None:
+                _store_response(request, key, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,628 @@
+"""
+Массовый импорт каталога из CSV, JSON Lines или JSON-массива (команда import_catalog).
+
+Строки читаются потоком и обрабатываются пачками: каждая пачка — одна транзакция
+с bulk_create/bulk_update категорий, товаров и изображений, без save() и сигналов на строку.
+Товар ищется по slug, а если его нет в файле — по названию, размеру и цвету;
+повторный импорт того же файла обновляет товары, а не создает копии.
+Все slug загружаются одним запросом в начале, новые подбираются в памяти.
+
+Изображения перекодируются так же, как при загрузке в админке (main/models.py, main/images.py),
+но в пуле процессов до транзакции пачки; строки ProductImage сразу создаются готовыми.
+Если транзакция пачки не прошла, эти файлы удаляются из storage.
+Файл, уже прикрепленный к товару (тот же SHA-256), повторно не обрабатывается.
+
+После каждой пачки номер последней строки и затронутые категории пишутся в файл
+состояния — import_catalog --resume продолжает с него. Кэши и сводки категорий
+обновляются один раз в конце импорта, в том числе для пачек запуска, упавшего до конца.
+"""
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+BATCH_SIZE = 500
+UPDATE_BATCH_SIZE = 100
+
+# Поля товара, которые можно задать в файле
+PRODUCT_FIELDS = (
+    'name', 'slug', 'description', 'material', 'size', 'color', 'price', 'stock', 'is_active', 'is_featured',
+)
+IMAGES_SEPARATOR = '|'
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', 'ha'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет', "yo'q", 'yoq'}
+
+SLUG_MAX_LENGTH = 200
+
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+})
+
+
+def transliterate(text):
+    return text.lower().translate(TRANSLIT)
+
+
+def unique_slug(text, taken, fallback):
+    """Slug из text, которого нет в taken (множество всех занятых slug); добавляет его в taken"""
+    base = slugify(transliterate(text))[:SLUG_MAX_LENGTH - 10].strip('-') or fallback
+    slug, number = base, 2
+    while slug in taken:
+        slug = f'{base}-{number}'
+        number += 1
+    taken.add(slug)
+    return slug
+
+
+def product_key(name, size, color):
+    """Естественный ключ товара без slug: варианты одного товара отличаются размером и цветом"""
+    return tuple((value or '').strip().lower() for value in (name, size, color))
+
+
+# Чтение файла
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.DictReader(f, dialect=dialect)
+
+
+def _read_json_lines(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_json_array(path, chunk_size=1 << 16):
+    """Объекты JSON-массива по одному, без загрузки всего файла в память"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer, started = '', False
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            buffer += chunk
+            while True:
+                buffer = buffer.lstrip()
+                if not started:
+                    if not buffer:
+                        break
+                    if buffer[0] != '[':
+                        raise ValueError('Ожидался JSON-массив объектов')
+                    buffer, started = buffer[1:], True
+                    continue
+                buffer = buffer.lstrip(', \t\r\n')
+                if buffer.startswith(']') or not buffer:
+                    break
+                try:
+                    obj, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break  # объект еще не дочитан
+                yield obj
+                buffer = buffer[end:]
+        # Файл кончился: остаться должна только закрывающая скобка — иначе он битый или обрезан
+        if not started:
+            raise ValueError('Ожидался JSON-массив объектов')
+        if buffer.strip() != ']':
+            raise ValueError(f'некорректный JSON-массив около «{buffer.strip()[:40]}»')
+
+
+READERS = {
+    'csv': _read_csv,
+    'jsonl': _read_json_lines,
+    'json': _read_json_array,
+}
+
+
+def detect_format(path):
+    ext = Path(path).suffix.lower().lstrip('.')
+    return {'ndjson': 'jsonl', 'tsv': 'csv'}.get(ext, ext)
+
+
+def read_rows(path, fmt=None):
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        raise ValueError(f'Неизвестный формат {fmt!r}: поддерживаются {", ".join(READERS)}')
+    return READERS[fmt](path)
+
+
+# Разбор и проверка строки
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValidationError('Ожидается да/нет')
+
+
+def _parse_decimal(value):
+    try:
+        return Decimal(str(value).replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise ValidationError('Ожидается число')
+
+
+def _parse_int(value):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValidationError('Ожидается целое число')
+
+
+def _material(value):
+    """Код материала или его название на любом языке сайта"""
+    from .models import Product
+
+    text = str(value).strip().lower()
+    for code, label in Product.MATERIAL_CHOICES:
+        if text in (code, str(label).lower()):
+            return code
+    return text  # full_clean сообщит о неизвестном значении
+
+
+PARSERS = {
+    'price': _parse_decimal,
+    'stock': _parse_int,
+    'is_active': _parse_bool,
+    'is_featured': _parse_bool,
+    'material': _material,
+}
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value in ('', None) else value
+
+
+def parse_row(record):
+    """
+    Строка файла -> {'fields', 'category', 'category_slug', 'images'}; ValidationError при ошибке.
+    Пустая ячейка значит «не задано»: при обновлении товара поле не меняется.
+    """
+    from .models import Product
+
+    fields, errors = {}, {}
+    for name in PRODUCT_FIELDS:
+        value = _clean(record.get(name))
+        if value is None:
+            continue
+        try:
+            fields[name] = PARSERS[name](value) if name in PARSERS else value
+        except ValidationError as e:
+            errors[name] = e.messages
+    if 'name' not in fields:
+        errors['name'] = ['Обязательное поле']
+
+    category, category_slug = _clean(record.get('category')), _clean(record.get('category_slug'))
+    if category is None and category_slug is None:
+        errors['category'] = ['Укажите category или category_slug']
+    elif category_slug is not None:
+        try:
+            validate_slug(category_slug)
+        except ValidationError as e:
+            errors['category_slug'] = e.messages
+
+    images = record.get('images') or []
+    if isinstance(images, str):
+        images = [name.strip() for name in images.split(IMAGES_SEPARATOR)]
+    images = [name for name in images if name]
+
+    # Проверки полей модели (длина, choices, число знаков цены) без запросов к БД
+    product = Product(**fields)
+    exclude = [field.name for field in Product._meta.fields if field.name not in fields]
+    try:
+        product.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        for name, messages in e.message_dict.items():
+            errors.setdefault(name, messages)
+    if errors:
+        raise ValidationError(errors)
+    return {'fields': fields, 'category': category, 'category_slug': category_slug, 'images': images}
+
+
+# Изображения
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_image(path):
+    """
+    Перекодирование файла как в ProductImage.process_image_file.
+    Выполняется в процессе пула, к БД не обращается: (имя в storage, ширины вариантов, ошибка).
+    """
+    from .images import generate_variants
+    from .models import ProductImage, process_image
+
+    try:
+        with open(path, 'rb') as f:
+            full_path, content = process_image(
+                File(f, name=os.path.basename(path)),
+                ProductImage.image_upload_path,
+                quality=ProductImage.image_quality,
+                max_size=ProductImage.image_max_size,
+            )
+        image = ProductImage()
+        image.image.save(os.path.basename(full_path), content, save=False)
+        return image.image.name, generate_variants(image.image), None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def image_pool(workers):
+    """
+    Пул процессов для encode_image или None (workers=0 — в текущем процессе).
+    Процессы запускаются через spawn: форкнутый процесс унаследовал бы открытое соединение с БД.
+    """
+    if not workers:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def discard_images(images):
+    """Удаляет из storage перекодированные файлы и их варианты, если пачка не записалась"""
+    from .images import VARIANT_FORMATS, variant_name
+    from .models import ProductImage
+
+    storage = ProductImage._meta.get_field('image').storage
+    for image in images:
+        names = [image['name']] + [
+            variant_name(image['name'], width, fmt) for width in image['widths'] for fmt in VARIANT_FORMATS
+        ]
+        for name in names:
+            storage.delete(name)
+
+
+# Файл состояния для --resume
+
+def _signature(path):
+    stat = os.stat(path)
+    return {'source': str(Path(path).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_state(state_path, path, rows, categories=()):
+    """
+    Номер последней зафиксированной строки и затронутые категории: после сбоя
+    --resume сбросит кэши и пересчитает сводки и для пачек прошлого запуска
+    """
+    state_path = Path(state_path)
+    tmp = state_path.with_name(f'.{state_path.name}.tmp')
+    state = {**_signature(path), 'rows': rows, 'categories': sorted(categories)}
+    tmp.write_text(json.dumps(state), encoding='utf-8')
+    tmp.replace(state_path)
+
+
+def load_state(state_path, path):
+    """
+    (сколько строк уже импортировано, id затронутых категорий);
+    ValueError, если файл изменился после прошлого запуска
+    """
+    try:
+        state = json.loads(Path(state_path).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return 0, set()
+    rows = state.pop('rows')
+    categories = set(state.pop('categories', []))
+    if state != _signature(path):
+        raise ValueError(f'Файл {path} изменился после прошлого запуска, --resume невозможен')
+    return rows, categories
+
+
+class CatalogImporter:
+    """Импорт пачками; stats и timings — для отчета, errors — [(номер строки, сообщение)]"""
+
+    def __init__(self, images_dir, batch_size=BATCH_SIZE, pool=None, dry_run=False, similar=False,
+                 categories_touched=()):
+        from .models import Product, ProductCategory
+
+        self.images_dir = Path(images_dir)
+        self.batch_size = batch_size
+        self.pool = pool
+        self.dry_run = dry_run
+        self.similar = similar
+        self.stats = Counter()
+        self.timings = Counter()
+        self.errors = []
+        # Включая категории пачек, зафиксированных до сбоя (--resume)
+        self.categories_touched = set(categories_touched)
+
+        # Все slug и ключи товаров — один запрос вместо проверки уникальности на каждую строку
+        self.products, self.product_keys = {}, {}
+        for pk, slug, name, size, color, category_id in Product.objects.order_by('pk').values_list(
+            'pk', 'slug', 'name', 'size', 'color', 'category_id'
+        ):
+            self.products[slug] = (pk, category_id)
+            self.product_keys.setdefault(product_key(name, size, color), slug)
+        self.product_slugs = set(self.products)
+
+        self.categories, self.category_names = {}, {}
+        for pk, slug, name in ProductCategory.objects.order_by('pk').values_list('pk', 'slug', 'name'):
+            self.categories[slug] = pk
+            self.category_names.setdefault(name.strip().lower(), slug)
+        self.category_slugs = set(self.categories)
+        self.new_categories = {}
+
+    def run(self, rows, start=0, on_batch=None):
+        """
+        Импортирует строки, пропустив первые start (продолжение после сбоя).
+        on_batch(номер последней строки, затронутые категории) вызывается после фиксации каждой пачки.
+        """
+        started = time.perf_counter()
+        batch, size, last = [], 0, start
+        for number, record in enumerate(rows, 1):
+            if number <= start:
+                continue
+            last, size = number, size + 1
+            self.stats['rows'] += 1
+            try:
+                batch.append((number, parse_row(record)))
+            except ValidationError as e:
+                self._error(number, e)
+                self.stats['invalid'] += 1
+            if size == self.batch_size:
+                self._import_batch(batch, number, on_batch)
+                batch, size = [], 0
+        if size:
+            self._import_batch(batch, last, on_batch)
+        self.timings['total'] = time.perf_counter() - started
+
+    def _error(self, number, error):
+        if isinstance(error, ValidationError):
+            messages = error.message_dict if hasattr(error, 'error_dict') else {'': error.messages}
+            error = '; '.join(f'{field}: {"; ".join(text)}' if field else '; '.join(text)
+                              for field, text in messages.items())
+        self.errors.append((number, error))
+
+    def _import_batch(self, batch, last, on_batch):
+        rows = self._merge(batch)
+        jobs = self._image_jobs(rows)
+
+        started = time.perf_counter()
+        images = self._encode(jobs)
+        self.timings['images'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                self._write(rows, images)
+        except BaseException:
+            # Строки ProductImage откатились — файлы в storage больше ни на что не ссылаются
+            discard_images(images)
+            raise
+        self.timings['db'] += time.perf_counter() - started
+        if on_batch:
+            on_batch(last, self.categories_touched)
+
+    def _product_slug(self, fields):
+        key = product_key(fields['name'], fields.get('size'), fields.get('color'))
+        slug = fields.get('slug') or self.product_keys.get(key)
+        if slug is None:
+            text = '-'.join(fields[name] for name in ('name', 'size', 'color') if fields.get(name))
+            slug = unique_slug(text, self.product_slugs, 'product')
+        self.product_slugs.add(slug)
+        self.product_keys.setdefault(key, slug)
+        return slug
+
+    def _category_slug(self, row):
+        slug, name = row['category_slug'], row['category']
+        if slug in self.categories or slug in self.new_categories:
+            return slug
+        if slug is None and name.lower() in self.category_names:
+            return self.category_names[name.lower()]
+        if name is None:
+            return None
+        # Новая категория создается в транзакции пачки
+        if slug is None:
+            slug = unique_slug(name, self.category_slugs, 'category')
+        self.category_slugs.add(slug)
+        self.new_categories[slug] = name
+        self.category_names.setdefault(name.lower(), slug)
+        return slug
+
+    def _merge(self, batch):
+        """{slug: строка}; повторы товара в пачке сливаются, последнее значение поля побеждает"""
+        rows = {}
+        for number, row in batch:
+            category = self._category_slug(row)
+            if category is None:
+                self._error(number, f'category_slug: категория {row["category_slug"]} не найдена')
+                self.stats['invalid'] += 1
+                continue
+            slug = self._product_slug(row['fields'])
+            if slug in rows:
+                rows[slug]['fields'].update(row['fields'])
+                rows[slug]['images'] += row['images']
+                rows[slug]['category'] = category
+            else:
+                rows[slug] = dict(row, number=number, category=category)
+        return rows
+
+    def _image_jobs(self, rows):
+        """Файлы для обработки; уже прикрепленные к товару (по хэшу) пропускаются"""
+        from .models import ProductImage
+
+        product_ids = [self.products[slug][0] for slug, row in rows.items() if row['images'] and slug in self.products]
+        attached = {}
+        for product_id, image_hash in ProductImage.objects.filter(product_id__in=product_ids).values_list(
+            'product_id', 'image_hash'
+        ):
+            attached.setdefault(product_id, set()).add(image_hash)
+
+        jobs = []
+        for slug, row in rows.items():
+            hashes = attached.get(self.products.get(slug, (None,))[0], set())
+            for name in row['images']:
+                path = self.images_dir / name
+                if not path.is_file():
+                    self._error(row['number'], f'images: файл {name} не найден')
+                    self.stats['images_failed'] += 1
+                    continue
+                digest = file_sha256(path)
+                if digest in hashes:
+                    self.stats['images_skipped'] += 1
+                    continue
+                hashes.add(digest)
+                jobs.append({'slug': slug, 'number': row['number'], 'path': path, 'hash': digest})
+        return jobs
+
+    def _encode(self, jobs):
+        if self.dry_run:
+            self.stats['images'] += len(jobs)
+            return []
+        paths = [str(job['path']) for job in jobs]
+        results = self.pool.map(encode_image, paths) if self.pool else map(encode_image, paths)
+        images = []
+        for job, (name, widths, error) in zip(jobs, results):
+            if error:
+                self._error(job['number'], f'images: {job["path"].name}: {error}')
+                self.stats['images_failed'] += 1
+            else:
+                images.append(dict(job, name=name, widths=widths))
+        return images
+
+    def _write(self, rows, images):
+        from .models import Product, ProductCategory
+
+        if self.new_categories:
+            created = ProductCategory.objects.bulk_create(
+                ProductCategory(name=name, slug=slug) for slug, name in self.new_categories.items()
+            )
+            self.categories.update((category.slug, category.pk) for category in created)
+            self.stats['categories_created'] += len(created)
+            self.new_categories = {}
+
+        # Текущие значения обновляемых товаров — одним запросом: неизмененные строки не трогаем,
+        # чтобы не сбрасывать кэш карточек и ETag страниц без причины
+        update_ids = [self.products[slug][0] for slug in rows if slug in self.products]
+        current = {
+            values['pk']: values
+            for values in Product.objects.filter(pk__in=update_ids).values('pk', 'category_id', *PRODUCT_FIELDS)
+        }
+
+        # bulk_update не ставит auto_now — updated_at задаем сами (от него зависят кэши карточек)
+        now = timezone.now()
+        creates, updates = [], {}
+        for slug, row in rows.items():
+            fields = dict(row['fields'], slug=slug, category_id=self.categories[row['category']])
+            if slug not in self.products:
+                creates.append(Product(**fields))
+                self.categories_touched.add(fields['category_id'])
+                continue
+            pk, category_id = self.products[slug]
+            if all(current[pk][name] == value for name, value in fields.items()):
+                self.stats['unchanged'] += 1
+                continue
+            self.categories_touched.update((category_id, fields['category_id']))
+            self.products[slug] = (pk, fields['category_id'])
+            updates.setdefault(tuple(sorted(fields)), []).append(Product(pk=pk, updated_at=now, **fields))
+
+        for product in Product.objects.bulk_create(creates):
+            self.products[product.slug] = (product.pk, product.category_id)
+        for names, products in updates.items():
+            # CASE WHEN на всю пачку растет квадратично — обновляем частями
+            Product.objects.bulk_update(products, [*names, 'updated_at'], batch_size=UPDATE_BATCH_SIZE)
+        self.stats['created'] += len(creates)
+        self.stats['updated'] += sum(len(products) for products in updates.values())
+
+        if images:
+            self._attach(images)
+
+    def _attach(self, images):
+        """Готовые строки ProductImage; главным становится первое фото товара без главного"""
+        from .models import Product, ProductImage
+
+        product_ids = {self.products[image['slug']][0] for image in images}
+        state = {pk: [False, 0] for pk in product_ids}
+        for product_id, is_main in ProductImage.objects.filter(product_id__in=product_ids).values_list(
+            'product_id', 'is_main'
+        ):
+            state[product_id][0] |= is_main
+            state[product_id][1] += 1
+
+        objs = []
+        for image in images:
+            product_id, category_id = self.products[image['slug']]
+            # Новое фото может стать обложкой категории
+            self.categories_touched.add(category_id)
+            has_main, count = state[product_id]
+            objs.append(ProductImage(
+                product_id=product_id,
+                image=image['name'],
+                image_hash=image['hash'],
+                image_variants=image['widths'],
+                image_status=ProductImage.IMAGE_READY,
+                is_main=not has_main,
+                order=count,
+            ))
+            state[product_id] = [True, count + 1]
+        ProductImage.objects.bulk_create(objs)
+        # Новое фото сбрасывает кэш карточки (как сигнал touch_product)
+        Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+        self.stats['images'] += len(objs)
+
+    def finish(self):
+        """То, что при save() делают сигналы (main/signals.py), — один раз на весь импорт"""
+        from .signals import after_bulk_changes
+
+        if self.dry_run or not self.categories_touched:
+            return
+        started = time.perf_counter()
+        # Похожие товары — только с --similar, иначе позже командой build_similar_products
+        after_bulk_changes(self.categories_touched, similar=self.similar)
+        self.timings['finish'] = time.perf_counter() - started
+
+    def report(self):
+        total = self.timings['total'] or 1e-9
+        images_time = self.timings['images']
+        return {
+            'dry_run': self.dry_run,
+            'rows': self.stats['rows'],
+            'invalid': self.stats['invalid'],
+            'created': self.stats['created'],
+            'updated': self.stats['updated'],
+            'unchanged': self.stats['unchanged'],
+            'categories_created': self.stats['categories_created'],
+            'images': self.stats['images'],
+            'images_skipped': self.stats['images_skipped'],
+            'images_failed': self.stats['images_failed'],
+            'seconds': {name: round(value, 3) for name, value in self.timings.items()},
+            'rows_per_second': round(self.stats['rows'] / total, 1),
+            'images_per_second': (
+                round(self.stats['images'] / images_time, 2) if self.stats['images'] and not self.dry_run else None
+            ),
+        }
@@ -0,0 +1,119 @@
+"""
+Хранимые сводки категорий: число активных товаров, в наличии, диапазон цен и обложка
+(главное фото нового рекомендуемого, иначе нового активного товара).
+
+Пересчитываются в той же транзакции, что и изменение товара или фото (main/signals.py):
+строки категорий блокируются (select_for_update), затем один агрегатный запрос.
+updated_at категории меняется, только если сводка изменилась, — от него зависят ETag
+каталога (main/conditional.py) и кэш карточек. Массовые изменения (импорт, генерация,
+восстановление копии, правки в админке) пересчитывают затронутые категории один раз:
+внутри deferred() сигналы только копят id. Полный пересчет — команда rebuild_category_stats.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+FIELDS = ('active_product_count', 'in_stock_count', 'min_price', 'max_price', 'cover_image_id')
+
+# Множество id категорий внутри deferred() или None
+_pending = ContextVar('category_stats_pending', default=None)
+
+
+def _cover_subquery():
+    from .models import ProductImage
+
+    return Subquery(
+        ProductImage.objects.filter(product__category=OuterRef('pk'), product__is_active=True)
+        .order_by('-product__is_featured', '-product__created_at', '-product_id', '-is_main', 'order')
+        .values('pk')[:1]
+    )
+
+
+def compute(category_ids=None):
+    """{id категории: {поле: значение}} — все категории или только category_ids"""
+    from .models import Product, ProductCategory
+
+    categories = ProductCategory.objects.order_by()
+    products = Product.objects.filter(is_active=True).order_by()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+        products = products.filter(category_id__in=category_ids)
+
+    stats = {
+        pk: {'active_product_count': 0, 'in_stock_count': 0, 'min_price': None, 'max_price': None,
+             'cover_image_id': cover}
+        for pk, cover in categories.annotate(cover=_cover_subquery()).values_list('pk', 'cover')
+    }
+    for row in products.values('category_id').annotate(
+        active_product_count=Count('pk'),
+        in_stock_count=Count('pk', filter=Q(stock__gt=0)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    ):
+        if row['category_id'] in stats:
+            stats[row.pop('category_id')].update(row)
+    return stats
+
+
+def refresh(category_ids=None):
+    """Пересчитывает сводки (все категории или category_ids); возвращает число измененных"""
+    from .models import ProductCategory
+
+    if category_ids is not None:
+        category_ids = {pk for pk in category_ids if pk is not None}
+        if not category_ids:
+            return 0
+        pending = _pending.get()
+        if pending is not None:
+            pending.update(category_ids)
+            return 0
+
+    with transaction.atomic():
+        # Параллельная транзакция ждет здесь и затем считает уже с нашими товарами
+        locked = ProductCategory.objects.select_for_update().order_by('pk')
+        if category_ids is not None:
+            locked = locked.filter(pk__in=category_ids)
+        current = {category.pk: category for category in locked.only(*FIELDS)}
+        stats = compute(current.keys() if category_ids is not None else None)
+
+        now = timezone.now()
+        changed = []
+        for pk, values in stats.items():
+            category = current.get(pk)
+            if category is None or all(getattr(category, name) == value for name, value in values.items()):
+                continue
+            for name, value in values.items():
+                setattr(category, name, value)
+            category.updated_at = now
+            changed.append(category)
+        ProductCategory.objects.bulk_update(changed, [*FIELDS, 'updated_at'], batch_size=500)
+    return len(changed)
+
+
+def refresh_for_products(product_ids):
+    from .models import Product
+
+    refresh(Product.objects.filter(pk__in=product_ids).values_list('category_id', flat=True).distinct())
+
+
+@contextmanager
+def deferred():
+    """
+    Внутри блока сигналы копят категории, пересчет — один раз в конце.
+    Вызывать внутри транзакции изменений, чтобы сводки остались атомарными с ними.
+    """
+    if _pending.get() is not None:
+        # Вложенный блок: пересчитает внешний
+        yield
+        return
+    pending = set()
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    if pending:
+        refresh(pending)
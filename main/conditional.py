@@ -0,0 +1,166 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304) для страниц каталога и блога.
+
+До вызова view одним агрегатным запросом считается состояние объектов, от которых зависит
+страница: max(updated_at), число связанных строк (чтобы заметить удаление) и т.п.
+ETag — хэш этого состояния, языка страницы и версии статики (манифест collectstatic),
+поэтому разные языки одной страницы и страницы до/после деплоя статики не путаются.
+Last-Modified отдается, только если состояние целиком из дат: удаление строки или новый
+список похожих товаров меняют лишь число или id, а не дату, и по If-Modified-Since клиент
+получил бы устаревшую страницу. Такие страницы проверяются только по ETag (If-None-Match).
+Если объект не найден, решает сам view (404).
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connection
+from django.db.models import Count, DateTimeField, IntegerField, Max, TextField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def _validators(request, state):
+    """(ETag, Last-Modified в секундах или None) по состоянию страницы или (None, None)"""
+    dates = [value for value in state.values() if isinstance(value, datetime)]
+    if not dates:
+        # Объекта нет (view ответит 404) или страница пустая
+        return None, None
+    raw = '|'.join([
+        request.LANGUAGE_CODE,
+        getattr(staticfiles_storage, 'manifest_hash', ''),
+        *(f'{key}={state[key]}' for key in sorted(state)),
+    ])
+    etag = f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+    if len(dates) < len(state):
+        # Число, список id или пустая дата: их изменение не двигает max(updated_at)
+        return etag, None
+    return etag, int(max(dates).timestamp())
+
+
+def _check(request, state_func, args, kwargs):
+    """(ответ 304/412 или None, ETag, Last-Modified)"""
+    # Вошедшие пользователи (админ) видят страницу иначе — как и кэш страниц, их не трогаем
+    if request.method not in ('GET', 'HEAD') or settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None, None, None
+    etag, last_modified = _validators(request, state_func(request, *args, **kwargs))
+    if etag is None:
+        return None, None, None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified), etag, last_modified
+
+
+def _set_validators(response, etag, last_modified):
+    if etag is not None and response.status_code == 200:
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+
+
+def conditional_page(state_func):
+    """
+    Отвечает 304, если страница не менялась. state_func(request, *args, **kwargs) -> dict
+    значений одного агрегатного запроса. Ставится под @cache_page_for_anonymous: кэш страниц
+    хранит ETag вместе со страницей и сам отвечает 304 без запросов к БД, а этот запрос
+    выполняется только при промахе кэша. Поддерживает и синхронные, и async view.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response, etag, last_modified = await sync_to_async(_check)(request, state_func, args, kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    _set_validators(response, etag, last_modified)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response, etag, last_modified = _check(request, state_func, args, kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def catalog_state(request):
+    from .models import ProductCategory
+
+    return ProductCategory.objects.filter(is_active=True).aggregate(
+        updated=Max('updated_at'),
+        total=Count('id'),
+    )
+
+
+def category_state(request, slug):
+    # Фото товара обновляет его updated_at (main/signals.py), поэтому отдельно их не считаем
+    from .models import ProductCategory
+
+    return ProductCategory.objects.filter(slug=slug, is_active=True).aggregate(
+        category_updated=Max('updated_at'),
+        products_updated=Max('products__updated_at'),
+        products_count=Count('products'),
+    )
+
+
+# max(updated_at) и число существующих товаров из similar_ids текущего товара
+SIMILAR_SQL = {
+    'sqlite': (
+        'SELECT {aggregate} FROM {table} s, json_each({table}.similar_ids) j WHERE s.id = j.value'
+    ),
+    'postgresql': (
+        'SELECT {aggregate} FROM {table} s '
+        'WHERE s.id IN (SELECT jsonb_array_elements_text({table}.similar_ids)::bigint)'
+    ),
+}
+# Прочие СУБД: зависимость от всех товаров — грубее, но без устаревших ответов
+SIMILAR_FALLBACK_SQL = 'SELECT {aggregate} FROM {table} s'
+
+
+def _similar(aggregate, output_field):
+    from .models import Product
+
+    sql = SIMILAR_SQL.get(connection.vendor, SIMILAR_FALLBACK_SQL)
+    return RawSQL(f'({sql})'.format(aggregate=aggregate, table=Product._meta.db_table), [], output_field)
+
+
+def product_state(request, slug):
+    from .models import Product
+
+    return Product.objects.filter(slug=slug, is_active=True).annotate(
+        similar_updated_at=_similar('MAX(s.updated_at)', DateTimeField()),
+        similar_existing=_similar('COUNT(s.id)', IntegerField()),
+    ).aggregate(
+        product_updated=Max('updated_at'),
+        category_updated=Max('category__updated_at'),
+        similar_list=Max(Cast('similar_ids', TextField())),
+        similar_updated=Max('similar_updated_at'),
+        similar_count=Max('similar_existing'),
+    )
+
+
+def blog_state(request):
+    from .models import BlogPost
+
+    return BlogPost.objects.filter(is_published=True).aggregate(
+        updated=Max('updated_at'),
+        total=Count('id'),
+    )
+
+
+def post_state(request, slug):
+    # Список «Читайте также» пересоздается целиком (main/related_posts.py) — id строк растут
+    from .models import BlogPost
+
+    return BlogPost.objects.filter(slug=slug, is_published=True).aggregate(
+        post_updated=Max('updated_at'),
+        related_updated=Max('related_links__related__updated_at'),
+        related_rows=Max('related_links__id'),
+    )
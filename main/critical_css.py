@@ -0,0 +1,302 @@
+"""
+Критический CSS страниц.
+
+Правила, нужные для первого экрана, встраиваются в <style> ({% critical_css %} в base.html),
+а полные таблицы стилей подключаются тегом {% stylesheet %} без блокировки отрисовки.
+Если для страницы критического CSS нет, {% stylesheet %} выводит обычный блокирующий <link>.
+
+Сборка — python manage.py build_critical_css (после collectstatic). Каждая страница из PAGES
+рендерится, из HTML берутся элементы первого экрана (body до конца первых секций <main>)
+и таблицы стилей из <link>, а из CSS остаются правила, селекторы которых могут совпасть
+с этими элементами. Браузера при сборке нет, поэтому совпадение проверяется по тегам,
+классам, id и атрибутам каждой части селектора — с запасом: комбинаторы не учитываются.
+"""
+import gzip
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import rcssmin
+import requests
+import tinycss2
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.test import Client
+from django.urls import reverse
+
+# url_name страницы -> сколько секций <main> считать первым экраном
+PAGES = {
+    'home': 1,
+    'catalog': 2,
+    'category_detail': 2,
+    'product_detail': 2,
+    'blog_list': 2,
+    'blog_detail': 2,
+    'about': 1,
+    'contact': 1,
+}
+
+# Атрибуты, которые ставит скрипт в <head> до первой отрисовки (тема, размер шрифта)
+DYNAMIC_ATTRIBUTES = {'data-theme', 'data-font-size'}
+
+# Состояния, которых не бывает при первой отрисовке
+INTERACTIVE_PSEUDO_RE = re.compile(r':(?:hover|focus|focus-visible|focus-within|active|visited)\b')
+PSEUDO_RE = re.compile(r'::?[\w-]+(?:\((?:[^()]|\([^()]*\))*\))?')
+ATTRIBUTE_RE = re.compile(r'\[\s*([\w-]+)[^\]]*\]')
+COMBINATOR_RE = re.compile(r'\s*[>+~]\s*|\s+')
+TAG_RE = re.compile(r'^(\*|[a-zA-Z][\w-]*)')
+CLASS_RE = re.compile(r'\.([\w-]+)')
+ID_RE = re.compile(r'#([\w-]+)')
+URL_RE = re.compile(r'url\(\s*([\'"]?)(?!data:|[a-z]+://|//|#)([^\'")]+)\1\s*\)', re.IGNORECASE)
+KEYFRAMES = ('keyframes', '-webkit-keyframes')
+BLOCK_AT_RULES = ('media', 'supports')
+
+USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/130.0 Safari/537.36'
+)
+
+# Профиль «Fast 3G» из Chrome DevTools: 1.6 Мбит/с (90% полезных), RTT 562.5 мс
+NETWORK_3G_RTT = 0.5625
+NETWORK_3G_BYTES_PER_SECOND = 1.6e6 * 0.9 / 8
+
+
+class PageParser(HTMLParser):
+    """Таблицы стилей страницы и теги, классы, id и атрибуты элементов первого экрана"""
+
+    def __init__(self, fold_sections):
+        super().__init__()
+        self.fold_sections = fold_sections
+        self.stylesheets = []
+        self.tags, self.classes, self.ids = set(), set(), set()
+        self.attributes = set(DYNAMIC_ATTRIBUTES)
+        self.in_body = self.in_main = self.folded = False
+        self.section_depth = self.sections = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        rel = (attrs.get('rel') or '').lower().split()
+        if tag == 'link' and ('stylesheet' in rel or ('preload' in rel and attrs.get('as') == 'style')):
+            if attrs.get('href') not in self.stylesheets:
+                self.stylesheets.append(attrs['href'])
+        if tag == 'body':
+            self.in_body = True
+        if tag == 'main':
+            self.in_main = True
+        if tag == 'section' and self.in_main:
+            self.section_depth += 1
+            if self.section_depth == 1:
+                self.sections += 1
+        if tag == 'html' or (self.in_body and not self.folded):
+            self.tags.add(tag)
+            self.classes.update((attrs.get('class') or '').split())
+            if attrs.get('id'):
+                self.ids.add(attrs['id'])
+            self.attributes.update(attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'section' and self.in_main:
+            self.section_depth -= 1
+            if self.section_depth == 0 and self.sections >= self.fold_sections:
+                self.folded = True
+        if tag == 'main':
+            self.folded = True
+
+    def matches(self, selector):
+        """Может ли селектор совпасть с элементами первого экрана"""
+        if INTERACTIVE_PSEUDO_RE.search(selector):
+            return False
+        selector = selector.replace(':root', 'html')
+        attributes = set(ATTRIBUTE_RE.findall(selector))
+        if not attributes <= self.attributes:
+            return False
+        selector = PSEUDO_RE.sub('', ATTRIBUTE_RE.sub('', selector))
+        compounds = [part for part in COMBINATOR_RE.split(selector.strip()) if part]
+        if not compounds:
+            # Селектор только из атрибутов или псевдоэлементов (::selection) — на первую отрисовку не влияет
+            return bool(attributes)
+        for compound in compounds:
+            tag = TAG_RE.match(compound)
+            if tag and tag.group(1) != '*' and tag.group(1).lower() not in self.tags:
+                return False
+            if not set(CLASS_RE.findall(compound)) <= self.classes:
+                return False
+            if not set(ID_RE.findall(compound)) <= self.ids:
+                return False
+        return True
+
+
+def _split_selectors(prelude):
+    """'a, b:is(c, d)' -> ['a', 'b:is(c, d)'] (запятые внутри скобок не делят список)"""
+    selectors, depth, current = [], 0, ''
+    for char in prelude:
+        depth += (char == '(') - (char == ')')
+        if char == ',' and depth == 0:
+            selectors.append(current.strip())
+            current = ''
+        else:
+            current += char
+    selectors.append(current.strip())
+    return [selector for selector in selectors if selector]
+
+
+def _parse(css):
+    return tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True)
+
+
+def _filter(rules, page, extras):
+    """Оставляет правила для первого экрана; @font-face и @keyframes откладывает в extras"""
+    kept = []
+    for rule in rules:
+        if rule.type == 'qualified-rule':
+            selectors = [s for s in _split_selectors(tinycss2.serialize(rule.prelude)) if page.matches(s)]
+            if selectors:
+                kept.append(f'{",".join(selectors)}{{{tinycss2.serialize(rule.content)}}}')
+        elif rule.type == 'at-rule' and rule.content is not None:
+            name = rule.lower_at_keyword
+            if name in BLOCK_AT_RULES:
+                inner = _filter(_parse(tinycss2.serialize(rule.content)), page, extras)
+                if inner:
+                    kept.append(f'@{name}{tinycss2.serialize(rule.prelude)}{{{"".join(inner)}}}')
+            elif name == 'font-face' or name in KEYFRAMES:
+                extras.append(rule)
+    return kept
+
+
+def _font_family(rule):
+    match = re.search(r'font-family\s*:\s*([^;]+)', tinycss2.serialize(rule.content))
+    return match.group(1).strip().strip('\'"') if match else None
+
+
+def extract(stylesheets, page):
+    """Критический CSS из [(url, css), ...] для элементов первого экрана page"""
+    kept, extras = [], []
+    for url, css in stylesheets:
+        # Относительные url() в <style> считались бы от адреса страницы
+        css = URL_RE.sub(lambda m: f'url({m.group(1)}{urljoin(url, m.group(2))}{m.group(1)})', css)
+        kept.extend(_filter(_parse(css), page, extras))
+
+    text = ''.join(kept)
+    for rule in extras:
+        if rule.lower_at_keyword in KEYFRAMES:
+            name = tinycss2.serialize(rule.prelude).strip()
+            needed = re.search(rf'animation[\w-]*:[^;}}]*\b{re.escape(name)}\b', text)
+            body = f'@{rule.lower_at_keyword} {name}{{{tinycss2.serialize(rule.content)}}}'
+        else:
+            family = _font_family(rule)
+            needed = family and family in text
+            body = f'@font-face{{{tinycss2.serialize(rule.content)}}}'
+        if needed:
+            kept.append(body)
+    return rcssmin.cssmin(''.join(kept))
+
+
+def fetch_stylesheet(url):
+    """Текст таблицы стилей по URL из страницы: своя статика — с диска, сторонняя — по сети"""
+    if url.startswith(settings.STATIC_URL):
+        name = url[len(settings.STATIC_URL):].split('?')[0]
+        if staticfiles_storage.exists(name):
+            with staticfiles_storage.open(name) as f:
+                return f.read().decode('utf-8')
+        path = finders.find(name)
+        if path is None:
+            raise FileNotFoundError(name)
+        return Path(path).read_text(encoding='utf-8')
+    absolute = urljoin('https://', url)
+    response = requests.get(absolute, headers={'User-Agent': USER_AGENT}, timeout=15)
+    response.raise_for_status()
+    return response.text
+
+
+def _root():
+    return Path(settings.CRITICAL_CSS_ROOT)
+
+
+def page_urls():
+    """{url_name: URL образца страницы} — для страниц с объектами берется первый активный"""
+    from .models import BlogPost, Product, ProductCategory
+
+    urls = {}
+    samples = {
+        'category_detail': ProductCategory.objects.filter(is_active=True).first(),
+        'product_detail': Product.objects.filter(is_active=True).first(),
+        'blog_detail': BlogPost.objects.filter(is_published=True).first(),
+    }
+    for name in PAGES:
+        if name in samples:
+            if samples[name] is not None:
+                urls[name] = reverse(f'main:{name}', kwargs={'slug': samples[name].slug})
+        else:
+            urls[name] = reverse(f'main:{name}')
+    return urls
+
+
+def render_page(url):
+    # Cookie сессии — мимо кэша страниц (в кэше мог остаться HTML со ссылками до collectstatic)
+    client = Client(SERVER_NAME=Site.objects.get_current().domain)
+    client.cookies[settings.SESSION_COOKIE_NAME] = 'critical-css'
+    response = client.get(url, secure=True)
+    if response.status_code != 200:
+        raise ValueError(f'{url}: HTTP {response.status_code}')
+    return response.content.decode('utf-8')
+
+
+def blocking_time(sizes):
+    """
+    Оценка задержки отрисовки на 3G из-за блокирующих таблиц стилей: {url: байт gzip}.
+    Сторонние домены — DNS + TCP + TLS (3 RTT, параллельно), затем запрос и загрузка.
+    """
+    if not sizes:
+        return 0.0
+    third_party = any(urlsplit(url).netloc for url in sizes)
+    setup = 3 * NETWORK_3G_RTT if third_party else 0.0
+    return setup + NETWORK_3G_RTT + sum(sizes.values()) / NETWORK_3G_BYTES_PER_SECOND
+
+
+def build_page(name, url, fetch=fetch_stylesheet):
+    """Собирает критический CSS страницы; возвращает отчет для команды"""
+    page = PageParser(PAGES[name])
+    page.feed(render_page(url))
+    stylesheets = [(href, fetch(href)) for href in page.stylesheets]
+    css = extract(stylesheets, page)
+
+    root = _root()
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / f'.{name}.css.tmp'
+    tmp.write_text(css, encoding='utf-8')
+    tmp.replace(root / f'{name}.css')
+
+    blocking = {href: len(gzip.compress(text.encode())) for href, text in stylesheets}
+    inline = len(gzip.compress(css.encode()))
+    return {
+        'page': name,
+        'url': url,
+        'inline_bytes': len(css.encode()),
+        'inline_gzip': inline,
+        'blocking_gzip': sum(blocking.values()),
+        'blocking_3g_before': round(blocking_time(blocking), 2),
+        'blocking_3g_after': round(inline / NETWORK_3G_BYTES_PER_SECOND, 2),
+    }
+
+
+def remove(name):
+    (_root() / f'{name}.css').unlink(missing_ok=True)
+
+
+_loaded = {}
+
+
+def load(name):
+    """Критический CSS страницы или None; файл перечитывается, только если изменился"""
+    path = _root() / f'{name}.css'
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _loaded[path] = (mtime, path.read_text(encoding='utf-8'))
+    return cached[1] or None
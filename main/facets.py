@@ -0,0 +1,149 @@
+"""
+Фильтры и счетчики (фасеты) для страницы категории.
+
+Счетчик значения фасета считается с учетом всех остальных выбранных фильтров,
+но без фильтра по самому фасету — так видно, сколько товаров добавит выбор значения.
+На любое состояние фильтров — постоянное число запросов (по одному на фасет),
+результат кэшируется по категории до изменения ее товаров.
+"""
+import hashlib
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+from django.utils.translation import gettext_lazy as _
+
+from . import instrumentation
+
+# Фасеты со списком значений (можно выбрать несколько)
+VALUE_FACETS = ('material', 'size', 'color')
+FILTER_PARAMS = VALUE_FACETS + ('price_min', 'price_max', 'in_stock')
+
+FACET_TITLES = {
+    'material': _('Материал'),
+    'size': _('Размер'),
+    'color': _('Цвет'),
+}
+FACET_ICONS = {
+    'material': 'fa-leaf',
+    'size': 'fa-ruler',
+    'color': 'fa-palette',
+}
+
+FACET_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+    # nan, Infinity и sNaN — тоже Decimal, но DecimalField их не принимает
+    return price if price is not None and price.is_finite() else None
+
+
+def parse_filters(params):
+    """Фильтры из GET-параметров"""
+    filters = {facet: sorted({v for v in params.getlist(facet) if v}) for facet in VALUE_FACETS}
+    filters['price_min'] = _parse_price(params.get('price_min'))
+    filters['price_max'] = _parse_price(params.get('price_max'))
+    filters['in_stock'] = params.get('in_stock') == '1'
+    return filters
+
+
+def filter_conditions(filters, exclude=None):
+    """Q с условиями всех фильтров, кроме exclude"""
+    condition = Q()
+    for facet in VALUE_FACETS:
+        if facet != exclude and filters[facet]:
+            condition &= Q(**{f'{facet}__in': filters[facet]})
+    if exclude != 'price':
+        if filters['price_min'] is not None:
+            condition &= Q(price__gte=filters['price_min'])
+        if filters['price_max'] is not None:
+            condition &= Q(price__lte=filters['price_max'])
+    if exclude != 'in_stock' and filters['in_stock']:
+        condition &= Q(stock__gt=0)
+    return condition
+
+
+def filter_key(filters):
+    """Строковое представление состояния фильтров для ключей кэша"""
+    return repr(sorted(filters.items()))
+
+
+def _version_key(category_id):
+    return f'facets:version:{category_id}'
+
+
+def invalidate(*category_ids):
+    """Сбрасывает кэш счетчиков категорий (вызывается при изменении товаров)"""
+    for category_id in category_ids:
+        if category_id is not None:
+            cache.set(_version_key(category_id), time.time_ns(), None)
+
+
+def _cache_key(category_id, filters):
+    version = cache.get(_version_key(category_id))
+    if version is None:
+        version = time.time_ns()
+        cache.add(_version_key(category_id), version, None)
+    raw = f'{category_id}|{version}|{filter_key(filters)}'
+    return 'facets:counts:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def compute_facet_counts(products, filters):
+    """products — активные товары категории без фильтров"""
+    counts = {}
+    for facet in VALUE_FACETS:
+        rows = (
+            products.filter(filter_conditions(filters, exclude=facet))
+            .exclude(**{f'{facet}__isnull': True}).exclude(**{facet: ''})
+            .order_by(facet).values(facet).annotate(count=Count('id'))
+        )
+        counts[facet] = [(row[facet], row['count']) for row in rows]
+
+    # Цена и наличие — одним агрегатом
+    aggregates = products.aggregate(
+        price_min=Min('price', filter=filter_conditions(filters, exclude='price')),
+        price_max=Max('price', filter=filter_conditions(filters, exclude='price')),
+        in_stock=Count('id', filter=filter_conditions(filters, exclude='in_stock') & Q(stock__gt=0)),
+    )
+    counts['price'] = (aggregates['price_min'], aggregates['price_max'])
+    counts['in_stock'] = aggregates['in_stock']
+    return counts
+
+
+def get_facet_counts(category, products, filters):
+    key = _cache_key(category.id, filters)
+    counts = cache.get(key)
+    instrumentation.record_cache('facets', counts is not None)
+    if counts is None:
+        counts = compute_facet_counts(products, filters)
+        cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def build_facets(counts, filters):
+    """Данные для боковой панели: заголовок, значения с подписями, счетчиками и отметкой выбора"""
+    from .models import Product
+
+    labels = {'material': dict(Product.MATERIAL_CHOICES)}
+    result = []
+    for facet in VALUE_FACETS:
+        found = dict(counts[facet])
+        # Выбранное значение показываем, даже если товаров с ним не осталось — чтобы его можно было снять
+        for value in filters[facet]:
+            found.setdefault(value, 0)
+        options = [
+            {
+                'value': value,
+                'label': labels.get(facet, {}).get(value, value),
+                'count': count,
+                'selected': value in filters[facet],
+            }
+            for value, count in sorted(found.items())
+        ]
+        result.append({'name': facet, 'title': FACET_TITLES[facet], 'icon': FACET_ICONS[facet], 'options': options})
+    return result
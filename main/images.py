@@ -0,0 +1,149 @@
+"""
+Обработка изображений товаров, категорий и блога:
+фоновое перекодирование и адаптивные варианты (srcset)
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Ширины вариантов; больше исходной картинки не растягиваем
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+
+# Формат -> (расширение, параметры сохранения PIL)
+VARIANT_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 6}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, width, fmt):
+    """products/towel.webp -> products/towel-640w.webp"""
+    base = os.path.splitext(name)[0]
+    ext = VARIANT_FORMATS[fmt][0]
+    return f'{base}-{width}w.{ext}'
+
+
+def variant_widths(source_width):
+    """Ширины вариантов для картинки шириной source_width (сама ширина — последней)"""
+    widths = [w for w in VARIANT_WIDTHS if w < source_width]
+    if source_width <= VARIANT_WIDTHS[-1]:
+        widths.append(source_width)
+    else:
+        widths.append(VARIANT_WIDTHS[-1])
+    return widths
+
+
+def _to_rgb(img):
+    # JPEG не поддерживает прозрачность — заливаем фон белым
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def generate_variants(field):
+    """
+    Создает WebP и JPEG варианты для всех ширин рядом с исходным файлом.
+    Возвращает список ширин, который сохраняется в поле image_variants модели.
+    """
+    if not field:
+        return []
+
+    storage = field.storage
+    field.open('rb')
+    try:
+        source = _to_rgb(Image.open(field))
+        source.load()
+    finally:
+        field.close()
+
+    widths = variant_widths(source.width)
+    for width in widths:
+        if width < source.width:
+            height = round(source.height * width / source.width)
+            resized = source.resize((width, height), Image.LANCZOS)
+        else:
+            resized = source
+
+        for fmt, (ext, options) in VARIANT_FORMATS.items():
+            output = BytesIO()
+            resized.save(output, **options)
+            name = variant_name(field.name, width, fmt)
+            # Имена вариантов выводятся из имени оригинала, поэтому перезаписываем
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(output.getvalue()))
+
+    return widths
+
+
+def variant_urls(field, widths, fmt):
+    """[(url, ширина), ...] для srcset"""
+    storage = field.storage
+    return [(storage.url(variant_name(field.name, width, fmt)), width) for width in widths]
+
+
+def file_hash(field):
+    """SHA-256 содержимого загруженного файла"""
+    digest = hashlib.sha256()
+    field.seek(0)
+    for chunk in field.chunks():
+        digest.update(chunk)
+    field.seek(0)
+    return digest.hexdigest()
+
+
+def process_pending_image(model, pk):
+    """Обработка одного изображения со статусом pending; ошибки помечаются статусом failed"""
+    obj = model.objects.filter(pk=pk, image_status=model.IMAGE_PENDING).first()
+    if obj is None:
+        return False
+    source_name = obj.image.name
+    try:
+        return obj.process_image_file()
+    except Exception as e:
+        logger.error('Ошибка обработки изображения %s #%s: %s', model.__name__, pk, e)
+        model.objects.filter(pk=pk, image=source_name).update(image_status=model.IMAGE_FAILED)
+        return False
+
+
+_executor = None
+
+
+def _run_in_background(model, pk):
+    close_old_connections()
+    try:
+        process_pending_image(model, pk)
+    finally:
+        connection.close()
+
+
+def schedule_image_processing(instance):
+    """
+    Ставит изображение в очередь после коммита транзакции.
+    С IMAGE_PROCESSING_ASYNC обработка идет в фоновом потоке, admin отвечает сразу;
+    то, что не успело обработаться (например, при перезапуске), подбирает команда process_images.
+    """
+    global _executor
+    model, pk = type(instance), instance.pk
+
+    if not getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+        transaction.on_commit(lambda: process_pending_image(model, pk))
+        return
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-processing')
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, model, pk))
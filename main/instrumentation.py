@@ -0,0 +1,256 @@
+"""
+Замеры каждого запроса: число и время SQL-запросов, время рендеринга шаблонов,
+попадания в кэш страниц и фасетов, имя view.
+
+Результат уходит одной JSON-строкой в лог main.requests и в заголовок Server-Timing
+(вкладка Network → Timing в браузере) — только адресам из INTERNAL_IPS и сотрудникам
+(is_staff), всем — с SERVER_TIMING = True: имена view и число запросов посетителям не нужны.
+Из запросов дольше REQUEST_SLOW_MS часть (REQUEST_PROFILE_RATE) профилируется cProfile;
+профиль сохраняется в REQUEST_PROFILE_ROOT, только если запрос действительно оказался медленным:
+
+    python -m pstats profiles/20261018-120000-123456-main.catalog-812ms.prof
+
+Замеры хранятся в contextvar и работают и для синхронных, и для async view.
+Обертка SQL стоит на каждом соединении постоянно и без активного запроса ничего не считает.
+Профилировщик в процессе один на все потоки (на Python 3.12+ cProfile работает через
+sys.monitoring): пока профилируется один запрос, параллельные идут без профиля.
+"""
+import cProfile
+import json
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils import timezone
+
+from .utils import get_trusted_client_ip
+
+logger = logging.getLogger('main.requests')
+
+_current = ContextVar('request_metrics', default=None)
+
+# Занят, пока какой-то поток профилирует запрос
+_profile_lock = threading.Lock()
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'db_queries', 'db_time', 'template_time', 'template_depth', 'cache')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        # имя кэша -> [попадания, промахи]
+        self.cache = {}
+
+
+def current():
+    """Замеры текущего запроса или None (вне запроса: команды, фоновые потоки)"""
+    return _current.get()
+
+
+def record_cache(name, hit):
+    metrics = _current.get()
+    if metrics is not None:
+        counts = metrics.cache.setdefault(name, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_db_wrapper(sender, connection, **kwargs):
+    # В начало списка: connection.execute_wrapper() снимает свою обертку через pop()
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _db_wrapper)
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Вложенный render (render_to_string внутри тега) уже входит во внешний
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд DjangoTemplates, который считает время рендеринга шаблонов запроса"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+def summary(request, response, metrics):
+    total = time.perf_counter() - metrics.started
+    return {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'view': _view_name(request),
+        'total_ms': round(total * 1000, 1),
+        'db_queries': metrics.db_queries,
+        'db_ms': round(metrics.db_time * 1000, 1),
+        'template_ms': round(metrics.template_time * 1000, 1),
+        'cache': {name: {'hits': hits, 'misses': misses} for name, (hits, misses) in metrics.cache.items()},
+    }
+
+
+def server_timing(data):
+    """Значение Server-Timing: длительности в мс, счетчики — в desc"""
+    parts = [
+        f'db;dur={data["db_ms"]};desc="{data["db_queries"]} queries"',
+        f'tpl;dur={data["template_ms"]}',
+    ]
+    if data['cache']:
+        cache = ' '.join(
+            f'{name}:{"hit" if counts["hits"] else "miss"}' if counts['hits'] + counts['misses'] == 1
+            else f'{name}:{counts["hits"]}/{counts["hits"] + counts["misses"]}'
+            for name, counts in data['cache'].items()
+        )
+        parts.append(f'cache;desc="{cache}"')
+    if data['view']:
+        parts.append(f'view;desc="{data["view"]}"')
+    parts.append(f'total;dur={data["total_ms"]}')
+    return ', '.join(parts)
+
+
+def _start_profile():
+    """Запущенный cProfile.Profile или None, если профилировщик уже занят другим запросом"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # «Another profiling tool is already active» — например, профилирование всего процесса
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profile(profiler):
+    try:
+        profiler.disable()
+    finally:
+        _profile_lock.release()
+
+
+def save_profile(profiler, data):
+    """Пишет профиль в REQUEST_PROFILE_ROOT; старые файлы сверх REQUEST_PROFILE_MAX_FILES удаляются"""
+    root = Path(settings.REQUEST_PROFILE_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    # Микросекунды: два медленных запроса к одному view в одну секунду не перезаписывают друг друга
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+    view = (data['view'] or 'unresolved').replace(':', '.')
+    path = root / f'{stamp}-{view}-{round(data["total_ms"])}ms.prof'
+    profiler.dump_stats(path)
+
+    files = sorted(root.glob('*.prof'), key=lambda p: p.stat().st_mtime)
+    for old in files[:max(0, len(files) - settings.REQUEST_PROFILE_MAX_FILES)]:
+        old.unlink(missing_ok=True)
+    return path.name
+
+
+class RequestMetricsMiddleware:
+    """
+    Ставится первым в MIDDLEWARE, чтобы total включал остальные middleware.
+    Выключается REQUEST_METRICS = False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = settings.SERVER_TIMING
+        self.slow = settings.REQUEST_SLOW_MS / 1000
+        self.profile_rate = settings.REQUEST_PROFILE_RATE
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # cProfile только в синхронном пути: в async профиль смешал бы все задачи event loop
+        profiler = _start_profile() if self.profile_rate and random.random() < self.profile_rate else None
+        try:
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    _stop_profile(profiler)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, profiler)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def send_header(self, request):
+        if self.header or get_trusted_client_ip(request) in settings.INTERNAL_IPS:
+            return True
+        # Пользователя загружаем только при cookie сессии: у анонимного посетителя ее нет
+        user = getattr(request, 'user', None)
+        if user is None or settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return False
+        return getattr(user, 'is_staff', False)
+
+    def finish(self, request, response, metrics, profiler=None):
+        data = summary(request, response, metrics)
+        slow = data['total_ms'] >= self.slow * 1000
+        if slow and profiler is not None:
+            try:
+                data['profile'] = save_profile(profiler, data)
+            except OSError:
+                logger.exception('Не удалось сохранить профиль запроса')
+        if self.send_header(request):
+            response['Server-Timing'] = server_timing(data)
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(data, ensure_ascii=False))
+        return response
@@ -0,0 +1,46 @@
+"""
+Резервная копия каталога и блога (main/backup.py) — замена dumpdata > data_backup.json
+"""
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main import backup
+
+
+class Command(BaseCommand):
+    help = 'Снимает потоковую сжатую копию моделей (по файлу на модель) с контрольными суммами медиафайлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', nargs='?', help='Папка копии (по умолчанию BACKUP_ROOT/<дата-время>)')
+        parser.add_argument(
+            '--models',
+            nargs='+',
+            default=list(backup.DEFAULT_MODELS),
+            help='Модели app.model (по умолчанию каталог, блог и заявки)',
+        )
+        parser.add_argument('--with-media', action='store_true', help='Скопировать и сами файлы изображений')
+        parser.add_argument('--json', action='store_true', help='Вывести манифест в JSON')
+
+    def handle(self, *args, **options):
+        target = Path(options['target'] or Path(settings.BACKUP_ROOT) / timezone.now().strftime('%Y%m%d-%H%M%S'))
+        if (target / backup.MANIFEST_NAME).exists():
+            raise CommandError(f'В {target} уже есть копия')
+        try:
+            manifest = backup.backup(target, options['models'], with_media=options['with_media'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(manifest, indent=2, ensure_ascii=False))
+            return
+        for entry in manifest['models']:
+            self.stdout.write(f'  {entry["model"]:<24}{entry["count"]:>8}')
+        media = manifest['media']
+        self.stdout.write(f'  {"файлов":<24}{media["count"]:>8}  ({media["bytes"] / 1e6:.1f} МБ)')
+        if media['missing']:
+            self.stderr.write(self.style.WARNING(f'Файлов нет в storage: {media["missing"]}'))
+        self.stdout.write(self.style.SUCCESS(f'Копия: {target}'))
@@ -0,0 +1,146 @@
+"""
+Сравнение WSGI (gunicorn, sync-воркеры) и ASGI (gunicorn + uvicorn-воркеры)
+по пропускной способности при разном числе одновременных соединений
+"""
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SERVERS = {
+    'wsgi': ['config.wsgi:application'],
+    'asgi': ['config.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+DEFAULT_PATHS = ['/', '/catalog/', '/blog/']
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url, process, headers, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'Сервер завершился с кодом {process.returncode}')
+        try:
+            requests.get(url, headers=headers, allow_redirects=False, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise CommandError(f'Сервер не ответил за {timeout} с')
+
+
+def run_load(base_url, paths, concurrency, duration, headers):
+    """Каждый поток — отдельное keep-alive соединение, запросы по кругу по paths"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(index):
+        nonlocal errors
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        i = index
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = session.get(base_url + paths[i % len(paths)], headers=headers, timeout=30)
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            if ok:
+                local_latencies.append(time.perf_counter() - started)
+            else:
+                local_errors += 1
+            i += 1
+        session.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Запускает сайт под WSGI и под ASGI и сравнивает пропускную способность под нагрузкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+        parser.add_argument('--workers', type=int, default=2, help='Воркеров gunicorn у каждого сервера')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+        parser.add_argument('--duration', type=float, default=10.0, help='Секунд нагрузки на каждый уровень')
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument(
+            '--bypass-page-cache',
+            action='store_true',
+            help='Отправлять cookie сессии, чтобы страницы не отдавались из кэша страниц',
+        )
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        headers = {'X-Forwarded-Proto': 'https'}
+        if options['bypass_page_cache']:
+            headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}=benchmark'
+
+        results = {}
+        for name in options['servers']:
+            port = _free_port()
+            command = [
+                sys.executable, '-m', 'gunicorn', *SERVERS[name],
+                '--workers', str(options['workers']),
+                '--bind', f'127.0.0.1:{port}',
+                '--log-level', 'warning',
+            ]
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR)
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                _wait_ready(base_url + options['paths'][0], process, headers)
+                # Прогрев: кэши, соединения с БД, импорт шаблонов
+                run_load(base_url, options['paths'], options['workers'], 1, headers)
+                results[name] = [
+                    run_load(base_url, options['paths'], concurrency, options['duration'], headers)
+                    for concurrency in options['concurrency']
+                ]
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f'{"сервер":<8}{"соед.":>7}{"запросов":>10}{"ошибок":>8}{"req/s":>9}{"p50 мс":>9}{"p95 мс":>9}'
+        )
+        for name, rows in results.items():
+            for row in rows:
+                self.stdout.write(
+                    f'{name:<8}{row["concurrency"]:>7}{row["requests"]:>10}{row["errors"]:>8}'
+                    f'{row["rps"]:>9}{row["p50_ms"] or "-":>9}{row["p95_ms"] or "-":>9}'
+                )
@@ -0,0 +1,92 @@
+"""
+Задержки (p50/p95/p99), пропускная способность и запросы к БД по каждой странице сайта
+(main/benchmark.py). Данные большого размера — generate_catalog.
+
+    python manage.py benchmark_urls --output bench/$(git rev-parse --short HEAD).json
+    python manage.py benchmark_urls --compare bench/abc1234.json
+"""
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Нагружает каждую страницу сайта и выводит p50/p95/p99, req/s и запросы к БД в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', help='Только эти сценарии (по умолчанию все)')
+        parser.add_argument('--list', action='store_true', help='Показать сценарии и пути и выйти')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременных клиентов')
+        parser.add_argument('--warmup', type=int, default=5, help='Запросов прогрева (не учитываются)')
+        parser.add_argument(
+            '--base-url',
+            help='Нагружать запущенный сервер (http://127.0.0.1:8000); по умолчанию — в этом процессе',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Отправлять cookie сессии: страницы рендерятся без кэша страниц и без 304',
+        )
+        parser.add_argument(
+            '--include-contact',
+            action='store_true',
+            help='Нагружать и отправку формы: создает заявки, в этом процессе они удаляются после прогона, '
+                 'на --base-url остаются в базе сервера и уходят в Telegram',
+        )
+        parser.add_argument('--output', help='Сохранить отчет JSON в файл')
+        parser.add_argument('--compare', help='Отчет прошлого прогона: вывести изменение метрик')
+
+    def handle(self, *args, **options):
+        include_contact = options['include_contact']
+        if options['list']:
+            for scenario in benchmark.scenarios(include_contact):
+                self.stdout.write(f'{scenario["name"]:<22}{scenario["method"]:<6}{scenario["path"]}')
+            return
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests и --concurrency должны быть больше 0, --warmup — не меньше 0')
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+        if benchmark.CONTACT_SCENARIO in (options['scenarios'] or ()) and not include_contact:
+            raise CommandError(f'Сценарий {benchmark.CONTACT_SCENARIO} создает заявки — добавьте --include-contact')
+        known = {scenario['name'] for scenario in benchmark.scenarios(include_contact)}
+        unknown = set(options['scenarios'] or ()) - known
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+
+        def progress(name, result):
+            self.stderr.write(
+                f'{name:<22}{result["p50_ms"]:>9} {result["p95_ms"]:>9} {result["p99_ms"]:>9} мс'
+                f'{result["rps"]:>9} req/s  БД: {result["queries_mean"]}  ошибок: {result["errors"]}'
+            )
+
+        report = benchmark.run(
+            selected=options['scenarios'],
+            base_url=options['base_url'],
+            requests_count=options['requests'],
+            concurrency=options['concurrency'],
+            warmup=options['warmup'],
+            cold=options['cold'],
+            on_result=progress,
+            include_contact=include_contact,
+        )
+        if baseline is not None:
+            report['compare'] = {
+                'commit': baseline.get('meta', {}).get('commit'),
+                'results': benchmark.compare(baseline, report),
+            }
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(output + '\n', encoding='utf-8')
+            self.stderr.write(f'Отчет сохранен в {path}')
+        self.stdout.write(output)
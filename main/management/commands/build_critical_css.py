@@ -0,0 +1,50 @@
+"""
+Сборка критического CSS страниц в CRITICAL_CSS_ROOT (запускать после collectstatic)
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import cache as page_cache
+from main import critical_css
+
+
+class Command(BaseCommand):
+    help = 'Извлекает CSS первого экрана для каждой страницы и показывает оценку выигрыша на 3G'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', nargs='+', choices=list(critical_css.PAGES), help='Только эти страницы')
+        parser.add_argument('--json', action='store_true', help='Вывести отчет в JSON')
+
+    def handle(self, *args, **options):
+        urls = critical_css.page_urls()
+        reports, failed = [], []
+        for name in options['pages'] or critical_css.PAGES:
+            if name not in urls:
+                self.stderr.write(f'{name}: нет опубликованного объекта для образца, пропущено')
+                continue
+            try:
+                reports.append(critical_css.build_page(name, urls[name]))
+            except Exception as e:
+                # Устаревший критический CSS хуже блокирующих стилей — удаляем
+                critical_css.remove(name)
+                failed.append(name)
+                self.stderr.write(self.style.ERROR(f'{name}: {e}'))
+
+        if reports:
+            # В кэше страниц лежит HTML без нового встроенного CSS
+            page_cache.invalidate(page_cache.CATALOG, page_cache.BLOG)
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+        else:
+            self.stdout.write(
+                f'{"страница":<18}{"inline":>9}{"gzip":>8}{"блок. gzip":>12}{"3G до, с":>10}{"3G после, с":>13}'
+            )
+            for row in reports:
+                self.stdout.write(
+                    f'{row["page"]:<18}{row["inline_bytes"]:>9}{row["inline_gzip"]:>8}{row["blocking_gzip"]:>12}'
+                    f'{row["blocking_3g_before"]:>10}{row["blocking_3g_after"]:>13}'
+                )
+        if failed:
+            raise CommandError(f'Не собраны: {", ".join(failed)}')
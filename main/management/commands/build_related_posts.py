@@ -0,0 +1,14 @@
+"""
+Полная пересборка похожих статей блога (TF-IDF)
+"""
+from django.core.management.base import BaseCommand
+
+from main import related_posts
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает частоты слов и похожие статьи для всех опубликованных статей'
+
+    def handle(self, *args, **options):
+        count = related_posts.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны похожие статьи: {count}'))
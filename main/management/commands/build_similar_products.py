@@ -0,0 +1,14 @@
+"""
+Полная пересборка списков похожих товаров
+"""
+from django.core.management.base import BaseCommand
+
+from main import similarity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие товары для всех активных товаров'
+
+    def handle(self, *args, **options):
+        changed = similarity.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено списков похожих товаров: {changed}'))
@@ -0,0 +1,21 @@
+"""
+Сборка sitemap-файлов в SITEMAP_ROOT
+"""
+from django.core.management.base import BaseCommand
+
+from main import sitemap_files
+from main.sitemaps import SITEMAPS
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает устаревшие разделы sitemap (с --all — все разделы)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Пересобрать все разделы')
+
+    def handle(self, *args, **options):
+        sections = sitemap_files.build(list(SITEMAPS) if options['all'] else None)
+        if sections:
+            self.stdout.write(self.style.SUCCESS(f'Пересобраны разделы: {", ".join(sections)}'))
+        else:
+            self.stdout.write('Sitemap актуален')
@@ -0,0 +1,76 @@
+"""
+Синтетические категории, товары с фото-заглушками и статьи блога для нагрузочных тестов
+(main/synthetic.py). Затем — benchmark_urls.
+
+    python manage.py generate_catalog --products 100000 --categories 50 --posts 2000 --clear
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетический каталог и блог заданного размера (slug с префиксом synthetic-)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--images', type=int, default=2, help='Фото на товар')
+        parser.add_argument('--posts', type=int, default=300)
+        parser.add_argument('--seed', type=int, default=0, help='Одно зерно — одни и те же данные')
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE)
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить прошлые синтетические данные')
+        parser.add_argument('--only-clear', action='store_true', help='Только удалить синтетические данные')
+        parser.add_argument(
+            '--skip-related',
+            action='store_true',
+            help='Не пересчитывать «Читайте также» (потом запустить build_related_posts)',
+        )
+        parser.add_argument(
+            '--similar',
+            action='store_true',
+            help='Пересчитать похожие товары (долго на больших каталогах; иначе — build_similar_products)',
+        )
+        parser.add_argument('--json', action='store_true', help='Вывести отчет в JSON')
+
+    def handle(self, *args, **options):
+        for name in ('categories', 'products', 'images', 'posts'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть отрицательным')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+
+        generator = synthetic.CatalogGenerator(seed=options['seed'], batch_size=options['batch_size'])
+        cleared = None
+        if options['clear'] or options['only_clear']:
+            cleared = synthetic.clear()
+        if not options['only_clear']:
+            try:
+                generator.run(
+                    categories=options['categories'],
+                    products=options['products'],
+                    images=options['images'],
+                    posts=options['posts'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+        generator.finish(related=not options['skip_related'], similar=options['similar'])
+
+        report = generator.report()
+        if cleared is not None:
+            report['cleared'] = cleared
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if cleared is not None:
+            self.stdout.write(
+                f'Удалено: категорий {cleared["categories"]}, товаров {cleared["products"]}, статей {cleared["posts"]}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: категорий {report["categories"]}, товаров {report["products"]}, '
+            f'фото {report["images"]}, статей {report["posts"]}'
+        ))
+        for name, seconds in report['timings'].items():
+            self.stdout.write(f'  {name}: {seconds} с')
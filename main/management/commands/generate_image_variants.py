@@ -0,0 +1,41 @@
+"""
+Создание адаптивных вариантов для уже загруженных изображений
+(например, после loaddata или для файлов до появления srcset)
+"""
+from django.core.management.base import BaseCommand
+
+from main.images import generate_variants
+from main.models import ProductCategory, ProductImage, BlogPost
+
+
+class Command(BaseCommand):
+    help = 'Генерирует WebP/JPEG варианты изображений для srcset'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        for model in (ProductCategory, ProductImage, BlogPost):
+            # pending-изображения обрабатывает process_images
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True).filter(
+                image_status=model.IMAGE_READY
+            )
+            if not options['force']:
+                queryset = queryset.filter(image_variants=[])
+
+            done = 0
+            for obj in queryset.iterator():
+                try:
+                    widths = generate_variants(obj.image)
+                except Exception as e:
+                    self.stderr.write(f'{model.__name__} #{obj.pk}: {e}')
+                    continue
+                # update() вместо save(), чтобы не запускать повторную обработку оригинала
+                model.objects.filter(pk=obj.pk).update(image_variants=widths)
+                done += 1
+
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: {done}'))
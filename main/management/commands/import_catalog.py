@@ -0,0 +1,138 @@
+"""
+Массовый импорт категорий, товаров и фото из CSV / JSON Lines / JSON (main/catalog_import.py).
+
+Колонки: name (обязательно), category или category_slug, slug, description, material, size,
+color, price, stock, is_active, is_featured, images — файлы через «|» относительно --images-dir.
+"""
+import json
+import os
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main import catalog_import
+
+# Сколько ошибок строк выводить (все учитываются в отчете)
+MAX_PRINTED_ERRORS = 50
+
+
+class Command(BaseCommand):
+    help = 'Импортирует каталог пачками: bulk-запросы, фото в пуле процессов, продолжение после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv, .jsonl или .json')
+        parser.add_argument('--format', choices=list(catalog_import.READERS), help='По умолчанию — по расширению')
+        parser.add_argument('--images-dir', help='Папка с фото (по умолчанию — папка файла)')
+        parser.add_argument('--batch-size', type=int, default=catalog_import.BATCH_SIZE)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Процессов для обработки фото (0 — в текущем процессе)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Проверить файл и измерить скорость: все изменения откатываются, фото не обрабатываются',
+        )
+        parser.add_argument(
+            '--similar',
+            action='store_true',
+            help='Сразу пересчитать похожие товары затронутых категорий (по умолчанию — потом build_similar_products)',
+        )
+        parser.add_argument('--resume', action='store_true', help='Продолжить с места прошлого сбоя')
+        parser.add_argument('--state', help='Файл состояния (по умолчанию <path>.import-state)')
+        parser.add_argument('--json', action='store_true', help='Вывести отчет в JSON')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f'Файл {path} не найден')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        state_path = Path(options['state'] or f'{path}.import-state')
+        dry_run = options['dry_run']
+
+        start, categories_touched = 0, set()
+        if options['resume']:
+            try:
+                start, categories_touched = catalog_import.load_state(state_path, path)
+            except ValueError as e:
+                raise CommandError(str(e))
+            if start:
+                self.stderr.write(f'Продолжение после строки {start}')
+
+        try:
+            rows = catalog_import.read_rows(path, options['format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        pool = None if dry_run else catalog_import.image_pool(options['workers'])
+        on_batch = None if dry_run else lambda last, categories: catalog_import.save_state(
+            state_path, path, last, categories
+        )
+        # Пачки фиксируются по одной; при --dry-run все откатывается в конце
+        atomic = transaction.atomic() if dry_run else nullcontext()
+        try:
+            with atomic:
+                importer = catalog_import.CatalogImporter(
+                    options['images_dir'] or path.parent,
+                    batch_size=options['batch_size'],
+                    pool=pool,
+                    dry_run=dry_run,
+                    similar=options['similar'],
+                    categories_touched=categories_touched,
+                )
+                try:
+                    importer.run(rows, start=start, on_batch=on_batch)
+                except (ValueError, UnicodeDecodeError) as e:
+                    # Битый файл: зафиксированные пачки остаются, --resume продолжит после них
+                    raise CommandError(f'Ошибка чтения файла: {e}')
+                finally:
+                    # Кэши и похожие товары — и для пачек, зафиксированных до сбоя
+                    importer.finish()
+                if dry_run:
+                    transaction.set_rollback(True)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if not dry_run:
+            state_path.unlink(missing_ok=True)
+
+        for number, message in importer.errors[:MAX_PRINTED_ERRORS]:
+            self.stderr.write(f'строка {number}: {message}')
+        if len(importer.errors) > MAX_PRINTED_ERRORS:
+            self.stderr.write(f'... и еще {len(importer.errors) - MAX_PRINTED_ERRORS}')
+
+        report = importer.report()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report)
+        if not dry_run and not options['similar'] and (report['created'] or report['updated']):
+            self.stderr.write('Похожие товары не пересчитаны — запустите build_similar_products')
+        if report['invalid']:
+            raise CommandError(f'Строк с ошибками: {report["invalid"]}')
+
+    def write_report(self, report):
+        title = 'Проверка (без изменений)' if report['dry_run'] else 'Импорт завершен'
+        self.stdout.write(self.style.SUCCESS(title))
+        lines = [
+            ('Строк', report['rows']),
+            ('С ошибками', report['invalid']),
+            ('Товаров создано', report['created']),
+            ('Товаров обновлено', report['updated']),
+            ('Без изменений', report['unchanged']),
+            ('Категорий создано', report['categories_created']),
+            ('Фото обработано', report['images']),
+            ('Фото уже были', report['images_skipped']),
+            ('Фото с ошибками', report['images_failed']),
+            ('Строк в секунду', report['rows_per_second']),
+        ]
+        if report['images_per_second']:
+            lines.append(('Фото в секунду', report['images_per_second']))
+        lines += [(f'Время: {name}, с', seconds) for name, seconds in report['seconds'].items()]
+        for label, value in lines:
+            self.stdout.write(f'  {label:<22}{value}')
@@ -0,0 +1,25 @@
+"""
+Счетчики попаданий/промахов кэша страниц
+"""
+from django.core.management.base import BaseCommand
+
+from main import cache as page_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает статистику кэша страниц для анонимных посетителей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики')
+
+    def handle(self, *args, **options):
+        stats = page_cache.get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(f"Попадания: {stats['hits']}")
+        self.stdout.write(f"Промахи: {stats['misses']}")
+        self.stdout.write(f'Доля попаданий: {ratio:.1f}%')
+
+        if options['reset']:
+            page_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
@@ -0,0 +1,48 @@
+"""
+Фоновый обработчик изображений: перекодирует файлы со статусом pending
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.images import process_pending_image
+from main.models import ProductCategory, ProductImage, BlogPost
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает изображения, ожидающие перекодирования (статус pending)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно, проверяя очередь каждые --interval секунд',
+        )
+        parser.add_argument('--interval', type=float, default=5.0)
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Повторить обработку изображений со статусом failed',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            for model in (ProductCategory, ProductImage, BlogPost):
+                model.objects.filter(image_status=model.IMAGE_FAILED).update(image_status=model.IMAGE_PENDING)
+
+        while True:
+            processed = self.process_queue()
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {processed}'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def process_queue(self):
+        processed = 0
+        for model in (ProductCategory, ProductImage, BlogPost):
+            pending = model.objects.filter(image_status=model.IMAGE_PENDING).values_list('pk', flat=True)
+            for pk in list(pending):
+                if process_pending_image(model, pk):
+                    processed += 1
+        return processed
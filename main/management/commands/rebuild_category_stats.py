@@ -0,0 +1,18 @@
+"""
+Пересчет сводок всех категорий (main/category_stats.py) одним проходом — после ручных правок
+в БД, сырых удалений или если сводки разошлись с товарами
+"""
+from django.core.management.base import BaseCommand
+
+from main import cache as page_cache
+from main import category_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает число товаров, наличие, цены и обложки всех категорий'
+
+    def handle(self, *args, **options):
+        changed = category_stats.refresh()
+        if changed:
+            page_cache.invalidate(page_cache.CATALOG)
+        self.stdout.write(self.style.SUCCESS(f'Исправлено категорий: {changed}'))
@@ -0,0 +1,18 @@
+"""
+Пересборка полнотекстового индекса блога
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс статей блога'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'{type(backend).__name__} ({connection.vendor}): проиндексировано статей: {count}'
+        ))
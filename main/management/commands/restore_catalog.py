@@ -0,0 +1,53 @@
+"""
+Восстановление копии backup_catalog (main/backup.py): bulk-вставка без save() и перекодирования фото
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from main import backup
+
+
+class Command(BaseCommand):
+    help = 'Восстанавливает копию целиком, отдельные модели или одну категорию с товарами и фото'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Папка копии')
+        parser.add_argument('--models', nargs='+', help='Только эти модели app.model')
+        parser.add_argument('--category', help='Только категория с этим slug, ее товары и их фото')
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Сначала удалить текущие строки восстанавливаемых моделей (в границах --category)',
+        )
+        parser.add_argument('--json', action='store_true', help='Вывести отчет в JSON')
+
+    def handle(self, *args, **options):
+        try:
+            stats = backup.restore(
+                options['source'],
+                labels=options['models'],
+                category=options['category'],
+                replace=options['replace'],
+            )
+        except (ValueError, DatabaseError) as e:
+            # Все в одной транзакции: при ошибке БД остается как была
+            raise CommandError(str(e))
+
+        media = stats['media']
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, ensure_ascii=False))
+        else:
+            for label, count in stats['models'].items():
+                deleted = stats['deleted'].get(label)
+                suffix = f'  (удалено перед восстановлением: {deleted})' if deleted is not None else ''
+                self.stdout.write(f'  {label:<24}{count:>8}{suffix}')
+            self.stdout.write(f'  файлов в порядке: {media["ok"]}, восстановлено из копии: {media["restored"]}')
+        problems = media['missing'] + media['mismatch']
+        for name in problems[:50]:
+            self.stderr.write(f'файл не совпадает с копией или отсутствует: {name}')
+        if problems:
+            raise CommandError(f'Проблемных файлов: {len(problems)} (снимите копию с --with-media)')
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS('Восстановлено'))
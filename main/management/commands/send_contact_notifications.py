@@ -0,0 +1,34 @@
+"""
+Отправка заявок с контактной формы в Telegram (очередь ContactMessage)
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.notifications import TelegramClient, deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Отправляет в Telegram заявки с сайта, ожидающие отправки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Работать постоянно, проверяя очередь каждые --interval секунд',
+        )
+        parser.add_argument('--interval', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        # Одна сессия на весь цикл — соединение с api.telegram.org переиспользуется
+        client = TelegramClient()
+        try:
+            while True:
+                sent = deliver_pending(client)
+                if sent:
+                    self.stdout.write(self.style.SUCCESS(f'Отправлено заявок: {sent}'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            client.close()
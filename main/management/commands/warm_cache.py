@@ -0,0 +1,103 @@
+"""
+Прогрев кэша страниц после выкладки (main/warmup.py): все адреса sitemap на всех языках,
+сортировки категорий; время рендеринга каждой страницы — в отчете.
+
+    python manage.py warm_cache --concurrency 8 --output warmup/$(git rev-parse --short HEAD).json
+    python manage.py warm_cache --traffic /var/log/site/requests.log --max-ms 1500
+"""
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import warmup
+
+
+class Command(BaseCommand):
+    help = 'Запрашивает страницы из sitemap на всех языках, заполняя кэш страниц, и выводит время рендеринга'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременных запросов')
+        parser.add_argument(
+            '--sections', nargs='+', choices=warmup.SECTION_ORDER, help='Только эти разделы sitemap',
+        )
+        parser.add_argument('--languages', nargs='+', help='Только эти языки (по умолчанию все из LANGUAGES)')
+        parser.add_argument('--no-sorts', action='store_true', help='Не прогревать сортировки категорий')
+        parser.add_argument('--limit', type=int, help='Не больше N адресов (самые приоритетные)')
+        parser.add_argument(
+            '--traffic',
+            help='Журнал main.requests: порядок по числу обращений вместо порядка по разделам',
+        )
+        parser.add_argument('--host', help='Host запросов — как у сайта (по умолчанию первый из ALLOWED_HOSTS)')
+        parser.add_argument('--slowest', type=int, default=10, help='Сколько самых медленных страниц показать')
+        parser.add_argument('--max-ms', type=float, help='Ошибка, если какая-то страница рендерится дольше')
+        parser.add_argument('--output', help='Сохранить отчет JSON со временем каждой страницы')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должен быть больше 0')
+        known = warmup.languages()
+        unknown = set(options['languages'] or ()) - set(known)
+        if unknown:
+            raise CommandError(f'Неизвестные языки: {", ".join(sorted(unknown))}; есть: {", ".join(known)}')
+
+        if warmup.cache_backend() in warmup.LOCAL_CACHES:
+            self.stderr.write(self.style.WARNING(
+                f'Кэш {warmup.cache_backend()} — свой у каждого процесса: страницы прогреются только здесь, '
+                'отчет о времени рендеринга остается верным. Для прогрева сервера нужен общий CACHE_URL'
+            ))
+        items = warmup.urls(
+            sections=options['sections'], langs=options['languages'], sorts=not options['no_sorts'],
+        )
+        if options['traffic']:
+            try:
+                with open(options['traffic'], encoding='utf-8', errors='replace') as f:
+                    items = warmup.prioritize(items, warmup.read_traffic(f))
+            except OSError as e:
+                raise CommandError(f'Не удалось прочитать {options["traffic"]}: {e}')
+        if options['limit'] is not None:
+            items = items[:options['limit']]
+        self.stderr.write(f'Адресов: {len(items)}')
+
+        verbose = options['verbosity'] >= 2
+
+        def progress(result):
+            if verbose or result['status'] >= 400:
+                self.stderr.write(self.format_result(result))
+
+        report = warmup.run(items, concurrency=options['concurrency'], host=options['host'], on_result=progress)
+
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(report, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+            self.stderr.write(f'Отчет сохранен в {path}')
+
+        for section, stats in report['sections'].items():
+            self.stdout.write(f'{section:<12}{self.format_stats(stats)}')
+        summary = report['summary']
+        self.stdout.write(f'{"всего":<12}{self.format_stats(summary)}  за {report["meta"]["seconds"]} с')
+        slowest = sorted(report['results'], key=lambda result: result['ms'], reverse=True)[:options['slowest']]
+        if slowest:
+            self.stdout.write('Самые медленные:')
+            for result in slowest:
+                self.stdout.write(f'  {self.format_result(result)}')
+
+        too_slow = [result for result in report['results'] if options['max_ms'] and result['ms'] > options['max_ms']]
+        if too_slow:
+            raise CommandError(f'Страниц дольше {options["max_ms"]} мс: {len(too_slow)}')
+        if summary['errors']:
+            raise CommandError(f'Страниц с ошибкой: {summary["errors"]}')
+        self.stdout.write(self.style.SUCCESS(f'Прогрето страниц: {summary["urls"]}'))
+
+    @staticmethod
+    def format_stats(stats):
+        return (
+            f'{stats["urls"]:>7} стр.  p50 {stats["p50_ms"]} мс  p95 {stats["p95_ms"]} мс  '
+            f'max {stats["max_ms"]} мс  ошибок: {stats["errors"]}  уже в кэше: {stats["already_cached"]}'
+        )
+
+    @staticmethod
+    def format_result(result):
+        queries = '' if result['queries'] is None else f'  БД: {result["queries"]}'
+        return f'{result["status"]} {result["ms"]:>9} мс{queries}  {result["path"]}'
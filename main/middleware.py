@@ -1,57 +1,65 @@
 """
 Middleware для защиты от спама и rate limiting
 """
-from django.core.cache import cache
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
-import time
 
-from .utils import get_client_ip
+from .ratelimit import load_rules
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MESSAGE = '⚠️ Слишком много запросов. Пожалуйста, подождите минуту перед следующей отправкой.'
 
 
 class RateLimitMiddleware:
     """
-    Простая защита от спама для контактной формы
-    Ограничение: максимум 3 запроса в 60 секунд с одного IP
+    Ограничение частоты запросов по правилам settings.RATE_LIMITS (путь, методы, лимит, окно).
+    Счетчики — атомарные, в общем кэше (см. main/ratelimit.py).
+    Работает и под WSGI, и под ASGI (не переводит async view в синхронный режим)
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.rules = load_rules()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        # Применяем только к API контактной формы (НЕ к set-language!)
-        if request.path == '/api/submit-contact/' and request.method == 'POST':
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.matching_rules(request):
+            limited = await sync_to_async(self.check)(request)
+            if limited:
+                return limited
+        return await self.get_response(request)
+
+    def matching_rules(self, request):
+        return [rule for rule in self.rules if rule.matches(request)]
+
+    def check(self, request):
+        """Ответ 429 с Retry-After при превышении лимита, иначе None"""
+        for rule in self.matching_rules(request):
             try:
-                # Получаем IP пользователя
-                ip_address = get_client_ip(request)
-
-                # Ключ для кэша
-                cache_key = f'rate_limit_contact_{ip_address}'
-
-                # Получаем историю запросов
-                request_history = cache.get(cache_key, [])
-                current_time = time.time()
-
-                # Очищаем старые запросы (старше 60 секунд)
-                request_history = [t for t in request_history if current_time - t < 60]
-
-                # Проверяем лимит
-                if len(request_history) >= 3:
-                    return JsonResponse({
-                        'success': False,
-                        'error': '⚠️ Слишком много запросов. Пожалуйста, подождите минуту перед следующей отправкой.'
-                    }, status=429)
-
-                # Добавляем текущий запрос
-                request_history.append(current_time)
-
-                # Сохраняем в кэш на 60 секунд
-                cache.set(cache_key, request_history, 60)
+                retry_after = rule.hit(request)
             except Exception:
-                # Если возникла ошибка с кэшем, просто пропускаем rate limiting
-                pass
-
-        response = self.get_response(request)
-        return response
+                # Кэш недоступен — пропускаем запрос, но не молча
+                logger.exception('Rate limit %s: ошибка кэша, запрос пропущен без проверки', rule.name)
+                continue
+            if retry_after:
+                response = JsonResponse({
+                    'success': False,
+                    'error': rule.message or DEFAULT_MESSAGE,
+                }, status=429)
+                response['Retry-After'] = str(retry_after)
+                return response
+        return None
 
 
 class NoCacheStaticMiddleware:
@@ -59,12 +67,23 @@ class NoCacheStaticMiddleware:
     Только для DEBUG: запрещает браузеру кэшировать /static/, чтобы
     изменения в css/js были видны сразу без ручной очистки кэша.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
         if request.path.startswith('/static/'):
             response['Cache-Control'] = 'no-store'
         return response
\ No newline at end of file
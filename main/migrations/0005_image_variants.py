@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_alter_product_material'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Варианты изображения'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Варианты изображения'),
+        ),
+    ]
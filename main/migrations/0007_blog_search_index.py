@@ -0,0 +1,55 @@
+# Полнотекстовый индекс блога: tsvector + GIN на PostgreSQL, FTS5 на SQLite (см. main/search.py)
+
+from django.db import migrations
+
+
+# Копия SQL индекса на момент миграции: код приложения (main/search.py) может измениться позже
+POSTGRES_VECTOR_SQL = """
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(excerpt, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(content, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(title, '') || ' ' || coalesce(excerpt, '') || ' ' || coalesce(content, '')), 'D') ||
+    setweight(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(excerpt, '') || ' ' || coalesce(content, '')), 'D')
+"""
+
+POSTGRES_FORWARD = [
+    'ALTER TABLE main_blogpost ADD COLUMN search_vector tsvector',
+    'CREATE INDEX main_blogpost_search_vector_gin ON main_blogpost USING gin (search_vector)',
+    f'UPDATE main_blogpost SET search_vector = {POSTGRES_VECTOR_SQL}',
+]
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS main_blogpost_search_vector_gin',
+    'ALTER TABLE main_blogpost DROP COLUMN IF EXISTS search_vector',
+]
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE main_blogpost_fts USING fts5("
+    "title, excerpt, content, tokenize='porter unicode61 remove_diacritics 2')",
+    'INSERT INTO main_blogpost_fts(rowid, title, excerpt, content) '
+    'SELECT id, title, excerpt, content FROM main_blogpost',
+]
+SQLITE_BACKWARD = [
+    'DROP TABLE IF EXISTS main_blogpost_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_image_processing_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
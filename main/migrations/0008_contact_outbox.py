@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-18 08:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_blog_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contact_type', models.CharField(choices=[('general', 'Общий вопрос'), ('wholesale', 'Оптовый заказ'), ('cooperation', 'Сотрудничество')], default='general', max_length=20, verbose_name='Тип обращения')),
+                ('name', models.CharField(max_length=100, verbose_name='Имя')),
+                ('phone', models.CharField(max_length=30, verbose_name='Телефон')),
+                ('email', models.EmailField(max_length=150, verbose_name='Email')),
+                ('company', models.CharField(blank=True, max_length=200, verbose_name='Компания')),
+                ('subject', models.CharField(max_length=200, verbose_name='Тема')),
+                ('message', models.TextField(max_length=500, verbose_name='Сообщение')),
+                ('ip_address', models.CharField(blank=True, max_length=45, verbose_name='IP')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка отправки')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')),
+            ],
+            options={
+                'verbose_name': 'Заявка с сайта',
+                'verbose_name_plural': 'Заявки с сайта',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='contact_outbox_idx')],
+            },
+        ),
+    ]
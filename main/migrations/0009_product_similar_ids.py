@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_contact_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='similar_ids',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Похожие товары'),
+        ),
+    ]
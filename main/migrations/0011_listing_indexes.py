@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+# Индексы под запросы списков каталога и блога (планы EXPLAIN в main/tests.py: ListingIndexTests)
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Сортировки с NULLS LAST по nullable-полям (цена по убыванию, дата публикации) на PostgreSQL
+# совпадают только с индексом того же порядка NULL; в SQLite NULLS LAST в индексе не поддерживается,
+# а обратный проход обычного индекса и так дает NULL в конце
+POSTGRES_FORWARD = [
+    'CREATE INDEX product_active_price_desc_idx ON main_product '
+    '(category_id, price DESC NULLS LAST, id DESC) WHERE is_active',
+    'CREATE INDEX blogpost_published_desc_idx ON main_blogpost '
+    '(published_at DESC NULLS LAST, created_at DESC, id DESC) WHERE is_published',
+]
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS product_active_price_desc_idx',
+    'DROP INDEX IF EXISTS blogpost_published_desc_idx',
+]
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRES_BACKWARD:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_blog_related_posts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogpost',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['published_at', 'created_at', 'id'], name='blogpost_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'created_at', 'id'], name='product_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'price', 'id'], name='product_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'name', 'id'], name='product_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_featured', True)), fields=['created_at'], name='product_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['product', 'order', '-is_main'], name='productimage_order_idx'),
+        ),
+        # Отдельный индекс внешнего ключа — префикс productimage_order_idx, больше не нужен
+        migrations.AlterField(
+            model_name='productimage',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='main.product', verbose_name='Товар'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
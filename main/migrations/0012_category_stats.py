@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+# Хранимые сводки категорий (main/category_stats.py); дальше их поддерживают сигналы,
+# ручной пересчет — python manage.py rebuild_category_stats
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_stats(apps, schema_editor):
+    ProductCategory = apps.get_model('main', 'ProductCategory')
+    Product = apps.get_model('main', 'Product')
+    ProductImage = apps.get_model('main', 'ProductImage')
+
+    cover = ProductImage.objects.filter(
+        product__category=models.OuterRef('pk'), product__is_active=True
+    ).order_by('-product__is_featured', '-product__created_at', '-product_id', '-is_main', 'order')
+    stats = {
+        row['category_id']: row
+        for row in Product.objects.filter(is_active=True).order_by().values('category_id').annotate(
+            active_product_count=models.Count('pk'),
+            in_stock_count=models.Count('pk', filter=models.Q(stock__gt=0)),
+            min_price=models.Min('price'),
+            max_price=models.Max('price'),
+        )
+    }
+    categories = list(ProductCategory.objects.annotate(cover=models.Subquery(cover.values('pk')[:1])))
+    for category in categories:
+        row = stats.get(category.pk, {})
+        category.active_product_count = row.get('active_product_count', 0)
+        category.in_stock_count = row.get('in_stock_count', 0)
+        category.min_price = row.get('min_price')
+        category.max_price = row.get('max_price')
+        category.cover_image_id = category.cover
+    ProductCategory.objects.bulk_update(
+        categories,
+        ['active_product_count', 'in_stock_count', 'min_price', 'max_price', 'cover_image'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcategory',
+            name='active_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Активных товаров'),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.productimage', verbose_name='Обложка'),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В наличии'),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Макс. цена'),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Мин. цена'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
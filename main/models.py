@@ -7,9 +7,13 @@ from django.core.files.base import ContentFile
 from django.core.validators import FileExtensionValidator
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
+from . import cache as page_cache
+from .images import file_hash, generate_variants, schedule_image_processing
+
 
 def process_image(image, upload_path, quality=95, max_size=(1024, 1024)):
     try:
@@ -40,7 +44,116 @@ def process_image(image, upload_path, quality=95, max_size=(1024, 1024)):
         raise ValueError(f"Ошибка при обработке изображения: {e}")
 
 
-class ProductCategory(models.Model):
+class ProcessedImageModel(models.Model):
+    """
+    Изображение, которое перекодируется и нарезается на варианты в фоне.
+    Повторное сохранение без нового файла (например, order/is_main из list_editable)
+    обработку не запускает.
+    """
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_PENDING, _('Обрабатывается')),
+        (IMAGE_READY, _('Готово')),
+        (IMAGE_FAILED, _('Ошибка обработки')),
+    ]
+
+    # Параметры перекодирования в WebP; None — оригинал не перекодируется, только варианты
+    image_upload_path = None
+    image_quality = 85
+    image_max_size = None
+
+    # Группа кэша страниц, которая сбрасывается при изменении (см. main/cache.py)
+    page_cache_group = None
+
+    image_variants = models.JSONField(_('Варианты изображения'), default=list, blank=True, editable=False)
+    image_status = models.CharField(
+        _('Статус изображения'),
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_READY,
+        editable=False
+    )
+    image_hash = models.CharField(_('Хэш изображения'), max_length=64, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем файл из БД, чтобы при повторной загрузке того же файла не перекодировать его
+        instance._loaded_image_name = instance.__dict__.get('image')
+        return instance
+
+    @property
+    def image_ready(self):
+        return self.image_status == self.IMAGE_READY
+
+    def _image_needs_processing(self):
+        if not self.image:
+            self.image_variants = []
+            self.image_hash = ''
+            self.image_status = self.IMAGE_READY
+            return False
+
+        # Файл уже в storage — изображение в этом сохранении не менялось
+        if self.image._committed:
+            return False
+
+        digest = file_hash(self.image)
+        loaded_name = getattr(self, '_loaded_image_name', None)
+        if loaded_name and digest == self.image_hash:
+            self.image = loaded_name
+            return False
+
+        self.image_hash = digest
+        self.image_variants = []
+        self.image_status = self.IMAGE_PENDING
+        return True
+
+    def save(self, *args, **kwargs):
+        needs_processing = self._image_needs_processing()
+        super().save(*args, **kwargs)
+        self._loaded_image_name = self.image.name if self.image else None
+        if needs_processing:
+            schedule_image_processing(self)
+
+    def process_image_file(self):
+        """Перекодирование оригинала и создание вариантов (вызывается фоновым обработчиком)"""
+        source_name = self.image.name
+        if self.image_max_size:
+            full_path, content = process_image(
+                self.image, self.image_upload_path, quality=self.image_quality, max_size=self.image_max_size
+            )
+            self.image.save(os.path.basename(full_path), content, save=False)
+        self.image_variants = generate_variants(self.image)
+        self.image_status = self.IMAGE_READY
+
+        # Обновляем только если файл не заменили, пока шла обработка
+        updated = type(self).objects.filter(pk=self.pk, image=source_name).update(
+            image=self.image.name,
+            image_variants=self.image_variants,
+            image_status=self.image_status,
+        )
+        if updated:
+            if self.image.name != source_name:
+                self.image.storage.delete(source_name)
+            self.image_processed()
+        return bool(updated)
+
+    def image_processed(self):
+        """
+        update() не отправляет post_save, поэтому после фоновой обработки
+        явно сбрасываем кэш страниц и обновляем updated_at (ключ кэша карточек)
+        """
+        page_cache.invalidate(self.page_cache_group)
+        if any(field.name == 'updated_at' for field in self._meta.concrete_fields):
+            type(self).objects.filter(pk=self.pk).update(updated_at=timezone.now())
+
+
+class ProductCategory(ProcessedImageModel):
     name = models.CharField(_('Название категории'), max_length=200)
     slug = models.SlugField(_('URL'), max_length=200, unique=True, blank=True)
     description = models.TextField(_('Описание'), blank=True)
@@ -54,6 +167,26 @@ class ProductCategory(models.Model):
     is_active = models.BooleanField(_('Активна'), default=True)
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+    # Сводка по активным товарам — пересчитывает main/category_stats.py
+    active_product_count = models.PositiveIntegerField(_('Активных товаров'), default=0, editable=False)
+    in_stock_count = models.PositiveIntegerField(_('В наличии'), default=0, editable=False)
+    min_price = models.DecimalField(
+        _('Мин. цена'), max_digits=10, decimal_places=2, null=True, blank=True, editable=False
+    )
+    max_price = models.DecimalField(
+        _('Макс. цена'), max_digits=10, decimal_places=2, null=True, blank=True, editable=False
+    )
+    cover_image = models.ForeignKey(
+        'ProductImage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name=_('Обложка'),
+    )
+
+    page_cache_group = page_cache.CATALOG
 
     class Meta:
         verbose_name = _('Категория товаров')
@@ -72,6 +205,18 @@ class ProductCategory(models.Model):
         return reverse('main:category_detail', kwargs={'slug': self.slug})
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_main_image(self):
+        """Подгружает изображения всех товаров одним запросом для main_image"""
+        return self.prefetch_related(
+            models.Prefetch(
+                'images',
+                queryset=ProductImage.objects.order_by('-is_main', 'order'),
+                to_attr='prefetched_images',
+            )
+        )
+
+
 class Product(models.Model):
     MATERIAL_CHOICES = [
         ('cotton', _('Хлопок')),
@@ -98,15 +243,49 @@ class Product(models.Model):
     is_featured = models.BooleanField(_('Рекомендуемый'), default=False)
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+    # Похожие товары по убыванию сходства, считаются заранее (main/similarity.py)
+    similar_ids = models.JSONField(_('Похожие товары'), default=list, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    page_cache_group = page_cache.CATALOG
 
     class Meta:
         verbose_name = _('Товар')
         verbose_name_plural = _('Товары')
         ordering = ['-created_at']
+        # Частичные индексы под списки активных товаров категории (сортировки из views.PRODUCT_ORDERINGS,
+        # фильтр и порядок идут по индексу) и под рекомендуемые на главной.
+        # Цена по убыванию на PostgreSQL — отдельный индекс в миграции 0011_listing_indexes
+        indexes = [
+            models.Index(
+                fields=['category', 'created_at', 'id'], name='product_active_created_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['category', 'price', 'id'], name='product_active_price_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['category', 'name', 'id'], name='product_active_name_idx',
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=['created_at'], name='product_featured_idx',
+                condition=models.Q(is_active=True, is_featured=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.size} - {self.color}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходная категория нужна для сброса счетчиков фасетов при переносе товара
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             base_slug = slugify(f"{self.name}-{self.size}-{self.color}")
@@ -118,22 +297,49 @@ class Product(models.Model):
 
     @property
     def main_image(self):
+        # Если изображения уже подгружены (with_main_image / prefetch_related('images')),
+        # выбираем главное без запросов к БД
+        images = getattr(self, 'prefetched_images', None)
+        if images is None and 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            images = list(self.images.all())
+        if images is not None:
+            return next((img for img in images if img.is_main), images[0] if images else None)
+
         main = self.images.filter(is_main=True).first()
         if main:
             return main
         return self.images.first()
 
+    def get_similar(self, limit=4):
+        """Похожие товары из готового списка соседей (одним запросом + фото)"""
+        products = Product.objects.filter(is_active=True).with_main_image()
+        if not self.similar_ids:
+            # Список еще не посчитан — прежнее поведение: товары той же категории
+            return list(products.filter(category_id=self.category_id).exclude(id=self.id)[:limit])
+        by_id = {p.id: p for p in products.filter(id__in=self.similar_ids[:limit * 2])}
+        return [by_id[pk] for pk in self.similar_ids if pk in by_id][:limit]
+
+    async def aget_similar(self, limit=4):
+        """get_similar для async view (main/async_views.py)"""
+        products = Product.objects.filter(is_active=True).with_main_image()
+        if not self.similar_ids:
+            return [p async for p in products.filter(category_id=self.category_id).exclude(id=self.id)[:limit]]
+        by_id = {p.id: p async for p in products.filter(id__in=self.similar_ids[:limit * 2])}
+        return [by_id[pk] for pk in self.similar_ids if pk in by_id][:limit]
+
     @property
     def in_stock(self):
         return self.stock > 0
 
 
-class ProductImage(models.Model):
+class ProductImage(ProcessedImageModel):
     product = models.ForeignKey(
         Product,
         on_delete=models.CASCADE,
         related_name='images',
-        verbose_name=_('Товар')
+        verbose_name=_('Товар'),
+        # Поиск по товару покрывает productimage_order_idx (product, order, is_main)
+        db_index=False,
     )
     image = models.ImageField(
         _('Изображение'),
@@ -144,10 +350,20 @@ class ProductImage(models.Model):
     order = models.PositiveIntegerField(_('Порядок'), default=0)
     created_at = models.DateTimeField(_('Дата загрузки'), auto_now_add=True)
 
+    image_upload_path = 'products/'
+    image_quality = 85
+    image_max_size = (1200, 1200)
+    page_cache_group = page_cache.CATALOG
+
     class Meta:
         verbose_name = _('Изображение товара')
         verbose_name_plural = _('Изображения товаров')
         ordering = ['order', '-is_main']
+        indexes = [
+            # Фото товара в порядке Meta.ordering без сортировки; по нему же ищется главное фото
+            # (с отдельным индексом (product, is_main) планировщик все равно выбирает этот)
+            models.Index(fields=['product', 'order', '-is_main'], name='productimage_order_idx'),
+        ]
 
     def __str__(self):
         return f"Изображение для {self.product.name}"
@@ -156,15 +372,18 @@ class ProductImage(models.Model):
         if self.is_main:
             ProductImage.objects.filter(product=self.product, is_main=True).update(is_main=False)
 
-        if self.image:
-            upload_path = 'products/'
-            full_path, content = process_image(self.image, upload_path, quality=85, max_size=(1200, 1200))
-            self.image.save(os.path.basename(full_path), content, save=False)
-
         super().save(*args, **kwargs)
 
+    def touch_product(self):
+        """Обновляет updated_at товара — от него зависят ключи кэша карточек"""
+        Product.objects.filter(pk=self.product_id).update(updated_at=timezone.now())
+
+    def image_processed(self):
+        super().image_processed()
+        self.touch_product()
+
 
-class BlogPost(models.Model):
+class BlogPost(ProcessedImageModel):
     title = models.CharField(_('Заголовок'), max_length=200)
     slug = models.SlugField(_('URL'), max_length=200, unique=True, blank=True)
     excerpt = models.TextField(_('Краткое описание'), max_length=500, blank=True)
@@ -181,11 +400,25 @@ class BlogPost(models.Model):
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
     published_at = models.DateTimeField(_('Дата публикации'), blank=True, null=True)
+    # Частоты слов для похожих статей (main/related_posts.py)
+    term_counts = models.JSONField(default=dict, blank=True, editable=False)
+
+    image_upload_path = 'blog/'
+    image_quality = 80
+    image_max_size = (1200, 800)
+    page_cache_group = page_cache.BLOG
 
     class Meta:
         verbose_name = _('Статья блога')
         verbose_name_plural = _('Статьи блога')
         ordering = ['-published_at', '-created_at']
+        indexes = [
+            # Опубликованные статьи по дате (главная, список блога)
+            models.Index(
+                fields=['published_at', 'created_at', 'id'], name='blogpost_published_idx',
+                condition=models.Q(is_published=True),
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -195,15 +428,92 @@ class BlogPost(models.Model):
             self.slug = slugify(self.title)
 
         if self.is_published and not self.published_at:
-            from django.utils import timezone
             self.published_at = timezone.now()
 
-        if self.image:
-            upload_path = 'blog/'
-            full_path, content = process_image(self.image, upload_path, quality=80, max_size=(1200, 800))
-            self.image.save(os.path.basename(full_path), content, save=False)
-
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('main:blog_detail', kwargs={'slug': self.slug})
+
+    def get_related(self, limit=3):
+        """Похожие статьи из готовой таблицы RelatedPost (один запрос)"""
+        related = list(
+            BlogPost.objects.filter(backlinks__post=self, is_published=True).order_by('backlinks__rank')[:limit]
+        )
+        if related:
+            return related
+        # Таблица еще не посчитана — прежнее поведение: последние статьи
+        return list(BlogPost.objects.filter(is_published=True).exclude(id=self.id)[:limit])
+
+    async def aget_related(self, limit=3):
+        """get_related для async view (main/async_views.py)"""
+        related = BlogPost.objects.filter(backlinks__post=self, is_published=True).order_by('backlinks__rank')
+        related = [post async for post in related[:limit]]
+        if related:
+            return related
+        return [post async for post in BlogPost.objects.filter(is_published=True).exclude(id=self.id)[:limit]]
+
+
+class RelatedPost(models.Model):
+    """Ближайшие по содержанию статьи (TF-IDF), rank 0 — самая похожая"""
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='backlinks')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'rank'], name='unique_related_post_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id} ({self.score:.3f})'
+
+
+class ContactMessage(models.Model):
+    """
+    Заявка с контактной формы (outbox для уведомлений в Telegram).
+    Форма только сохраняет заявку, доставку выполняет команда send_contact_notifications.
+    """
+    TYPE_CHOICES = [
+        ('general', _('Общий вопрос')),
+        ('wholesale', _('Оптовый заказ')),
+        ('cooperation', _('Сотрудничество')),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Ожидает отправки')),
+        (STATUS_SENT, _('Отправлено')),
+        (STATUS_FAILED, _('Ошибка отправки')),
+    ]
+
+    contact_type = models.CharField(_('Тип обращения'), max_length=20, choices=TYPE_CHOICES, default='general')
+    name = models.CharField(_('Имя'), max_length=100)
+    phone = models.CharField(_('Телефон'), max_length=30)
+    email = models.EmailField(_('Email'), max_length=150)
+    company = models.CharField(_('Компания'), max_length=200, blank=True)
+    subject = models.CharField(_('Тема'), max_length=200)
+    message = models.TextField(_('Сообщение'), max_length=500)
+    ip_address = models.CharField(_('IP'), max_length=45, blank=True)
+
+    status = models.CharField(_('Статус'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(_('Попыток отправки'), default=0)
+    next_attempt_at = models.DateTimeField(_('Следующая попытка'), default=timezone.now)
+    last_error = models.TextField(_('Последняя ошибка'), blank=True)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('Дата отправки'), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('Заявка с сайта')
+        verbose_name_plural = _('Заявки с сайта')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='contact_outbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} — {self.subject}'
@@ -0,0 +1,223 @@
+"""
+Доставка заявок с контактной формы в Telegram.
+
+Форма только сохраняет заявку в таблицу ContactMessage (outbox), отправку выполняет
+команда send_contact_notifications через общую HTTP-сессию (keep-alive соединения).
+Ошибки сети и API — повтор с экспоненциальной задержкой, 429 — пауза на retry_after из ответа.
+При всплеске (от CONTACT_DIGEST_THRESHOLD заявок в очереди) заявки уходят сводными сообщениями.
+"""
+import html
+import logging
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ContactMessage
+
+logger = logging.getLogger(__name__)
+
+TYPE_LABELS = {
+    'general': '❓ Общий вопрос',
+    'wholesale': '📦 Оптовый заказ',
+    'cooperation': '🤝 Сотрудничество',
+}
+
+# Ограничение Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+# Задержка перед повтором: 30 с, 1 мин, 2 мин ... но не больше часа
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+
+# Сколько держать заявку за воркером, пока он ее отправляет (защита от двойной отправки)
+CLAIM_TIMEOUT = 5 * 60
+
+
+class TelegramError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """Отправка сообщений через Bot API с переиспользованием соединений"""
+
+    def __init__(self, token=None, chat_id=None, api_url=None, timeout=10):
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.chat_id = chat_id or settings.TELEGRAM_CHAT_ID
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def configured(self):
+        return bool(self.token and self.chat_id)
+
+    def send_message(self, text):
+        try:
+            response = self.session.post(
+                f'{self.api_url}/bot{self.token}/sendMessage',
+                data={'chat_id': self.chat_id, 'text': text, 'parse_mode': 'HTML'},
+                timeout=self.timeout,
+            )
+        except requests.exceptions.RequestException as e:
+            raise TelegramError(f'Ошибка соединения с Telegram: {e}')
+
+        if response.status_code == 200:
+            return
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        retry_after = None
+        if response.status_code == 429:
+            retry_after = (payload.get('parameters') or {}).get('retry_after') or BACKOFF_BASE
+        raise TelegramError(
+            f'Telegram API вернул ошибку {response.status_code}: {payload.get("description", "")}',
+            retry_after=retry_after,
+        )
+
+    def close(self):
+        self.session.close()
+
+
+def format_message(contact):
+    """Сообщение об одной заявке (HTML, пользовательский ввод экранирован)"""
+    company = html.escape(contact.company) if contact.company else 'Не указана'
+    return f"""
+🆕 <b>Новое сообщение с сайта HomeTerry</b>
+
+📋 <b>Тип обращения:</b> {TYPE_LABELS.get(contact.contact_type, TYPE_LABELS['general'])}
+━━━━━━━━━━━━━━━━━━━━
+
+👤 <b>Имя:</b> {html.escape(contact.name)}
+📱 <b>Телефон:</b> <code>{html.escape(contact.phone)}</code>
+📧 <b>Email:</b> {html.escape(contact.email)}
+🏢 <b>Компания:</b> {company}
+
+📌 <b>Тема:</b> {html.escape(contact.subject)}
+
+💬 <b>Сообщение:</b>
+{html.escape(contact.message)}
+
+━━━━━━━━━━━━━━━━━━━━
+🌐 IP: {html.escape(contact.ip_address) or '—'}
+"""
+
+
+def _digest_entry(contact):
+    return (
+        f'{TYPE_LABELS.get(contact.contact_type, TYPE_LABELS["general"])} '
+        f'<b>{html.escape(contact.name)}</b>, <code>{html.escape(contact.phone)}</code>, '
+        f'{html.escape(contact.email)}\n'
+        f'📌 {html.escape(contact.subject)}\n'
+        f'💬 {html.escape(contact.message)}'
+    )
+
+
+def format_digests(contacts):
+    """Сводные сообщения: [(заявки, текст), ...], каждое не длиннее MESSAGE_LIMIT"""
+    digests = []
+    batch, entries = [], []
+    for contact in contacts:
+        entry = _digest_entry(contact)
+        if batch and len(_digest_text(entries + [entry])) > MESSAGE_LIMIT:
+            digests.append((batch, _digest_text(entries)))
+            batch, entries = [], []
+        batch.append(contact)
+        entries.append(entry)
+    if batch:
+        digests.append((batch, _digest_text(entries)))
+    return digests
+
+
+def _digest_text(entries):
+    header = f'🆕 <b>Новые сообщения с сайта HomeTerry: {len(entries)}</b>\n━━━━━━━━━━━━━━━━━━━━\n\n'
+    return header + '\n\n'.join(entries)
+
+
+def backoff_delay(attempts):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def _claim_due(limit):
+    """Забирает готовые к отправке заявки, откладывая их на CLAIM_TIMEOUT для других воркеров"""
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(
+            ContactMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=ContactMessage.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('created_at')[:limit]
+        )
+        ContactMessage.objects.filter(pk__in=[c.pk for c in due]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT)
+        )
+    return due
+
+
+def _mark_sent(contacts):
+    for contact in contacts:
+        ContactMessage.objects.filter(pk=contact.pk).update(
+            status=ContactMessage.STATUS_SENT,
+            attempts=contact.attempts + 1,
+            sent_at=timezone.now(),
+            last_error='',
+        )
+
+
+def _mark_failed(contacts, error):
+    now = timezone.now()
+    for contact in contacts:
+        attempts = contact.attempts + 1
+        gave_up = attempts >= settings.CONTACT_MAX_ATTEMPTS
+        ContactMessage.objects.filter(pk=contact.pk).update(
+            status=ContactMessage.STATUS_FAILED if gave_up else ContactMessage.STATUS_PENDING,
+            attempts=attempts,
+            next_attempt_at=now + timedelta(seconds=backoff_delay(attempts)),
+            last_error=str(error),
+        )
+
+
+def _postpone(contacts, seconds):
+    ContactMessage.objects.filter(pk__in=[c.pk for c in contacts]).update(
+        next_attempt_at=timezone.now() + timedelta(seconds=seconds)
+    )
+
+
+def deliver_pending(client=None, limit=100):
+    """Отправляет заявки из очереди; возвращает количество доставленных"""
+    client = client or TelegramClient()
+    if not client.configured:
+        logger.warning('Telegram бот не настроен (TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID), заявки ждут в очереди')
+        return 0
+
+    due = _claim_due(limit)
+    threshold = settings.CONTACT_DIGEST_THRESHOLD
+    if threshold and len(due) >= threshold:
+        units = format_digests(due)
+    else:
+        units = [([contact], format_message(contact)) for contact in due]
+
+    sent = 0
+    for index, (contacts, text) in enumerate(units):
+        try:
+            client.send_message(text)
+        except TelegramError as e:
+            if e.retry_after:
+                # Лимит Telegram: откладываем эту и все оставшиеся заявки, попытка не засчитывается
+                logger.warning('Telegram просит подождать %s с', e.retry_after)
+                _postpone([c for batch, _ in units[index:] for c in batch], e.retry_after)
+                break
+            logger.error('Ошибка отправки заявок %s в Telegram: %s', [c.pk for c in contacts], e)
+            _mark_failed(contacts, e)
+            continue
+        _mark_sent(contacts)
+        sent += len(contacts)
+    return sent
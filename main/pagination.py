@@ -0,0 +1,143 @@
+"""
+Keyset-пагинация (по курсору) для каталога и блога.
+
+Количество строк (один COUNT) кэшируется до изменения данных. Страница N выбирается
+условием «после ключа ближайшей известной строки перед ней» и LIMIT/OFFSET от этой строки;
+ключи последних строк уже выбранных страниц (якоря) кэшируются вместе с количеством.
+Поэтому переход на соседнюю страницу — без OFFSET, а дальний — OFFSET от ближайшего якоря
+или, если ближе к концу, от конца списка в обратном порядке. Ключи всех строк в память
+не загружаются; нумерованные ссылки ?page=N работают как раньше.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+from . import cache as page_cache
+
+KEYSET_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько якорей хранить на один список (категория + фильтры + сортировка)
+MAX_ANCHORS = 500
+
+
+def _order_expressions(ordering, model, reverse=False):
+    # NULL всегда в конце (цена и дата публикации могут быть пустыми), в обратном порядке — в начале.
+    # У NOT NULL полей NULLS LAST не пишем: с ним ни SQLite, ни PostgreSQL не берут порядок из обычного индекса
+    expressions = []
+    for field in ordering:
+        name = field.lstrip('-')
+        nullable = model._meta.get_field(name).null or None
+        descending = field.startswith('-') != reverse
+        nulls = {'nulls_first': nullable} if reverse else {'nulls_last': nullable}
+        expressions.append(F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+    return expressions
+
+
+def _after(field, descending, value):
+    """Строки, идущие после value по одному полю (с учетом NULLS LAST)"""
+    if value is None:
+        return Q(pk__in=[])
+    lookup = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{lookup}': value}) | Q(**{f'{field}__isnull': True})
+
+
+def _before(field, descending, value):
+    """Строки, идущие перед value по одному полю (с учетом NULLS LAST)"""
+    if value is None:
+        return Q(**{f'{field}__isnull': False})
+    lookup = 'gt' if descending else 'lt'
+    return Q(**{f'{field}__{lookup}': value})
+
+
+def keyset_condition(ordering, values, before=False):
+    """
+    Лексикографическое условие (f1, f2, ..., id) > (v1, v2, ..., id) в порядке сортировки;
+    before=True — строки перед ключом (для чтения в обратном порядке)
+    """
+    step = _before if before else _after
+    condition = Q(pk__in=[])
+    equal = Q()
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        condition |= equal & step(name, descending, value)
+        equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+    return condition
+
+
+class KeysetPaginator(Paginator):
+    """
+    ordering — поля сортировки, последним должно идти уникальное поле (id).
+    cache_key — что отличает этот список (категория, сортировка, фильтры),
+    cache_groups — группы кэша страниц, при сбросе которых количество и якоря пересчитываются.
+    """
+
+    def __init__(self, object_list, per_page, ordering, cache_key, cache_groups=()):
+        self.ordering = list(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.cache_key = cache_key
+        self.cache_groups = cache_groups
+        super().__init__(object_list.order_by(*_order_expressions(self.ordering, object_list.model)), per_page)
+
+    def _full_cache_key(self, kind):
+        versions = '.'.join(str(v) for v in page_cache.get_versions(self.cache_groups))
+        raw = f'{self.cache_key}|{self.ordering}|{self.per_page}|{versions}'
+        return f'keyset:{kind}:' + hashlib.md5(raw.encode()).hexdigest()
+
+    @cached_property
+    def reversed_list(self):
+        """Тот же список в обратном порядке — для страниц ближе к концу"""
+        return self.object_list.order_by(*_order_expressions(self.ordering, self.object_list.model, reverse=True))
+
+    @cached_property
+    def count(self):
+        key = self._full_cache_key('count')
+        value = cache.get(key)
+        if value is None:
+            value = self.object_list.prefetch_related(None).order_by().count()
+            cache.set(key, value, KEYSET_CACHE_TIMEOUT)
+        return value
+
+    def _key(self, obj):
+        return tuple(getattr(obj, field) for field in self.fields)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        offset = (number - 1) * self.per_page
+        size = min(self.per_page, self.count - offset)
+        end = offset + size
+        key = self._full_cache_key('anchors')
+        # {номер строки: ключ сортировки}; начало и конец списка — без ключа
+        anchors = cache.get(key) or {}
+        start, start_key = max(((i, k) for i, k in anchors.items() if i < offset), default=(-1, None))
+        stop, stop_key = min(((i, k) for i, k in anchors.items() if i >= end), default=(self.count, None))
+
+        # Читаем от ближайшего якоря; лишняя строка перед страницей дает якорь для предыдущей
+        extra = 1 if offset else 0
+        if stop - end < offset - start - 1:
+            queryset = self.reversed_list
+            if stop_key is not None:
+                queryset = queryset.filter(keyset_condition(self.ordering, stop_key, before=True))
+            skip = stop - end
+            rows = list(queryset[skip:skip + size + extra])[::-1]
+        else:
+            queryset = self.object_list
+            if start_key is not None:
+                queryset = queryset.filter(keyset_condition(self.ordering, start_key))
+            skip = offset - start - 1
+            rows = list(queryset[max(skip - extra, 0):skip + size])
+
+        new = {}
+        if len(rows) > size:
+            new[offset - 1] = self._key(rows.pop(0))
+        if rows:
+            # Первая строка — якорь для чтения предыдущей страницы с конца
+            new[offset] = self._key(rows[0])
+            new[offset + len(rows) - 1] = self._key(rows[-1])
+        new = {i: k for i, k in new.items() if i not in anchors}
+        if new and len(anchors) < MAX_ANCHORS:
+            cache.set(key, {**anchors, **new}, KEYSET_CACHE_TIMEOUT)
+        return self._get_page(rows, number, self)
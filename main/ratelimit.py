@@ -0,0 +1,111 @@
+"""
+Ограничение частоты запросов (rate limiting).
+
+Счетчики хранятся в общем кэше (CACHES['default']) и меняются только атомарными
+cache.add/cache.incr/cache.decr, поэтому лимит соблюдается и при параллельных запросах,
+и между gunicorn-воркерами — если кэш общий (Redis/Memcached через CACHE_URL;
+LocMemCache ограничивает каждый процесс отдельно).
+
+Правила задаются в settings.RATE_LIMITS, см. RateLimitMiddleware.
+"""
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .utils import get_client_ip
+
+
+class SlidingWindowLimiter:
+    """
+    Скользящее окно по двум счетчикам: текущего и предыдущего окна.
+    Число запросов за последние window секунд оценивается как
+    текущий + предыдущий * (доля предыдущего окна, попадающая в интервал).
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def _key(self, name, ident, index):
+        return f'ratelimit:{name}:{ident}:{index}'
+
+    def _incr(self, key):
+        # add не перезаписывает существующий счетчик; incr атомарен в Redis, Memcached и LocMemCache
+        cache.add(key, 0, self.window * 2)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Ключ вытеснен между add и incr
+            cache.add(key, 1, self.window * 2)
+            return 1
+
+    def _release(self, key):
+        # Отклоненный запрос не расходует лимит — иначе Retry-After оказался бы неверным
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+    def hit(self, name, ident, now=None):
+        """Учитывает запрос; возвращает 0, если он разрешен, иначе секунды до следующей попытки"""
+        now = time.time() if now is None else now
+        index, offset = divmod(now, self.window)
+        index = int(index)
+
+        key = self._key(name, ident, index)
+        current = self._incr(key)
+        if current > self.limit:
+            self._release(key)
+            return max(1, math.ceil(self.window - offset))
+
+        previous = cache.get(self._key(name, ident, index - 1), 0)
+        weight = 1 - offset / self.window
+        if previous * weight + current <= self.limit:
+            return 0
+        self._release(key)
+        # Ждем, пока доля предыдущего окна уменьшится настолько, чтобы запрос уложился в лимит
+        allowed_weight = (self.limit - current) / previous
+        return max(1, math.ceil(round((1 - allowed_weight) * self.window - offset, 6)))
+
+
+class FixedWindowLimiter(SlidingWindowLimiter):
+    """Фиксированное окно: один счетчик, сбрасывается в начале каждого окна"""
+
+    def hit(self, name, ident, now=None):
+        now = time.time() if now is None else now
+        index, offset = divmod(now, self.window)
+        key = self._key(name, ident, int(index))
+        if self._incr(key) > self.limit:
+            self._release(key)
+            return max(1, math.ceil(self.window - offset))
+        return 0
+
+
+DEFAULT_LIMITER = 'main.ratelimit.SlidingWindowLimiter'
+
+
+class Rule:
+    """Одно правило из settings.RATE_LIMITS"""
+
+    def __init__(self, name, path, limit, window, methods=None, limiter=DEFAULT_LIMITER, message=None):
+        self.name = name
+        self.path = re.compile(path)
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.limiter = import_string(limiter)(limit, window)
+        self.message = message
+
+    def matches(self, request):
+        if self.methods and request.method not in self.methods:
+            return False
+        return bool(self.path.match(request.path_info))
+
+    def hit(self, request):
+        return self.limiter.hit(self.name, get_client_ip(request))
+
+
+def load_rules():
+    return [Rule(**options) for options in getattr(settings, 'RATE_LIMITS', [])]
@@ -0,0 +1,196 @@
+"""
+Похожие статьи блога («Читайте также») по TF-IDF.
+
+Для каждой опубликованной статьи хранятся частоты слов (BlogPost.term_counts: заголовок
+с весом 3, краткое описание — 2, текст — 1) и таблица RelatedPost с RELATED_COUNT
+ближайшими статьями по косинусной близости TF-IDF векторов.
+При сохранении статьи пересчитываются ее список и списки, в которые она входит или может войти;
+страница статьи читает готовый список одним запросом. Полная пересборка (с пересчетом IDF) —
+команда build_related_posts.
+"""
+import math
+import re
+from collections import Counter
+
+from django.db import transaction
+
+from . import cache as page_cache
+
+RELATED_COUNT = 6
+
+FIELD_WEIGHTS = (('title', 3), ('excerpt', 2), ('content', 1))
+
+WORD_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-яё]')
+# Узбекские o‘/g‘ пишут разными апострофами — убираем, чтобы слово не распадалось
+APOSTROPHES_RE = re.compile(r"[ʻʼ‘’'`]")
+
+STOP_WORDS = {
+    # ru
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так', 'его',
+    'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от',
+    'меня', 'еще', 'нет', 'о', 'из', 'ему', 'для', 'это', 'этот', 'эти', 'при', 'или', 'их', 'мы', 'также',
+    'чтобы', 'если', 'уже', 'может', 'можно', 'они', 'быть', 'есть', 'был', 'так', 'более', 'очень', 'ваш',
+    # en
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'is', 'are', 'was', 'be', 'it',
+    'this', 'that', 'as', 'at', 'by', 'from', 'your', 'you', 'our', 'we', 'can', 'how', 'what', 'not',
+    # uz
+    'va', 'bu', 'uchun', 'bilan', 'ham', 'emas', 'bir', 'u', 'biz', 'siz', 'yoki', 'lekin', 'esa', 'eng',
+    'har', 'shu', 'bo', 'lib', 'ni', 'da', 'dan',
+}
+
+# Окончания для грубого стемминга, от длинных к коротким
+RU_ENDINGS = (
+    'иями', 'ями', 'ами', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их', 'ой', 'ей', 'ий',
+    'ый', 'ая', 'яя', 'ое', 'ее', 'ую', 'юю', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ию', 'ия',
+    'ие', 'ье', 'ы', 'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь',
+)
+LATIN_ENDINGS = (
+    # uz
+    'larning', 'lardan', 'larda', 'larga', 'larni', 'lari', 'ning', 'dagi', 'lar', 'dan', 'da', 'ga', 'ni',
+    # en
+    'ing', 'ies', 'ed', 'es', 's',
+)
+MIN_STEM = 3
+
+
+def stem(word):
+    endings = RU_ENDINGS if CYRILLIC_RE.search(word) else LATIN_ENDINGS
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    words = WORD_RE.findall(APOSTROPHES_RE.sub('', (text or '').lower()))
+    return [stem(word) for word in words if word not in STOP_WORDS and len(word) > 1]
+
+
+def term_counts(post):
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(post, field)):
+            counts[term] += weight
+    return dict(counts)
+
+
+def _vectors(rows):
+    """{id: нормированный TF-IDF вектор} по частотам слов всех статей"""
+    document_frequency = Counter()
+    for counts in rows.values():
+        document_frequency.update(counts.keys())
+    total = len(rows)
+    idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+    vectors = {}
+    for pk, counts in rows.items():
+        vector = {term: (1 + math.log(count)) * idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        vectors[pk] = {term: value / norm for term, value in vector.items()}
+    return vectors
+
+
+def similarity(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(term, 0.0) for term, value in a.items())
+
+
+def _top(pk, vectors):
+    vector = vectors[pk]
+    scored = [
+        (similarity(vector, other), other_pk)
+        for other_pk, other in vectors.items()
+        if other_pk != pk
+    ]
+    scored = [(score, other_pk) for score, other_pk in scored if score > 0]
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+    return scored[:RELATED_COUNT]
+
+
+def _published_terms():
+    from .models import BlogPost
+
+    return dict(BlogPost.objects.filter(is_published=True).order_by().values_list('id', 'term_counts'))
+
+
+def _current_lists():
+    from .models import RelatedPost
+
+    lists = {}
+    for post_id, related_id, score in RelatedPost.objects.order_by('post_id', 'rank').values_list(
+        'post_id', 'related_id', 'score'
+    ):
+        lists.setdefault(post_id, []).append((score, related_id))
+    return lists
+
+
+def _replace(lists):
+    """Записывает списки {id статьи: [(score, id похожей), ...]}"""
+    from .models import RelatedPost
+
+    if not lists:
+        return
+    RelatedPost.objects.filter(post_id__in=lists.keys()).delete()
+    RelatedPost.objects.bulk_create([
+        RelatedPost(post_id=pk, related_id=related_id, rank=rank, score=score)
+        for pk, top in lists.items()
+        for rank, (score, related_id) in enumerate(top)
+    ])
+    page_cache.invalidate(page_cache.BLOG)
+
+
+def _update_terms(post_ids):
+    from .models import BlogPost
+
+    for post in BlogPost.objects.filter(pk__in=post_ids).only('title', 'excerpt', 'content'):
+        BlogPost.objects.filter(pk=post.pk).update(term_counts=term_counts(post))
+
+
+def rebuild():
+    """Пересчитывает частоты слов и списки всех статей; возвращает число статей"""
+    from .models import BlogPost, RelatedPost
+
+    with transaction.atomic():
+        _update_terms(BlogPost.objects.values_list('pk', flat=True))
+        vectors = _vectors(_published_terms())
+        RelatedPost.objects.all().delete()
+        _replace({pk: _top(pk, vectors) for pk in vectors})
+    return len(vectors)
+
+
+def refresh(post_id):
+    """
+    Пересчет после сохранения или удаления статьи: ее собственный список и списки статей,
+    в которых она была или в которые теперь может войти. Веса IDF остальных пар
+    обновятся при следующей полной пересборке.
+    """
+    from .models import RelatedPost
+
+    with transaction.atomic():
+        _update_terms([post_id])
+        rows = _published_terms()
+        # Статьи, еще не попавшие в индекс (например, созданные до него), индексируем заодно
+        missing = [pk for pk, counts in rows.items() if not counts and pk != post_id]
+        if missing:
+            _update_terms(missing)
+            rows = _published_terms()
+        vectors = _vectors(rows)
+        lists = _current_lists()
+        changed = vectors.get(post_id)
+        if changed is None:
+            RelatedPost.objects.filter(post_id=post_id).delete()
+
+        stale = {}
+        for pk, vector in vectors.items():
+            current = lists.get(pk, [])
+            if pk == post_id or len(current) < RELATED_COUNT or post_id in {related for _, related in current}:
+                stale[pk] = _top(pk, vectors)
+            elif changed is not None and similarity(vector, changed) >= current[-1][0]:
+                stale[pk] = _top(pk, vectors)
+        _replace(stale)
+
+
+def schedule_refresh(post_id):
+    transaction.on_commit(lambda: refresh(post_id))
@@ -0,0 +1,214 @@
+"""
+Полнотекстовый поиск по блогу.
+
+PostgreSQL: колонка main_blogpost.search_vector (tsvector, GIN-индекс),
+словари russian + english + simple (узбекский — без стемминга).
+SQLite (локальная разработка): виртуальная таблица FTS5 main_blogpost_fts.
+Остальные БД: поиск через icontains.
+Структуры создаются миграцией 0007_blog_search_index, пересборка — rebuild_search_index.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.safestring import mark_safe
+
+# Маркеры подсветки: заменяются на <mark> после экранирования текста
+HL_START = '\x02'
+HL_STOP = '\x03'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _highlight_html(text):
+    escaped = html.escape(text or '')
+    return mark_safe(escaped.replace(HL_START, '<mark>').replace(HL_STOP, '</mark>'))
+
+
+class PostgresSearchBackend:
+    """tsvector + GIN: ранжирование ts_rank_cd, подсветка ts_headline"""
+
+    VECTOR_SQL = """
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(excerpt, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(content, '')), 'C') ||
+        setweight(to_tsvector('english',
+            coalesce(title, '') || ' ' || coalesce(excerpt, '') || ' ' || coalesce(content, '')), 'D') ||
+        setweight(to_tsvector('simple',
+            coalesce(title, '') || ' ' || coalesce(excerpt, '') || ' ' || coalesce(content, '')), 'D')
+    """
+    QUERY_SQL = """(
+        websearch_to_tsquery('russian', %s) ||
+        websearch_to_tsquery('english', %s) ||
+        websearch_to_tsquery('simple', %s)
+    )"""
+
+    def update(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE main_blogpost SET search_vector = {self.VECTOR_SQL} WHERE id = ANY(%s)',
+                [list(post_ids)],
+            )
+
+    def remove(self, post_ids):
+        # Строка удаляется вместе с вектором
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE main_blogpost SET search_vector = {self.VECTOR_SQL}')
+            return cursor.rowcount
+
+    def search(self, query):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT id FROM main_blogpost, {self.QUERY_SQL} AS query
+                WHERE is_published AND search_vector @@ query
+                ORDER BY ts_rank_cd(search_vector, query) DESC, published_at DESC NULLS LAST
+                """,
+                [query] * 3,
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def snippets(self, post_ids, query):
+        if not post_ids:
+            return {}
+        options = f'StartSel={HL_START}, StopSel={HL_STOP}, MaxFragments=2, MaxWords=30, MinWords=10'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT id, ts_headline('russian', coalesce(nullif(excerpt, ''), content), query, %s)
+                FROM main_blogpost, {self.QUERY_SQL} AS query
+                WHERE id = ANY(%s)
+                """,
+                [options, query, query, query, list(post_ids)],
+            )
+            return dict(cursor.fetchall())
+
+
+class SQLiteSearchBackend:
+    """FTS5 с porter/unicode61 для локальной разработки; ранжирование bm25"""
+
+    def _match_expression(self, query):
+        # Экранируем ввод пользователя: каждое слово — отдельная фраза с поиском по префиксу.
+        # Для длинных слов отбрасываем окончание — грубая замена стемминга для ru/uz
+        terms = []
+        for word in WORD_RE.findall(query.lower()):
+            stem = word[:-2] if len(word) > 5 else word
+            terms.append(f'"{stem}"*')
+        return ' '.join(terms)
+
+    def update(self, post_ids):
+        post_ids = list(post_ids)
+        with connection.cursor() as cursor:
+            self._delete(cursor, post_ids)
+            placeholders = ', '.join(['%s'] * len(post_ids))
+            cursor.execute(
+                f"""
+                INSERT INTO main_blogpost_fts(rowid, title, excerpt, content)
+                SELECT id, title, excerpt, content FROM main_blogpost WHERE id IN ({placeholders})
+                """,
+                post_ids,
+            )
+
+    def _delete(self, cursor, post_ids):
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(f'DELETE FROM main_blogpost_fts WHERE rowid IN ({placeholders})', post_ids)
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            self._delete(cursor, list(post_ids))
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM main_blogpost_fts')
+            cursor.execute(
+                'INSERT INTO main_blogpost_fts(rowid, title, excerpt, content) '
+                'SELECT id, title, excerpt, content FROM main_blogpost'
+            )
+            return cursor.rowcount
+
+    def search(self, query):
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT p.id FROM main_blogpost_fts f
+                JOIN main_blogpost p ON p.id = f.rowid
+                WHERE main_blogpost_fts MATCH %s AND p.is_published
+                ORDER BY bm25(main_blogpost_fts, 10.0, 5.0, 1.0), p.published_at DESC
+                """,
+                [expression],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def snippets(self, post_ids, query):
+        expression = self._match_expression(query)
+        if not post_ids or not expression:
+            return {}
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT rowid, snippet(main_blogpost_fts, -1, %s, %s, '…', 24)
+                FROM main_blogpost_fts
+                WHERE main_blogpost_fts MATCH %s AND rowid IN ({placeholders})
+                """,
+                [HL_START, HL_STOP, expression, *post_ids],
+            )
+            return dict(cursor.fetchall())
+
+
+class FallbackSearchBackend:
+    """Прочие БД: прежний поиск через icontains, без ранжирования"""
+
+    def update(self, post_ids):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def search(self, query):
+        from .models import BlogPost
+
+        posts = BlogPost.objects.filter(is_published=True).filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(excerpt__icontains=query)
+        )
+        return list(posts.values_list('id', flat=True))
+
+    def snippets(self, post_ids, query):
+        return {}
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)()
+
+
+def search_posts(query):
+    """id опубликованных статей, отсортированные по релевантности"""
+    return get_backend().search(query)
+
+
+def attach_snippets(posts, query):
+    """Проставляет post.search_snippet (безопасный HTML с <mark>) для статей страницы"""
+    posts = list(posts)
+    snippets = get_backend().snippets([post.id for post in posts], query)
+    for post in posts:
+        snippet = snippets.get(post.id)
+        post.search_snippet = _highlight_html(snippet) if snippet else ''
+    return posts
@@ -0,0 +1,145 @@
+"""
+Сброс кэшей (страницы, карточки, фасеты), обновление поискового индекса блога,
+сводок категорий и пометка устаревших разделов sitemap.
+Массовые изменения без сигналов (импорт, генерация, восстановление копии) вызывают
+after_bulk_changes — то же самое один раз на всю операцию.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache as page_cache
+from . import category_stats
+from . import facets
+from . import related_posts
+from . import search
+from . import similarity
+from . import sitemap_files
+from .models import Product, ProductCategory, ProductImage, BlogPost
+
+# Модель -> раздел sitemap (main/sitemaps.SITEMAPS)
+SITEMAP_SECTIONS = {
+    Product: 'products',
+    ProductCategory: 'categories',
+    BlogPost: 'blog',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_page_cache(sender, **kwargs):
+    group = getattr(sender, 'page_cache_group', None)
+    if group:
+        # После коммита: запрос, пришедший во время транзакции, закэшировал бы старую страницу
+        # под новой версией и отдавал ее до PAGE_CACHE_TIMEOUT
+        transaction.on_commit(lambda: page_cache.invalidate(group))
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product(sender, instance, **kwargs):
+    # Карточка товара кэшируется по updated_at — новое фото должно ее сбросить
+    instance.touch_product()
+
+
+@receiver(post_save, sender=BlogPost)
+def update_search_index(sender, instance, **kwargs):
+    search.get_backend().update([instance.pk])
+
+
+@receiver(post_delete, sender=BlogPost)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=BlogPost)
+def refresh_related_posts(sender, instance, **kwargs):
+    related_posts.schedule_refresh(instance.pk)
+
+
+def _cascade_delete(kwargs, *models):
+    # Удаление каскадом от категории/товара: сводку пересчитает обработчик самого объекта
+    return isinstance(kwargs.get('origin'), models)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_category_stats(sender, instance, **kwargs):
+    # До invalidate_facet_counts: ему нужна прежняя категория товара
+    if not _cascade_delete(kwargs, ProductCategory):
+        category_stats.refresh({instance.category_id, getattr(instance, '_loaded_category_id', None)})
+
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_similar_products(sender, instance, **kwargs):
+    # Тоже до invalidate_facet_counts: из прежней категории товар нужно убрать
+    similarity.schedule_refresh({instance.category_id, getattr(instance, '_loaded_category_id', None)})
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def refresh_category_cover(sender, instance, **kwargs):
+    if not _cascade_delete(kwargs, ProductCategory, Product):
+        category_stats.refresh_for_products([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_facet_counts(sender, instance, **kwargs):
+    # При переносе товара в другую категорию устаревают счетчики обеих
+    category_ids = (instance.category_id, getattr(instance, '_loaded_category_id', None))
+    transaction.on_commit(lambda: facets.invalidate(*category_ids))
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def mark_sitemap_dirty(sender, instance, **kwargs):
+    section = SITEMAP_SECTIONS.get(sender)
+    if section:
+        # После коммита: иначе параллельная сборка снимет пометку и соберет файл по старым данным
+        pk = instance.pk
+        transaction.on_commit(lambda: sitemap_files.mark_dirty(section, pk))
+
+
+@contextmanager
+def _timed(timings, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0) + time.perf_counter() - started
+
+
+def after_bulk_changes(categories=(), blog=False, similar=True, related=True, timings=None):
+    """
+    То, что обработчики выше делают при save(), — после bulk_create/bulk_update/сырых запросов.
+    categories — id категорий с измененными товарами, фото или сводками (None — все);
+    blog — менялись статьи. similar=False оставляет похожие товары команде build_similar_products,
+    related=False — «Читайте также» команде build_related_posts (или они восстановлены вместе со статьями).
+    timings (dict) — время шагов для отчета.
+    """
+    groups = []
+    if categories is None or categories:
+        if categories is None:
+            categories = ProductCategory.objects.values_list('pk', flat=True)
+        categories = {pk for pk in categories if pk is not None}
+        with _timed(timings, 'category_stats'):
+            facets.invalidate(*categories)
+            category_stats.refresh(categories)
+        if similar:
+            with _timed(timings, 'similar_products'):
+                similarity.refresh(categories)
+        groups.append(page_cache.CATALOG)
+        sitemap_files.mark_dirty('products')
+        sitemap_files.mark_dirty('categories')
+    if blog:
+        with _timed(timings, 'search_index'):
+            search.get_backend().rebuild()
+        if related:
+            with _timed(timings, 'related_posts'):
+                related_posts.rebuild()
+        groups.append(page_cache.BLOG)
+        sitemap_files.mark_dirty('blog')
+    if groups:
+        page_cache.invalidate(*groups)
@@ -0,0 +1,226 @@
+"""
+Похожие товары для блока «Похожие товары» на странице товара.
+
+Для каждого активного товара заранее считается список соседей (Product.similar_ids)
+по материалу, размеру, цвету, цене и словам названия. Кандидаты — только товары той же
+категории, а в большой категории — CANDIDATES ближайших по цене: пересчет категории стоит
+O(n · CANDIDATES), а не O(n²). Варианты одного товара (то же название, другие размер/цвет)
+не занимают весь блок: из одного «семейства» берется не больше одного соседя,
+остальные — только если не хватает других товаров.
+
+Полная пересборка — команда build_similar_products (импорт каталога по умолчанию ее
+не запускает). При изменении товаров сигналы (main/signals.py) копят категории до коммита
+транзакции, затем затронутые категории пересчитываются целиком, а не только измененный товар:
+новый товар или новая цена может попасть в соседи любого товара категории и сдвигает окна
+кандидатов, так что частичный пересчет давал бы неверные списки. С SIMILAR_PRODUCTS_ASYNC
+пересчет идет в одном фоновом потоке, а очередь ограничена: категории, измененные, пока поток
+занят, сливаются в одно множество и пересчитываются одним следующим проходом — серия
+сохранений в одной категории дает не больше двух пересчетов, а не по одному на каждое.
+"""
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from . import cache as page_cache
+
+logger = logging.getLogger(__name__)
+
+# Сколько соседей хранить (на странице показываются первые из активных)
+NEIGHBOURS = 8
+
+# Сколько ближайших по цене товаров категории сравнивать с каждым товаром
+CANDIDATES = 200
+
+WEIGHTS = {
+    'name': 2.0,
+    'material': 1.0,
+    'price': 1.0,
+    'size': 1.0,
+    'color': 0.5,
+}
+
+WORD_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+SIZE_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*[xх×*]\s*(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+
+FIELDS = ('id', 'category_id', 'name', 'material', 'size', 'color', 'price', 'similar_ids')
+
+
+def _size_area(size):
+    match = SIZE_RE.search(size or '')
+    if not match:
+        return None
+    width, height = (Decimal(value.replace(',', '.')) for value in match.groups())
+    return width * height or None
+
+
+def _features(row):
+    # Слова размера и цвета не входят в «семейство»: «Полотенце белое 50x90» и «Полотенце серое 70x140» — один товар
+    noise = set(WORD_RE.findall(f'{row["size"] or ""} {row["color"] or ""}'.lower()))
+    words = frozenset(w for w in WORD_RE.findall(row['name'].lower()) if w not in noise)
+    return {
+        'id': row['id'],
+        'category': row['category_id'],
+        'words': words,
+        'material': row['material'],
+        'area': _size_area(row['size']),
+        'color': (row['color'] or '').strip().lower(),
+        'price': row['price'],
+        'similar_ids': row['similar_ids'] or [],
+    }
+
+
+def score(a, b):
+    value = 0.0
+    if a['words'] or b['words']:
+        value += WEIGHTS['name'] * len(a['words'] & b['words']) / len(a['words'] | b['words'])
+    if a['material'] and a['material'] == b['material']:
+        value += WEIGHTS['material']
+    if a['price'] and b['price']:
+        value += WEIGHTS['price'] * float(min(a['price'], b['price']) / max(a['price'], b['price']))
+    if a['area'] and b['area']:
+        value += WEIGHTS['size'] * float(min(a['area'], b['area']) / max(a['area'], b['area']))
+    if a['color'] and a['color'] == b['color']:
+        value += WEIGHTS['color']
+    return value
+
+
+def neighbours(item, items):
+    """Соседи item среди кандидатов items в порядке убывания сходства, не больше одного из каждого семейства"""
+    ranked = sorted(
+        (other for other in items if other['id'] != item['id']),
+        key=lambda other: (-score(item, other), other['id']),
+    )
+    families = {item['words']}
+    chosen, rest = [], []
+    for other in ranked:
+        if other['words'] in families:
+            rest.append(other)
+        else:
+            families.add(other['words'])
+            chosen.append(other)
+        if len(chosen) == NEIGHBOURS:
+            break
+    # Если разных товаров мало — добираем вариантами
+    chosen += rest[:NEIGHBOURS - len(chosen)]
+    return [other['id'] for other in chosen]
+
+
+def category_neighbours(items):
+    """{id: соседи} для товаров одной категории; кандидаты — окно из CANDIDATES ближайших по цене"""
+    items = sorted(items, key=lambda item: (item['price'] is None, item['price'] or 0, item['id']))
+    last_start = max(len(items) - CANDIDATES - 1, 0)
+    result = {}
+    for i, item in enumerate(items):
+        start = min(max(i - CANDIDATES // 2, 0), last_start)
+        result[item['id']] = neighbours(item, items[start:start + CANDIDATES + 1])
+    return result
+
+
+def _refresh_category(category_id):
+    from .models import Product
+
+    rows = Product.objects.filter(is_active=True, category_id=category_id).order_by().values(*FIELDS)
+    items = [_features(row) for row in rows]
+    current = {item['id']: item['similar_ids'] for item in items}
+    return {
+        pk: ids for pk, ids in category_neighbours(items).items() if ids != current[pk]
+    }
+
+
+def _save(changes):
+    from .models import Product
+
+    if not changes:
+        return 0
+    objs = [Product(id=pk, similar_ids=ids) for pk, ids in changes.items()]
+    Product.objects.bulk_update(objs, ['similar_ids'], batch_size=500)
+    page_cache.invalidate(page_cache.CATALOG)
+    return len(objs)
+
+
+def rebuild(category_ids=None):
+    """Пересчитывает соседей активных товаров (всех или категорий category_ids); возвращает число измененных списков"""
+    from .models import ProductCategory
+
+    if category_ids is None:
+        category_ids = ProductCategory.objects.order_by('pk').values_list('pk', flat=True)
+    changes = {}
+    # По категории за раз: в памяти только товары одной категории
+    for category_id in {pk for pk in category_ids if pk is not None}:
+        changes.update(_refresh_category(category_id))
+    return _save(changes)
+
+
+def refresh(category_ids):
+    """Пересчет после изменения товаров: списки затронутых категорий целиком"""
+    return rebuild(category_ids)
+
+
+# Категории, измененные в текущей транзакции потока (соединения Django — свои у каждого потока)
+_local = threading.local()
+
+_executor = None
+
+# Категории, ждущие фонового пересчета, и флаг «проход уже поставлен в очередь»
+_lock = threading.Lock()
+_queued = set()
+_scheduled = False
+
+
+def _run_in_background():
+    global _scheduled
+    close_old_connections()
+    try:
+        while True:
+            with _lock:
+                if not _queued:
+                    _scheduled = False
+                    return
+                category_ids = set(_queued)
+                _queued.clear()
+            try:
+                refresh(category_ids)
+            except Exception as e:
+                logger.error('Ошибка пересчета похожих товаров для категорий %s: %s', sorted(category_ids), e)
+    finally:
+        connection.close()
+
+
+def _flush():
+    global _executor, _scheduled
+    category_ids = getattr(_local, 'pending', None)
+    if not category_ids:
+        # Уже пересчитано предыдущим обработчиком этой транзакции
+        return
+    _local.pending = set()
+
+    if not getattr(settings, 'SIMILAR_PRODUCTS_ASYNC', True):
+        refresh(category_ids)
+        return
+    with _lock:
+        _queued.update(category_ids)
+        if _scheduled:
+            # Проход уже в очереди или идет — он заберет и эти категории
+            return
+        _scheduled = True
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similar-products')
+    _executor.submit(_run_in_background)
+
+
+def schedule_refresh(category_ids):
+    """
+    Пересчет категорий после коммита: все изменения транзакции (например, POST
+    list_editable на сотню строк) дают один пересчет. Категории откатившейся транзакции
+    пересчитаются со следующей — лишний пересчет безвреден.
+    """
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = set()
+    pending.update(pk for pk in category_ids if pk is not None)
+    transaction.on_commit(_flush)
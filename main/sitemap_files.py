@@ -0,0 +1,238 @@
+"""
+Заранее сгенерированные sitemap-файлы.
+
+Каждый раздел (static, categories, products, blog) пишется в SITEMAP_ROOT отдельными
+шардами sitemap-<раздел>-<n>.xml (+ .xml.gz), индекс — sitemap.xml. Шард n раздела-модели —
+объекты с id из диапазона ((n-1)*SHARD_SIZE, n*SHARD_SIZE], поэтому изменение объекта
+помечает устаревшим только его шард (файл-маркер, общий для всех gunicorn-воркеров),
+и пересобирается только он. Сборка — под файловой блокировкой: пока один процесс
+собирает, остальные отдают прежние файлы.
+"""
+import gzip
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки
+    fcntl = None
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.db.models import F, IntegerField, QuerySet
+from django.db.models.functions import Cast
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .sitemaps import SITEMAPS
+
+INDEX_NAME = 'sitemap.xml'
+DIRTY_PREFIX = '.dirty-'
+LOCK_NAME = '.lock'
+# Диапазон id на шард; не больше лимита sitemap (50 000 адресов)
+SHARD_SIZE = 10000
+# lastmod каждого шарда для индекса: разделы без изменений не перечитываются из БД
+MANIFEST_NAME = '.manifest.json'
+
+
+def sitemap_root():
+    return Path(settings.SITEMAP_ROOT)
+
+
+def shard_name(section, page):
+    return f'sitemap-{section}-{page}.xml'
+
+
+def _write_file(target, payload):
+    # Не трогаем файл с тем же содержимым — сохраняются Last-Modified и ETag
+    try:
+        if target.stat().st_size == len(payload) and target.read_bytes() == payload:
+            return
+    except FileNotFoundError:
+        pass
+    # Атомарно: пока пишется новый файл, отдается старый
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(payload)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, target)
+
+
+def _write(path, content):
+    """XML и рядом его .gz"""
+    data = content.encode('utf-8')
+    _write_file(path, data)
+    # mtime=0 — одинаковое содержимое дает одинаковый .gz
+    _write_file(path.with_name(path.name + '.gz'), gzip.compress(data, 9, mtime=0))
+
+
+def _read_manifest():
+    try:
+        return json.loads((sitemap_root() / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest):
+    _write_file(sitemap_root() / MANIFEST_NAME, json.dumps(manifest, indent=1).encode())
+
+
+def _protocol():
+    return settings.SITEMAP_PROTOCOL
+
+
+def shard_of(pk):
+    return (pk - 1) // SHARD_SIZE + 1
+
+
+def mark_dirty(section, pk=None):
+    """Помечает устаревшим шард объекта pk или (без pk) весь раздел"""
+    root = sitemap_root()
+    root.mkdir(parents=True, exist_ok=True)
+    suffix = section if pk is None else f'{section}-{shard_of(pk)}'
+    (root / f'{DIRTY_PREFIX}{suffix}').touch()
+
+
+def dirty_shards():
+    """{раздел: номера устаревших шардов или None — весь раздел}"""
+    root = sitemap_root()
+    manifest = _read_manifest()
+    dirty = {}
+    for section in SITEMAPS:
+        if (root / f'{DIRTY_PREFIX}{section}').exists() or section not in manifest:
+            dirty[section] = None
+            continue
+        pages = {int(path.name.rsplit('-', 1)[1]) for path in root.glob(f'{DIRTY_PREFIX}{section}-*')}
+        if pages:
+            dirty[section] = pages
+    return dirty
+
+
+def dirty_sections():
+    return list(dirty_shards())
+
+
+@contextmanager
+def _build_lock(wait):
+    """True — блокировка взята; False — сборку уже ведет другой процесс (при wait=False)"""
+    root = sitemap_root()
+    root.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield True
+        return
+    with open(root / LOCK_NAME, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _shard_items(sitemap, page):
+    """Sitemap, отдающий только объекты шарда page"""
+    items = sitemap.items()
+    low, high = (page - 1) * SHARD_SIZE, page * SHARD_SIZE
+
+    class Shard(type(sitemap)):
+        def items(self):
+            return items.filter(pk__gt=low, pk__lte=high)
+
+    return Shard()
+
+
+def _present_pages(items):
+    shard = Cast((F('pk') - 1) / SHARD_SIZE, IntegerField()) + 1
+    return set(items.order_by().annotate(shard=shard).values_list('shard', flat=True).distinct())
+
+
+def build_section(section, site=None, pages=None):
+    """
+    Пересобирает шарды раздела (все или номера pages); возвращает {имя файла: lastmod}
+    собранных шардов и список имен удаленных (опустевших)
+    """
+    root = sitemap_root()
+    root.mkdir(parents=True, exist_ok=True)
+    # Маркеры снимаем до сборки: изменения во время сборки снова пометят раздел
+    if pages is None:
+        (root / f'{DIRTY_PREFIX}{section}').unlink(missing_ok=True)
+    for path in root.glob(f'{DIRTY_PREFIX}{section}-*'):
+        if pages is None or int(path.name.rsplit('-', 1)[1]) in pages:
+            path.unlink(missing_ok=True)
+
+    site = site or Site.objects.get_current()
+    sitemap = SITEMAPS[section]()
+    items = sitemap.items()
+    if isinstance(items, QuerySet):
+        present = _present_pages(items)
+        pages = present if pages is None else set(pages)
+    else:
+        # Статические страницы — один шард
+        present = pages = {1}
+
+    shards = {}
+    for page in sorted(pages & present):
+        shard = _shard_items(sitemap, page) if isinstance(items, QuerySet) else sitemap
+        shard.latest_lastmod = None
+        urls = shard.get_urls(page=1, site=site, protocol=_protocol())
+        name = shard_name(section, page)
+        _write(root / name, render_to_string('sitemap.xml', {'urlset': urls}))
+        shards[name] = shard.latest_lastmod.isoformat() if shard.latest_lastmod else None
+
+    # Удаляем опустевшие шарды и оставшиеся от прежней нумерации
+    removed = []
+    for path in root.glob(f'sitemap-{section}-*.xml*'):
+        name = path.name.removesuffix('.gz')
+        if _page_number(name) not in present:
+            path.unlink(missing_ok=True)
+            removed.append(name)
+    return shards, removed
+
+
+def build_index(manifest, site=None):
+    site = site or Site.objects.get_current()
+    entries = []
+    for section in SITEMAPS:
+        for name, last_mod in sorted(manifest.get(section, {}).items(), key=lambda item: _page_number(item[0])):
+            path = reverse('sitemap_file', kwargs={'filename': name})
+            entries.append({
+                'location': f'{_protocol()}://{site.domain}{path}',
+                'last_mod': datetime.fromisoformat(last_mod) if last_mod else None,
+            })
+    _write(sitemap_root() / INDEX_NAME, render_to_string('sitemap_index.xml', {'sitemaps': entries}))
+
+
+def _page_number(name):
+    return int(name.rsplit('-', 1)[1].split('.')[0])
+
+
+def build(sections=None, wait=True):
+    """
+    Пересобирает указанные разделы целиком (по умолчанию — устаревшие шарды) и индекс;
+    возвращает список разделов. wait=False — не ждать, если сборку уже ведет другой процесс.
+    """
+    with _build_lock(wait) as locked:
+        if not locked:
+            return []
+        # Устаревшие шарды читаем под блокировкой: их могла только что собрать другая сборка
+        dirty = dirty_shards() if sections is None else dict.fromkeys(sections)
+        if not dirty and (sitemap_root() / INDEX_NAME).exists():
+            return []
+        site = Site.objects.get_current()
+        manifest = _read_manifest()
+        for section, pages in dirty.items():
+            shards, removed = build_section(section, site, pages)
+            entries = {} if pages is None else manifest.get(section, {})
+            manifest[section] = {
+                name: last_mod for name, last_mod in {**entries, **shards}.items() if name not in removed
+            }
+        _write_manifest(manifest)
+        build_index(manifest, site)
+        return list(dirty)
@@ -6,7 +6,14 @@ from django.urls import reverse
 from .models import Product, ProductCategory, BlogPost
 
 
-class StaticViewSitemap(Sitemap):
+class I18nSitemap(Sitemap):
+    """Адрес на каждом языке из LANGUAGES с hreflang-ссылками на остальные"""
+    i18n = True
+    alternates = True
+    x_default = True
+
+
+class StaticViewSitemap(I18nSitemap):
     """Статические страницы"""
     priority = 0.8
     changefreq = 'weekly'
@@ -18,12 +25,11 @@ class StaticViewSitemap(Sitemap):
         return reverse(item)
 
 
-class ProductCategorySitemap(Sitemap):
+class ProductCategorySitemap(I18nSitemap):
     """Категории товаров"""
     changefreq = 'weekly'
     priority = 0.7
 
-
     def items(self):
         return ProductCategory.objects.filter(is_active=True)
 
@@ -31,12 +37,11 @@ class ProductCategorySitemap(Sitemap):
         return obj.updated_at
 
 
-class ProductSitemap(Sitemap):
+class ProductSitemap(I18nSitemap):
     """Товары"""
     changefreq = 'daily'
     priority = 0.9
 
-
     def items(self):
         return Product.objects.filter(is_active=True).select_related('category')
 
@@ -44,14 +49,22 @@ class ProductSitemap(Sitemap):
         return obj.updated_at
 
 
-class BlogPostSitemap(Sitemap):
+class BlogPostSitemap(I18nSitemap):
     """Блог"""
     changefreq = 'weekly'
     priority = 0.6
 
-
     def items(self):
         return BlogPost.objects.filter(is_published=True).order_by('-published_at')
 
     def lastmod(self, obj):
-        return obj.updated_at
\ No newline at end of file
+        return obj.updated_at
+
+
+# Разделы sitemap; ключ — имя шарда (sitemap-<раздел>-<n>.xml)
+SITEMAPS = {
+    'static': StaticViewSitemap,
+    'categories': ProductCategorySitemap,
+    'products': ProductSitemap,
+    'blog': BlogPostSitemap,
+}
@@ -0,0 +1,184 @@
+"""
+Хранилище статики для production (collectstatic).
+
+Поверх ManifestStaticFilesStorage (хэш содержимого в имени файла):
+- CSS и JS минифицируются до хэширования (rcssmin/rjsmin, *.min.* не трогаем);
+- JPEG пережимается без потерь (optimize + progressive), PNG/JPEG получают варианты
+  images/x.png.avif и images/x.png.webp, которые выводит тег {% static_picture %}
+  (оригинал остается запасным вариантом); варианты новее исходника не перекодируются;
+- для текстовых файлов рядом пишутся .gz и .br — nginx отдает их без сжатия на лету:
+
+    location /static/ {
+        gzip_static on;
+        brotli_static on;  # модуль ngx_brotli
+    }
+"""
+import gzip
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import brotli
+import rcssmin
+import rjsmin
+from PIL import Image
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+MINIFIERS = {
+    '.css': rcssmin.cssmin,
+    '.js': rjsmin.jsmin,
+}
+
+RASTER_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Расширение варианта -> параметры сохранения PIL
+IMAGE_VARIANTS = {
+    'avif': {'format': 'AVIF', 'quality': 60, 'speed': 8},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+}
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.webmanifest', '.ico', '.txt', '.xml', '.map')
+
+# Файлы меньше этого размера не сжимаем: выигрыш меньше накладных расходов
+MIN_COMPRESS_SIZE = 256
+
+
+def variant_name(name, fmt):
+    """images/towel-1.png -> images/towel-1.png.webp (hero-towel.jpg и hero-towel.png не конфликтуют)"""
+    return f'{name}.{fmt}'
+
+
+def minify(name, content):
+    base, ext = os.path.splitext(name)
+    minifier = MINIFIERS.get(ext.lower())
+    if minifier is None or base.endswith('.min'):
+        return None
+    return minifier(content.decode('utf-8')).encode('utf-8')
+
+
+def recompress(content):
+    """
+    Пережимает JPEG без потерь; возвращает None, если меньше не получилось.
+    PNG не трогаем: zlib optimize дает единицы процентов ценой секунд на картинку.
+    """
+    image = Image.open(BytesIO(content))
+    if image.format != 'JPEG':
+        return None
+    output = BytesIO()
+    image.save(output, format='JPEG', quality='keep', optimize=True, progressive=True)
+    data = output.getvalue()
+    return data if len(data) < len(content) else None
+
+
+def image_variants(content):
+    """{формат: байты} — варианты картинки в современных форматах"""
+    image = Image.open(BytesIO(content))
+    image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    variants = {}
+    for fmt, params in IMAGE_VARIANTS.items():
+        output = BytesIO()
+        image.save(output, **params)
+        variants[fmt] = output.getvalue()
+    return variants
+
+
+def compress(content):
+    """(gzip, brotli) или None, если сжатие не уменьшает файл"""
+    if len(content) < MIN_COMPRESS_SIZE:
+        return None
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    br = brotli.compress(content, quality=11)
+    if min(len(gz), len(br)) >= len(content):
+        return None
+    return gz, br
+
+
+class OptimizedStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        paths = dict(paths)
+        paths.update(self._optimize(paths))
+        yield from super().post_process(paths, dry_run, **options)
+        self._compress()
+
+    def _replace(self, name, data):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(data))
+
+    def _optimize(self, paths):
+        """
+        Минифицирует и пережимает исходники и добавляет варианты изображений.
+        Результат кладется в STATIC_ROOT под исходным именем; хэш считается уже по нему.
+        """
+        def process(name):
+            storage, path = paths[name]
+            ext = os.path.splitext(name)[1].lower()
+            result = {}
+            with storage.open(path) as source:
+                content = source.read()
+            if ext in MINIFIERS:
+                data = minify(name, content)
+            else:
+                variants = [variant_name(name, fmt) for fmt in IMAGE_VARIANTS]
+                if self._up_to_date(variants, storage, path):
+                    # None — файл уже в STATIC_ROOT, только добавить в манифест
+                    result = dict.fromkeys(variants)
+                    data = recompress(content)
+                else:
+                    try:
+                        data = recompress(content)
+                        for fmt, variant in image_variants(content).items():
+                            result[variant_name(name, fmt)] = variant
+                    except (OSError, ValueError) as e:
+                        logger.warning('Не удалось обработать %s: %s', name, e)
+                        return {}
+            if data is not None:
+                result[name] = data
+            return result
+
+        candidates = [
+            name for name in paths
+            if os.path.splitext(name)[1].lower() in (*MINIFIERS, *RASTER_EXTENSIONS)
+        ]
+        # PIL и кодеки отпускают GIL — AVIF/WebP кодируются параллельно
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(process, candidates))
+
+        optimized = {}
+        for result in results:
+            for name, data in result.items():
+                if data is not None:
+                    self._replace(name, data)
+                optimized[name] = (self, name)
+        return optimized
+
+    def _up_to_date(self, names, storage, path):
+        try:
+            source_time = storage.get_modified_time(path)
+            return all(self.exists(name) and self.get_modified_time(name) >= source_time for name in names)
+        except (NotImplementedError, OSError):
+            return False
+
+    def _compress(self):
+        names = set()
+        for hash_key, hashed_name in self.hashed_files.items():
+            names.update((hash_key, hashed_name))
+        for name in sorted(names):
+            if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+                continue
+            with self.open(name) as file:
+                compressed = compress(file.read())
+            if compressed is None:
+                continue
+            gz, br = compressed
+            self._replace(f'{name}.gz', gz)
+            self._replace(f'{name}.br', br)
@@ -0,0 +1,282 @@
+"""
+Синтетический каталог и блог для нагрузочных тестов (команда generate_catalog).
+
+Данные детерминированы зерном (--seed): один и тот же запуск дает одинаковые названия,
+цены, распределение товаров по категориям (несколько больших категорий и длинный хвост)
+и тексты статей со словами, по которым можно искать (blog/?q=хлопок).
+Все slug начинаются с SLUG_PREFIX — так синтетику можно удалить, не трогая настоящий каталог.
+
+Фото: несколько маленьких заглушек обрабатываются один раз (как при загрузке, с вариантами
+для srcset), строки ProductImage ссылаются на них. Файлы при удалении строк не удаляются,
+поэтому общие заглушки безопасны.
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from PIL import Image
+from django.db import transaction
+from django.utils import timezone
+
+SLUG_PREFIX = 'synthetic-'
+BATCH_SIZE = 2000
+
+PRODUCT_KINDS = ('Полотенце', 'Халат', 'Простыня', 'Коврик', 'Плед', 'Салфетка', 'Наволочка', 'Тапочки')
+CATEGORY_WORDS = ('Банные', 'Кухонные', 'Детские', 'Пляжные', 'Гостиничные', 'Подарочные', 'Спа', 'Домашние')
+SIZES = ('30x30', '30x50', '40x70', '50x90', '70x140', '100x150', '150x200', '200x220')
+COLORS = ('белый', 'серый', 'бежевый', 'голубой', 'розовый', 'зеленый', 'синий', 'графит')
+MATERIALS = ('cotton', 'microfiber', 'linen', 'mixed')
+BLOG_WORDS = (
+    'полотенце', 'хлопок', 'махра', 'стирка', 'уход', 'температура', 'мягкость', 'плотность', 'ворс',
+    'отель', 'спа', 'подарок', 'ванная', 'кухня', 'лен', 'микрофибра', 'выбор', 'качество', 'сушка',
+    'пятна', 'кондиционер', 'цвет', 'размер', 'пряжа', 'Ташкент', 'производство', 'ткань', 'впитывание',
+    'towel', 'cotton', 'care', 'sochiq', 'paxta', 'sifat',
+)
+
+# Цвет заглушки для каждого цвета товара (RGB)
+PLACEHOLDER_RGB = (
+    (250, 250, 250), (170, 170, 170), (225, 205, 170), (150, 190, 230),
+    (240, 180, 200), (150, 200, 150), (60, 90, 170), (70, 70, 80),
+)
+PLACEHOLDER_SIZE = (160, 120)
+
+
+def _placeholders():
+    """[(имя в storage, хэш, ширины вариантов)]: уже созданные прошлым запуском или новые"""
+    from .catalog_import import encode_image, file_sha256
+    from .models import ProductImage
+
+    existing = list(
+        ProductImage.objects.filter(product__slug__startswith=SLUG_PREFIX)
+        .order_by('image').values_list('image', 'image_hash', 'image_variants').distinct()
+    )
+    if existing:
+        return existing
+
+    placeholders = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, rgb in enumerate(PLACEHOLDER_RGB):
+            path = os.path.join(tmp, f'{SLUG_PREFIX}{i}.png')
+            Image.new('RGB', PLACEHOLDER_SIZE, rgb).save(path, format='PNG')
+            name, widths, error = encode_image(path)
+            if error:
+                raise ValueError(error)
+            placeholders.append((name, file_sha256(path), widths))
+    return placeholders
+
+
+def _sentence(rng, words, length):
+    text = ' '.join(rng.choice(words) for _ in range(length))
+    return text[:1].upper() + text[1:] + '.'
+
+
+def _created(rng, now, days=730):
+    return now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def clear():
+    """
+    Удаляет синтетические данные. Без сигналов (_raw_delete): на 100k товаров пересчет
+    похожих и кэшей на каждую строку занял бы часы — вместо этого один раз в finish().
+    """
+    from .models import BlogPost, Product, ProductCategory, ProductImage, RelatedPost
+
+    categories = ProductCategory.objects.filter(slug__startswith=SLUG_PREFIX)
+    posts = BlogPost.objects.filter(slug__startswith=SLUG_PREFIX)
+    counts = {
+        'categories': categories.count(),
+        'products': Product.objects.filter(category__in=categories).count(),
+        'posts': posts.count(),
+    }
+    with transaction.atomic():
+        for queryset in (
+            ProductImage.objects.filter(product__category__in=categories),
+            Product.objects.filter(category__in=categories),
+            categories,
+            RelatedPost.objects.filter(post__in=posts),
+            RelatedPost.objects.filter(related__in=posts),
+            posts,
+        ):
+            # _raw_delete не поддерживает фильтры через связи — удаляем по id
+            ids = list(queryset.values_list('pk', flat=True))
+            for start in range(0, len(ids), BATCH_SIZE):
+                queryset.model._base_manager.filter(pk__in=ids[start:start + BATCH_SIZE])._raw_delete(
+                    queryset.db
+                )
+    return counts
+
+
+class CatalogGenerator:
+    """
+    generator = CatalogGenerator(seed=1)
+    generator.run(categories=20, products=10000, images=2, posts=300)
+    generator.finish()
+    """
+
+    def __init__(self, seed=0, batch_size=BATCH_SIZE):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.stats = {'categories': 0, 'products': 0, 'images': 0, 'posts': 0}
+        self.timings = {}
+
+    def run(self, categories, products, images, posts):
+        from .backup import keep_timestamps
+        from .models import BlogPost, Product, ProductCategory, ProductImage
+
+        started = time.perf_counter()
+        placeholders = _placeholders() if images or categories else []
+        self.timings['placeholders'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            with keep_timestamps(ProductCategory):
+                category_ids = self._categories(categories, placeholders)
+            with keep_timestamps(Product), keep_timestamps(ProductImage):
+                self._products(products, images, category_ids, placeholders)
+            with keep_timestamps(BlogPost):
+                self._posts(posts)
+        self.timings['insert'] = time.perf_counter() - started
+
+    def _last_number(self, model, kind):
+        """Наибольший номер в slug вида synthetic-<kind>-<n>: повторный запуск дописывает данные"""
+        slugs = model.objects.filter(slug__startswith=f'{SLUG_PREFIX}{kind}-').values_list('slug', flat=True)
+        return max((int(slug.rsplit('-', 1)[1]) for slug in slugs), default=0)
+
+    def _categories(self, count, placeholders):
+        from .models import ProductCategory
+
+        start = self._last_number(ProductCategory, 'category')
+        objs = []
+        for n in range(start, start + count):
+            created = _created(self.rng, self.now)
+            name, digest, widths = placeholders[n % len(placeholders)]
+            kind = PRODUCT_KINDS[n % len(PRODUCT_KINDS)].lower()
+            objs.append(ProductCategory(
+                name=f'{CATEGORY_WORDS[n % len(CATEGORY_WORDS)]} {kind} {n + 1}',
+                slug=f'{SLUG_PREFIX}category-{n + 1}',
+                description=_sentence(self.rng, BLOG_WORDS, 12),
+                image=name,
+                image_hash=digest,
+                image_variants=widths,
+                is_active=self.rng.random() > 0.05,
+                created_at=created,
+                updated_at=created,
+            ))
+        ProductCategory.objects.bulk_create(objs)
+        self.stats['categories'] += len(objs)
+        # Новые и уже существующие синтетические категории: товары добавляются и в них
+        return list(
+            ProductCategory.objects.filter(slug__startswith=SLUG_PREFIX).order_by('id').values_list('id', flat=True)
+        )
+
+    def _products(self, count, images, category_ids, placeholders):
+        from .models import Product
+
+        if not count:
+            return
+        if not category_ids:
+            raise ValueError('Нет синтетических категорий для товаров')
+        # Распределение как у настоящих магазинов: несколько больших категорий и длинный хвост
+        weights = list(accumulate(1 / (i + 1) for i in range(len(category_ids))))
+        start = self._last_number(Product, 'product')
+        for batch_start in range(start, start + count, self.batch_size):
+            batch_end = min(batch_start + self.batch_size, start + count)
+            objs = [self._product(n, category_ids, weights) for n in range(batch_start, batch_end)]
+            Product.objects.bulk_create(objs)
+            self.stats['products'] += len(objs)
+            if images:
+                self._images(objs, images, placeholders)
+
+    def _product(self, n, category_ids, weights):
+        from .models import Product
+
+        rng = self.rng
+        kind = PRODUCT_KINDS[n % len(PRODUCT_KINDS)]
+        size = rng.choice(SIZES)
+        color = rng.choice(COLORS)
+        created = _created(rng, self.now)
+        return Product(
+            category_id=rng.choices(category_ids, cum_weights=weights)[0],
+            name=f'{kind} {rng.choice(CATEGORY_WORDS).lower()} {n + 1}',
+            slug=f'{SLUG_PREFIX}product-{n + 1}',
+            description=_sentence(rng, BLOG_WORDS, rng.randint(10, 40)),
+            material=rng.choice(MATERIALS),
+            size=size,
+            color=color,
+            price=Decimal(rng.randrange(2000, 150000)) / 100,
+            stock=rng.choice((0, 0, rng.randint(1, 500))),
+            is_active=rng.random() > 0.05,
+            is_featured=rng.random() < 0.02,
+            created_at=created,
+            updated_at=created,
+        )
+
+    def _images(self, products, per_product, placeholders):
+        from .models import Product, ProductImage
+
+        if products[0].pk is None:
+            # СУБД не возвращает id из bulk_create
+            ids = dict(Product.objects.filter(slug__in=[p.slug for p in products]).values_list('slug', 'id'))
+            for product in products:
+                product.pk = ids[product.slug]
+        objs = []
+        for product in products:
+            first = COLORS.index(product.color)
+            for order in range(per_product):
+                name, digest, widths = placeholders[(first + order) % len(placeholders)]
+                objs.append(ProductImage(
+                    product_id=product.pk,
+                    image=name,
+                    image_hash=digest,
+                    image_variants=widths,
+                    is_main=order == 0,
+                    order=order,
+                    created_at=product.created_at,
+                ))
+        ProductImage.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.stats['images'] += len(objs)
+
+    def _posts(self, count):
+        from .models import BlogPost
+
+        rng = self.rng
+        start = self._last_number(BlogPost, 'post')
+        objs = []
+        for n in range(start, start + count):
+            created = _created(rng, self.now)
+            published = rng.random() > 0.1
+            topic = rng.sample(BLOG_WORDS, 3)
+            objs.append(BlogPost(
+                title=f'{topic[0].capitalize()}, {topic[1]} и {topic[2]}: заметка {n + 1}',
+                slug=f'{SLUG_PREFIX}post-{n + 1}',
+                excerpt=_sentence(rng, BLOG_WORDS, 20),
+                content='\n\n'.join(_sentence(rng, BLOG_WORDS, rng.randint(40, 120)) for _ in range(rng.randint(2, 6))),
+                is_published=published,
+                published_at=created if published else None,
+                created_at=created,
+                updated_at=created,
+            ))
+            if len(objs) >= self.batch_size:
+                BlogPost.objects.bulk_create(objs)
+                self.stats['posts'] += len(objs)
+                objs = []
+        BlogPost.objects.bulk_create(objs)
+        self.stats['posts'] += len(objs)
+
+    def finish(self, related=True, similar=False):
+        """То, что при save() делают сигналы (main/signals.py), — один раз на всю генерацию"""
+        from . import sitemap_files
+        from .signals import after_bulk_changes
+
+        after_bulk_changes(None, blog=True, similar=similar, related=related, timings=self.timings)
+        started = time.perf_counter()
+        sitemap_files.build()
+        self.timings['sitemaps'] = time.perf_counter() - started
+
+    def report(self):
+        return {**self.stats, 'timings': {name: round(value, 2) for name, value in self.timings.items()}}
@@ -0,0 +1,76 @@
+"""
+Шаблонные теги {% responsive_image %} — <picture> с WebP/JPEG srcset,
+и {% static_picture %} — <picture> с AVIF/WebP вариантами картинки из static
+"""
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..images import variant_urls
+from ..storage import IMAGE_VARIANTS, variant_name
+
+register = template.Library()
+
+
+def _srcset(urls):
+    return ', '.join(f'{url} {width}w' for url, width in urls)
+
+
+@register.simple_tag
+def responsive_image(obj, alt='', sizes='100vw', **attrs):
+    """
+    obj — ProductImage, ProductCategory или BlogPost (поля image и image_variants).
+    Пример: {% responsive_image product.main_image alt=product.name class="card-img-top" sizes="50vw" %}
+    """
+    field = getattr(obj, 'image', None)
+    if not field:
+        return ''
+
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+
+    widths = getattr(obj, 'image_variants', None) or []
+    if not widths:
+        # Варианты еще не созданы — отдаем оригинал
+        return format_html('<img src="{}" alt="{}"{}>', field.url, alt, extra)
+
+    webp = variant_urls(field, widths, 'webp')
+    jpeg = variant_urls(field, widths, 'jpeg')
+    # src — самый крупный JPEG, для браузеров без поддержки WebP и srcset
+    return format_html(
+        '<picture class="responsive-image">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        '</picture>',
+        _srcset(webp), sizes,
+        jpeg[-1][0], _srcset(jpeg), sizes, alt, extra,
+    )
+
+
+def _static_variant(path, fmt):
+    """URL варианта, если collectstatic его создал (в DEBUG вариантов нет)"""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    name = variant_name(path, fmt)
+    if hashed_files and staticfiles_storage.hash_key(name) in hashed_files:
+        return static(name)
+    return None
+
+
+@register.simple_tag
+def static_picture(path, alt='', **attrs):
+    """
+    Картинка из static с AVIF/WebP вариантами (см. main/storage.py) и исходным файлом как запасным.
+    <picture class="static-picture"> не влияет на верстку (display: contents), атрибуты — у <img>.
+    Пример: {% static_picture 'images/towel-1.png' alt="" class="hero-main-img" %}
+    """
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}">',
+        ((fmt, url) for fmt in IMAGE_VARIANTS if (url := _static_variant(path, fmt))),
+    )
+    return format_html(
+        '<picture class="static-picture">{}<img src="{}" alt="{}"{}></picture>',
+        sources, static(path), alt, extra,
+    )
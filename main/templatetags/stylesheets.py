@@ -0,0 +1,48 @@
+"""
+Шаблонные теги {% critical_css %} — встроенный критический CSS страницы (main/critical_css.py),
+и {% stylesheet %} — таблица стилей, которая не блокирует отрисовку, если критический CSS встроен
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from .. import critical_css as critical
+
+register = template.Library()
+
+INLINED = 'critical_css_inlined'
+
+
+@register.simple_tag(takes_context=True)
+def critical_css(context, page=None):
+    """
+    <style> с критическим CSS страницы; page по умолчанию — имя URL текущей страницы.
+    Пример: {% critical_css %} или {% critical_css 'home' %}
+    """
+    request = context.get('request')
+    if page is None and request is not None and request.resolver_match:
+        page = request.resolver_match.url_name
+    css = critical.load(page) if page else None
+    if not css:
+        return ''
+    context.render_context[INLINED] = True
+    return format_html('<style>{}</style>', mark_safe(css.replace('</', '<\\/')))
+
+
+@register.simple_tag(takes_context=True)
+def stylesheet(context, href, **attrs):
+    """
+    Путь в static или полный URL. Пример:
+    {% stylesheet 'css/style.css' %}, {% stylesheet 'https://cdn.example.com/x.css' crossorigin='anonymous' %}
+    """
+    url = href if href.startswith(('https://', 'http://', '//')) else static(href)
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    if not context.render_context.get(INLINED):
+        return format_html('<link rel="stylesheet" href="{}"{}>', url, extra)
+    # Первый экран уже оформлен встроенным CSS — полные стили грузятся параллельно с отрисовкой
+    return format_html(
+        '<link rel="preload" as="style" href="{}"{} onload="this.onload=null;this.rel=\'stylesheet\'">'
+        '<noscript><link rel="stylesheet" href="{}"{}></noscript>',
+        url, extra, url, extra,
+    )
@@ -1,3 +1,1982 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from PIL import Image
+import brotli
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.http import HttpResponse, QueryDict
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+from django.utils.http import http_date
+
+from . import async_views
+from . import backup
+from . import benchmark
+from . import cache as page_cache
+from . import catalog_import
+from . import category_stats
+from . import conditional
+from . import critical_css
+from . import facets
+from . import instrumentation
+from . import notifications
+from . import related_posts
+from . import search
+from . import similarity
+from . import sitemap_files
+from . import warmup
+from . import synthetic
+from .images import variant_name
+from .middleware import RateLimitMiddleware
+from .ratelimit import SlidingWindowLimiter
+from .models import Product, ProductCategory, ProductImage, BlogPost, ContactMessage, RelatedPost
+from .pagination import KeysetPaginator
+from .views import PRODUCT_ORDERINGS
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+SITEMAP_ROOT = os.path.join(MEDIA_ROOT, 'sitemaps')
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Строка лога на каждый запрос в выводе тестов не нужна (RequestMetricsTests ловит ее через assertLogs)
+logging.getLogger('main.requests').setLevel(logging.ERROR)
+
+
+def make_image(name='test.png', size=(40, 40), color='white'):
+    output = BytesIO()
+    Image.new('RGB', size, color).save(output, format='PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    SITEMAP_ROOT=SITEMAP_ROOT,
+    IMAGE_PROCESSING_ASYNC=False,
+    SIMILAR_PRODUCTS_ASYNC=False,
+    SECURE_SSL_REDIRECT=False,
+    STORAGES=TEST_STORAGES,
+)
+class CatalogTestCase(TestCase):
+    """Общие данные каталога: категория, товары с изображениями и статьи"""
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ProductCategory.objects.create(name='Towels', slug='towels')
+        cls.products = []
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_products()
+        for i in range(3):
+            BlogPost.objects.create(title=f'Post {i}', slug=f'post-{i}', content='Text', is_published=True)
+
+    @classmethod
+    def create_products(cls):
+        for i in range(12):
+            product = Product.objects.create(
+                category=cls.category,
+                name=f'Towel {i}',
+                size='50x90',
+                color=f'color-{i}',
+                material='cotton',
+                price=10 + i,
+                stock=i,
+                is_featured=i < 8,
+            )
+            ProductImage.objects.create(product=product, image=make_image(f'towel-{i}-a.png'), order=0)
+            ProductImage.objects.create(product=product, image=make_image(f'towel-{i}-b.png'), order=1, is_main=True)
+            cls.products.append(product)
+
+
+class MainImageTests(CatalogTestCase):
+
+    def test_main_image_prefers_is_main(self):
+        product = self.products[0]
+        self.assertTrue(product.main_image.is_main)
+
+    def test_prefetched_main_image_matches_lazy_lookup(self):
+        products = Product.objects.filter(category=self.category).with_main_image()
+        with self.assertNumQueries(2):
+            resolved = {p.id: p.main_image.id for p in products}
+        for product in self.products:
+            self.assertEqual(resolved[product.id], product.main_image.id)
+
+    def test_main_image_falls_back_to_first_image(self):
+        product = Product.objects.create(category=self.category, name='Plain', size='30x30', color='red')
+        first = ProductImage.objects.create(product=product, image=make_image('plain.png'), order=0)
+        self.assertEqual(Product.objects.with_main_image().get(id=product.id).main_image, first)
+
+
+class ViewQueryCountTests(CatalogTestCase):
+    """Число запросов не должно зависеть от количества карточек на странице"""
+
+    def test_home(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('main:home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_category_products(self):
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        # Валидаторы (main/conditional.py) + 4 запроса страницы + 4 на счетчики фасетов
+        with self.assertNumQueries(9):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+    def test_product_detail(self):
+        product = self.products[0]
+        # Валидаторы (main/conditional.py) + 4 запроса страницы
+        with self.assertNumQueries(5):
+            response = self.client.get(product.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['related_products']), 4)
+
+
+class ResponsiveImageTests(CatalogTestCase):
+
+    def test_variants_generated_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.products[0], image=make_image('wide.png', size=(1400, 700)), order=5
+            )
+        image.refresh_from_db()
+        self.assertEqual(image.image_variants, [320, 640, 1024, 1200])
+        storage = image.image.storage
+        for width in image.image_variants:
+            for fmt in ('webp', 'jpeg'):
+                self.assertTrue(storage.exists(variant_name(image.image.name, width, fmt)))
+
+    def test_template_tag_renders_srcset(self):
+        image = self.products[0].main_image
+        html = Template('{% load responsive_images %}{% responsive_image image alt="Towel" %}').render(
+            Context({'image': image})
+        )
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(' 40w', html)
+        self.assertIn('alt="Towel"', html)
+
+
+class ImageProcessingTests(CatalogTestCase):
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            image = ProductImage.objects.create(product=self.products[0], image=make_image('new.png'), order=3)
+        self.assertEqual(image.image_status, ProductImage.IMAGE_PENDING)
+        self.assertTrue(image.image.name.endswith('.png'))
+
+        for callback in callbacks:
+            callback()
+        image.refresh_from_db()
+        self.assertEqual(image.image_status, ProductImage.IMAGE_READY)
+        self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertTrue(image.image_variants)
+
+    def test_resave_without_new_file_skips_processing(self):
+        image = ProductImage.objects.get(pk=self.products[0].main_image.pk)
+        name = image.image.name
+        with mock.patch('main.models.schedule_image_processing') as schedule:
+            image.order = 7
+            image.save()
+        schedule.assert_not_called()
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, name)
+        self.assertEqual(image.image_status, ProductImage.IMAGE_READY)
+
+    def test_same_file_uploaded_again_keeps_processed_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.products[1], image=make_image('same.png'), order=4)
+        image = ProductImage.objects.get(pk=image.pk)
+        name = image.image.name
+
+        with mock.patch('main.models.schedule_image_processing') as schedule:
+            image.image = make_image('same.png')
+            image.save()
+        schedule.assert_not_called()
+        self.assertEqual(image.image.name, name)
+
+
+class PageCacheTests(CatalogTestCase):
+
+    def test_second_anonymous_request_is_served_from_cache(self):
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertEqual(page_cache.get_stats(), {'hits': 1, 'misses': 1})
+
+    def test_key_depends_on_language_and_params(self):
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        self.client.get(url)
+        self.assertEqual(self.client.get(url, {'sort': 'price'})['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/en' + url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/en' + url)['X-Page-Cache'], 'HIT')
+
+    def test_model_changes_invalidate_pages(self):
+        product = self.products[0]
+        url = product.get_absolute_url()
+        blog_url = reverse('main:blog_list')
+        self.client.get(url)
+        self.client.get(blog_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed towel'
+            product.save()
+            # До коммита версия прежняя: параллельный запрос не положит старую страницу под новую версию
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Renamed towel')
+        # Блог от каталога не зависит
+        self.assertEqual(self.client.get(blog_url)['X-Page-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.filter(product=product).first().delete()
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+
+    def test_session_and_unknown_params_bypass_cache(self):
+        url = reverse('main:home')
+        self.client.get(url)
+        self.assertNotIn('X-Page-Cache', self.client.get(url, {'utm_source': 'x'}))
+        self.client.cookies['sessionid'] = 'abc'
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+
+    def test_contact_page_is_not_cached(self):
+        response = self.client.get(reverse('main:contact'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+class CardFragmentCacheTests(CatalogTestCase):
+
+    def render_card(self, product):
+        template = Template("{% include 'main/includes/product_card.html' with product=product %}")
+        return template.render(Context({'product': product, 'LANGUAGE_CODE': 'ru'}))
+
+    def test_card_is_cached_until_updated_at_changes(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertIn('Towel 0', self.render_card(product))
+
+        product.name = 'Changed in memory'
+        self.assertNotIn('Changed in memory', self.render_card(product))
+
+        product.save()
+        self.assertIn('Changed in memory', self.render_card(product))
+
+    def test_new_image_bumps_product_updated_at(self):
+        product = self.products[0]
+        updated_at = Product.objects.get(pk=product.pk).updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=product, image=make_image('fresh.png'), is_main=True, order=0
+            )
+        image.refresh_from_db()
+        self.assertGreater(Product.objects.get(pk=product.pk).updated_at, updated_at)
+
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        self.assertContains(self.client.get(url), image.image.name.rsplit('.', 1)[0])
+
+
+class BlogSearchTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        BlogPost.objects.create(
+            title='Как стирать махровые полотенца', slug='washing', is_published=True,
+            content='Махровые полотенца стирают при температуре 40 градусов.'
+        )
+        BlogPost.objects.create(
+            title='Hotel towels guide', slug='hotel', is_published=True,
+            content='Choosing towels for hotels. Полотенца упоминаются один раз.'
+        )
+        BlogPost.objects.create(
+            title='Черновик про полотенца', slug='draft', is_published=False, content='Полотенца'
+        )
+
+    def test_results_are_ranked_and_exclude_drafts(self):
+        slugs = [BlogPost.objects.get(pk=pk).slug for pk in search.search_posts('полотенца')]
+        self.assertEqual(slugs, ['washing', 'hotel'])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = BlogPost.objects.get(slug='hotel')
+        post.content = 'Bamboo fabric'
+        post.save()
+        self.assertEqual(search.search_posts('bamboo'), [post.pk])
+        post.delete()
+        self.assertEqual(search.search_posts('bamboo'), [])
+
+    def test_blog_list_highlights_matches(self):
+        response = self.client.get(reverse('main:blog_list'), {'q': 'towels'})
+        self.assertEqual([p.slug for p in response.context['page_obj']], ['hotel'])
+        self.assertContains(response, '<mark>')
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(search.search_posts('"OR AND* ('), [])
+        self.assertEqual(search.search_posts('<script>'), [])
+
+
+class FacetTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+
+    def facet(self, response, name):
+        facet = next(f for f in response.context['facets'] if f['name'] == name)
+        return {option['value']: option['count'] for option in facet['options']}
+
+    def test_filters_narrow_products(self):
+        response = self.client.get(self.url, {'color': ['color-1', 'color-2'], 'in_stock': '1'})
+        self.assertEqual({p.color for p in response.context['page_obj']}, {'color-1', 'color-2'})
+
+        response = self.client.get(self.url, {'price_min': '15', 'price_max': '17'})
+        self.assertEqual(sorted(p.price for p in response.context['page_obj']), [15, 16, 17])
+
+    def test_invalid_prices_are_ignored(self):
+        for value in ('nan', 'Infinity', '-inf', 'sNaN', 'abc', '1e20'):
+            response = self.client.get(self.url, {'price_min': value})
+            self.assertEqual(response.status_code, 200, value)
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+        self.assertIsNone(facets.parse_filters(QueryDict('price_min=nan&price_max=Infinity'))['price_min'])
+
+    def test_counts_ignore_own_facet_but_respect_others(self):
+        response = self.client.get(self.url, {'color': 'color-3', 'in_stock': '1'})
+        # Счетчики цвета не зависят от выбранного цвета, но учитывают «в наличии» (stock=0 у color-0)
+        self.assertEqual(len(self.facet(response, 'color')), 11)
+        self.assertNotIn('color-0', self.facet(response, 'color'))
+        self.assertEqual(self.facet(response, 'material'), {'cotton': 1})
+        self.assertEqual(response.context['in_stock_count'], 1)
+
+    def test_counts_use_constant_queries_and_cache(self):
+        products = Product.objects.filter(category=self.category, is_active=True)
+        filters = facets.parse_filters(QueryDict('material=cotton&size=50x90&color=color-1'))
+        with self.assertNumQueries(4):
+            facets.get_facet_counts(self.category, products, filters)
+        with self.assertNumQueries(0):
+            facets.get_facet_counts(self.category, products, filters)
+
+        product = self.products[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.material = 'linen'
+            product.save()
+            # Счетчики сбрасываются после коммита, а не посреди транзакции
+            with self.assertNumQueries(0):
+                facets.get_facet_counts(self.category, products, filters)
+        counts = facets.get_facet_counts(self.category, products, facets.parse_filters(QueryDict()))
+        self.assertEqual(dict(counts['material']), {'cotton': 11, 'linen': 1})
+        with self.assertNumQueries(4):
+            facets.get_facet_counts(self.category, products, filters)
+
+    def test_pagination_links_keep_filters(self):
+        for i in range(3):
+            Product.objects.create(category=self.category, name=f'Extra {i}', size='70x140', color='white')
+        response = self.client.get(self.url, {'size': ['50x90', '70x140'], 'sort': 'name'})
+        self.assertContains(response, '?page=2&size=50x90&amp;size=70x140&amp;sort=name')
+
+
+class KeysetPaginationTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Одинаковые и пустые цены проверяют однозначность порядка и NULLS LAST
+        for i in range(7):
+            Product.objects.create(category=cls.category, name=f'Same {i}', size='30x50', color=f'c{i}', price=12)
+            Product.objects.create(category=cls.category, name=f'Noprice {i}', size='30x50', color=f'n{i}', price=None)
+
+    def test_pages_match_offset_pagination_for_every_sort(self):
+        products = Product.objects.filter(category=self.category)
+        for sort, ordering in PRODUCT_ORDERINGS.items():
+            expected = [p.pk for p in KeysetPaginator(products, 5, ordering, 'all').object_list]
+            paginator = KeysetPaginator(products, 5, ordering, f'test:{sort}')
+            collected = []
+            for number in paginator.page_range:
+                collected.extend(p.pk for p in paginator.page(number))
+            self.assertEqual(collected, expected, sort)
+            self.assertEqual(paginator.count, len(expected))
+            # С конца и вразброс: страницы читаются в обратном порядке и от якорей
+            for order in (list(reversed(paginator.page_range)), [4, 1, 6, 2, 5, 3]):
+                paginator = KeysetPaginator(products, 5, ordering, f'test:{sort}:{order}')
+                pages = {number: [p.pk for p in paginator.page(number)] for number in order}
+                collected = [pk for number in sorted(pages) for pk in pages[number]]
+                self.assertEqual(collected, expected, sort)
+
+    def test_boundaries_are_cached_until_catalog_changes(self):
+        products = Product.objects.filter(category=self.category)
+        KeysetPaginator(products, 5, ['name', 'id'], 'cached', [page_cache.CATALOG]).page(3)
+        paginator = KeysetPaginator(products, 5, ['name', 'id'], 'cached', [page_cache.CATALOG])
+        with self.assertNumQueries(1):
+            page = paginator.page(3)
+        self.assertEqual(page.paginator.num_pages, 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(category=self.category, name='New', size='1', color='x')
+        self.assertEqual(KeysetPaginator(products, 5, ['name', 'id'], 'cached', [page_cache.CATALOG]).count, 27)
+
+    def test_pages_read_only_nearby_rows(self):
+        products = Product.objects.filter(category=self.category)
+        paginator = KeysetPaginator(products, 5, ['name', 'id'], 'window')
+        self.assertEqual(paginator.count, 26)
+        expected = [p.pk for p in products.order_by('name', 'id')]
+        # Последняя страница — с конца списка: одна строка и соседняя перед ней
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual([p.pk for p in paginator.page(6)], expected[25:])
+        self.assertIn('LIMIT 2', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+        # Дальше — от сохраненных якорей, без OFFSET
+        for number in (5, 4):
+            with CaptureQueriesContext(connection) as queries:
+                page = paginator.page(number)
+            self.assertEqual([p.pk for p in page], expected[(number - 1) * 5:number * 5])
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+        with CaptureQueriesContext(connection) as queries:
+            page = KeysetPaginator(products, 5, ['name', 'id'], 'window').page(3)
+        self.assertEqual([p.pk for p in page], expected[10:15])
+        self.assertEqual(len(queries), 1)
+
+    def test_blog_list_pages(self):
+        for i in range(10):
+            BlogPost.objects.create(title=f'Extra {i}', slug=f'extra-{i}', content='Text', is_published=True)
+        response = self.client.get(reverse('main:blog_list'), {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.num_pages, 2)
+        self.assertEqual(len(response.context['page_obj']), 4)
+
+
+class SitemapTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(SITEMAP_ROOT, ignore_errors=True)
+
+    def test_index_lists_section_shards(self):
+        response = self.client.get('/sitemap.xml')
+        content = b''.join(response.streaming_content).decode()
+        for section in ('static', 'categories', 'products', 'blog'):
+            self.assertIn(f'/sitemap-{section}-1.xml</loc>', content)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_shard_has_hreflang_alternates(self):
+        response = self.client.get('/sitemap-products-1.xml')
+        content = b''.join(response.streaming_content).decode()
+        product = self.products[0]
+        self.assertIn(f'<loc>https://example.com/product/{product.slug}/</loc>', content)
+        for lang in ('ru', 'en', 'uz', 'x-default'):
+            self.assertIn(f'hreflang="{lang}"', content)
+        self.assertIn(f'href="https://example.com/en/product/{product.slug}/"', content)
+
+    def test_gzip_and_conditional_get(self):
+        url = '/sitemap-blog-1.xml'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'post-0', gzip.decompress(b''.join(response.streaming_content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_changed_section_is_rebuilt(self):
+        sitemap_files.build()
+        root = sitemap_files.sitemap_root()
+        blog_mtime = (root / 'sitemap-blog-1.xml').stat().st_mtime_ns
+        self.assertEqual(sitemap_files.dirty_sections(), [])
+
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.slug = 'renamed-towel'
+            product.save()
+            # До коммита сборка не должна видеть пометку: собрала бы файл по старым данным
+            self.assertEqual(sitemap_files.dirty_sections(), [])
+        self.assertEqual(sitemap_files.dirty_sections(), ['products'])
+
+        self.assertEqual(sitemap_files.build(), ['products'])
+        self.assertIn('renamed-towel', (root / 'sitemap-products-1.xml').read_text())
+        self.assertEqual((root / 'sitemap-blog-1.xml').stat().st_mtime_ns, blog_mtime)
+
+    def test_unknown_shard_is_404(self):
+        self.assertEqual(self.client.get('/sitemap-products-9.xml').status_code, 404)
+
+    @mock.patch.object(sitemap_files, 'SHARD_SIZE', 5)
+    def test_only_changed_shard_is_rebuilt(self):
+        sitemap_files.build()
+        root = sitemap_files.sitemap_root()
+        shards = sorted({sitemap_files.shard_of(product.pk) for product in self.products})
+        self.assertGreater(len(shards), 1)
+        mtimes = {page: (root / f'sitemap-products-{page}.xml').stat().st_mtime_ns for page in shards}
+
+        product = self.products[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.slug = 'renamed-towel'
+            product.save()
+        changed = sitemap_files.shard_of(product.pk)
+        self.assertEqual(sitemap_files.dirty_shards(), {'products': {changed}})
+        self.assertEqual(sitemap_files.build(), ['products'])
+        self.assertIn('renamed-towel', (root / f'sitemap-products-{changed}.xml').read_text())
+        for page in shards:
+            if page != changed:
+                self.assertEqual((root / f'sitemap-products-{page}.xml').stat().st_mtime_ns, mtimes[page])
+
+        # Опустевший шард удаляется из папки и индекса
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(
+                pk__in=[p.pk for p in self.products if sitemap_files.shard_of(p.pk) == changed]
+            ).delete()
+        sitemap_files.build()
+        self.assertFalse((root / f'sitemap-products-{changed}.xml').exists())
+        self.assertNotIn(f'sitemap-products-{changed}.xml', (root / 'sitemap.xml').read_text())
+
+    def test_busy_build_serves_previous_files(self):
+        sitemap_files.build()
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.slug = 'renamed-towel'
+            product.save()
+        with sitemap_files._build_lock(wait=True):
+            # Сборку уже ведет другой процесс — запрос не ждет и получает прежний файл
+            self.assertEqual(sitemap_files.build(wait=False), [])
+            response = self.client.get('/sitemap-products-1.xml')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(b'renamed-towel', b''.join(response.streaming_content))
+        self.assertEqual(sitemap_files.dirty_sections(), ['products'])
+        self.assertEqual(sitemap_files.build(), ['products'])
+
+
+class FakeTelegram:
+    """Локальный HTTP-сервер вместо api.telegram.org: запоминает сообщения, отвечает из очереди ответов"""
+
+    def __init__(self):
+        self.messages = []
+        self.responses = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                status, payload = fake.responses.pop(0) if fake.responses else (200, {'ok': True})
+                if status == 200:
+                    fake.messages.append({k: v[0] for k, v in parse_qs(body.decode()).items()})
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False,
+    TELEGRAM_BOT_TOKEN='123:test',
+    TELEGRAM_CHAT_ID='42',
+    CONTACT_DIGEST_THRESHOLD=3,
+    CONTACT_MAX_ATTEMPTS=2,
+)
+class ContactOutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.telegram = FakeTelegram()
+        self.client_telegram = notifications.TelegramClient(api_url=self.telegram.url)
+
+    def tearDown(self):
+        self.client_telegram.close()
+        self.telegram.stop()
+
+    def create_contact(self, name='Ali'):
+        return ContactMessage.objects.create(
+            name=name, phone='+998901234567', email='ali@example.com', subject='Towels', message='<b>Hi</b>',
+        )
+
+    def test_form_is_queued_without_calling_telegram(self):
+        data = {
+            'name': 'Ali', 'phone': '+998 90 123 45 67', 'email': 'ali@example.com',
+            'subject': 'Towels', 'message': 'Hi', 'type': 'wholesale',
+        }
+        with override_settings(TELEGRAM_API_URL='http://127.0.0.1:9'):
+            response = self.client.post('/api/submit-contact/', json.dumps(data), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        contact = ContactMessage.objects.get()
+        self.assertEqual((contact.status, contact.contact_type), (ContactMessage.STATUS_PENDING, 'wholesale'))
+        self.assertEqual(self.telegram.messages, [])
+
+    def test_pending_messages_are_delivered(self):
+        self.create_contact()
+        self.assertEqual(notifications.deliver_pending(self.client_telegram), 1)
+        self.assertEqual(len(self.telegram.messages), 1)
+        self.assertEqual(self.telegram.messages[0]['chat_id'], '42')
+        self.assertIn('&lt;b&gt;Hi&lt;/b&gt;', self.telegram.messages[0]['text'])
+        self.assertEqual(ContactMessage.objects.get().status, ContactMessage.STATUS_SENT)
+        # Повторный запуск ничего не отправляет
+        self.assertEqual(notifications.deliver_pending(self.client_telegram), 0)
+
+    def test_error_is_retried_with_backoff(self):
+        contact = self.create_contact()
+        self.telegram.responses.append((502, {'ok': False, 'description': 'Bad Gateway'}))
+        with self.assertLogs('main.notifications', 'ERROR'):
+            self.assertEqual(notifications.deliver_pending(self.client_telegram), 0)
+        contact.refresh_from_db()
+        self.assertEqual((contact.status, contact.attempts), (ContactMessage.STATUS_PENDING, 1))
+        self.assertGreater(contact.next_attempt_at, timezone.now() + timedelta(seconds=20))
+        self.assertIn('502', contact.last_error)
+
+        # Не раньше срока; после второй ошибки (CONTACT_MAX_ATTEMPTS=2) заявка помечается failed
+        self.assertEqual(notifications.deliver_pending(self.client_telegram), 0)
+        ContactMessage.objects.update(next_attempt_at=timezone.now())
+        self.telegram.responses.append((500, {'ok': False}))
+        with self.assertLogs('main.notifications', 'ERROR'):
+            notifications.deliver_pending(self.client_telegram)
+        contact.refresh_from_db()
+        self.assertEqual((contact.status, contact.attempts), (ContactMessage.STATUS_FAILED, 2))
+
+    def test_rate_limit_uses_retry_after(self):
+        first, second = self.create_contact('A'), self.create_contact('B')
+        self.telegram.responses.append((429, {'ok': False, 'parameters': {'retry_after': 120}}))
+        with self.assertLogs('main.notifications', 'WARNING'):
+            self.assertEqual(notifications.deliver_pending(self.client_telegram), 0)
+        for contact in (first, second):
+            contact.refresh_from_db()
+            self.assertEqual(contact.attempts, 0)
+            self.assertGreater(contact.next_attempt_at, timezone.now() + timedelta(seconds=100))
+
+    def test_burst_is_sent_as_digest(self):
+        for i in range(4):
+            self.create_contact(f'Client {i}')
+        self.assertEqual(notifications.deliver_pending(self.client_telegram), 4)
+        self.assertEqual(len(self.telegram.messages), 1)
+        self.assertIn('Новые сообщения с сайта HomeTerry: 4', self.telegram.messages[0]['text'])
+
+    def test_digest_is_split_by_message_limit(self):
+        contacts = [ContactMessage(name=f'C{i}', phone='+998901234567', email='a@b.c', subject='S', message='x' * 500)
+                    for i in range(20)]
+        digests = notifications.format_digests(contacts)
+        self.assertGreater(len(digests), 1)
+        self.assertEqual(sum(len(batch) for batch, _ in digests), 20)
+        self.assertTrue(all(len(text) <= notifications.MESSAGE_LIMIT for _, text in digests))
+
+
+class AsyncViewTests(CatalogTestCase):
+    """async_views.py (ASGI): те же страницы, что и у синхронных view, тем же числом запросов"""
+
+    def async_get(self, path, data=None):
+        request = AsyncRequestFactory().get(path, data or {})
+        request.LANGUAGE_CODE = 'ru'
+        return request
+
+    def test_home_matches_sync_query_count(self):
+        with self.assertNumQueries(4):
+            response = async_to_sync(async_views.home)(self.async_get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Towel 0')
+
+    async def test_pages_render(self):
+        product = self.products[0]
+        cases = [
+            (async_views.catalog, '/catalog/', {}),
+            (async_views.product_detail, f'/product/{product.slug}/', {'slug': product.slug}),
+            (async_views.blog_detail, '/blog/post-1/', {'slug': 'post-1'}),
+        ]
+        for view, path, kwargs in cases:
+            response = await view(self.async_get(path), **kwargs)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response['X-Page-Cache'], 'MISS')
+            response = await view(self.async_get(path), **kwargs)
+            self.assertEqual(response['X-Page-Cache'], 'HIT')
+
+    def test_related_lists_match_sync(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        post = BlogPost.objects.get(slug='post-1')
+        with self.assertNumQueries(2):
+            similar = async_to_sync(product.aget_similar)(4)
+        self.assertEqual(similar, product.get_similar(4))
+        self.assertEqual(async_to_sync(post.aget_related)(3), post.get_related(3))
+
+    async def test_contact_form_is_queued(self):
+        data = {
+            'name': 'Ali', 'phone': '+998901234567', 'email': 'ali@example.com',
+            'subject': 'Towels', 'message': 'Hi',
+        }
+        request = AsyncRequestFactory().post('/api/submit-contact/', json.dumps(data), content_type='application/json')
+        response = await async_views.submit_contact_form(request)
+        self.assertEqual(json.loads(response.content)['success'], True)
+        self.assertEqual(await ContactMessage.objects.acount(), 1)
+
+
+@override_settings(RATE_LIMITS=[
+    {'name': 'contact', 'path': r'^/api/submit-contact/$', 'methods': ['POST'], 'limit': 3, 'window': 60},
+])
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def run_parallel(self, func, count):
+        barrier = threading.Barrier(count)
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            barrier.wait()
+            result = func()
+            with lock:
+                results.append(result)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_limit_holds_under_parallel_hits(self):
+        limiter = SlidingWindowLimiter(limit=10, window=60)
+        results = self.run_parallel(lambda: limiter.hit('test', '10.0.0.1', now=6000.0), 50)
+        self.assertEqual(results.count(0), 10)
+        self.assertTrue(all(retry == 60 for retry in results if retry))
+
+    def test_sliding_window_counts_previous_window(self):
+        limiter = SlidingWindowLimiter(limit=3, window=60)
+        for _ in range(3):
+            self.assertEqual(limiter.hit('test', 'ip', now=6050.0), 0)
+        # Через 20 с в новом окне из предыдущего еще учитывается 5/6 запросов
+        self.assertEqual(limiter.hit('test', 'ip', now=6070.0), 10)
+        self.assertEqual(limiter.hit('test', 'ip', now=6090.0), 0)
+
+    def test_middleware_returns_429_with_retry_after(self):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+        results = self.run_parallel(lambda: middleware(factory.post('/api/submit-contact/')), 12)
+        self.assertEqual([r.status_code for r in results].count(200), 3)
+        limited = next(r for r in results if r.status_code == 429)
+        self.assertTrue(int(limited['Retry-After']) > 0)
+        self.assertFalse(json.loads(limited.content)['success'])
+
+        # Другие методы, пути и IP не ограничиваются этим правилом
+        self.assertEqual(middleware(factory.get('/api/submit-contact/')).status_code, 200)
+        self.assertEqual(middleware(factory.post('/set-language/')).status_code, 200)
+        self.assertEqual(middleware(factory.post('/api/submit-contact/', REMOTE_ADDR='10.0.0.2')).status_code, 200)
+
+
+class SimilarProductsTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.bath = [
+                Product.objects.create(category=cls.category, name='Bath towel', size=size, color=color,
+                                       material='cotton', price=30)
+                for size, color in [('70x140', 'white'), ('70x140', 'grey'), ('50x90', 'blue')]
+            ]
+            for name in ('Kitchen towel', 'Beach towel', 'Bath mat', 'Terry robe'):
+                Product.objects.create(category=cls.category, name=name, size='70x140', color='white',
+                                       material='cotton', price=28)
+
+    def test_variants_do_not_fill_related_block(self):
+        related = Product.objects.get(pk=self.bath[0].pk).get_similar(4)
+        self.assertEqual(len(related), 4)
+        self.assertFalse({p.pk for p in related} & {p.pk for p in self.bath})
+        # Варианты идут после других товаров
+        self.assertIn(self.bath[1].pk, Product.objects.get(pk=self.bath[0].pk).similar_ids)
+
+    def test_new_product_is_added_incrementally(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            towel = Product.objects.create(category=self.category, name='Bath towel premium', size='70x140',
+                                           color='white', material='cotton', price=30)
+        self.assertIn(towel.pk, Product.objects.get(pk=self.bath[0].pk).similar_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            towel.is_active = False
+            towel.save()
+        self.assertNotIn(towel.pk, Product.objects.get(pk=self.bath[0].pk).similar_ids)
+
+    def test_rebuild_matches_incremental_lists(self):
+        before = dict(Product.objects.values_list('pk', 'similar_ids'))
+        self.assertEqual(similarity.rebuild(), 0)
+        self.assertEqual(dict(Product.objects.values_list('pk', 'similar_ids')), before)
+
+    def test_product_page_uses_neighbour_list(self):
+        response = self.client.get(self.bath[0].get_absolute_url())
+        related = [p.pk for p in response.context['related_products']]
+        self.assertEqual(related, Product.objects.get(pk=self.bath[0].pk).similar_ids[:4])
+
+    def test_neighbours_come_from_same_category(self):
+        other = ProductCategory.objects.create(name='Robes', slug='robes')
+        with self.captureOnCommitCallbacks(execute=True):
+            robe = Product.objects.create(category=other, name='Bath towel', size='70x140', color='red',
+                                          material='cotton', price=30)
+        self.assertNotIn(robe.pk, Product.objects.get(pk=self.bath[0].pk).similar_ids)
+        self.assertFalse(set(Product.objects.get(pk=robe.pk).similar_ids) & {p.pk for p in self.bath})
+
+        # Перенос в категорию: товар уходит из списков прежней и попадает в списки новой
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = Product.objects.get(pk=self.bath[2].pk)
+            moved.category = other
+            moved.save()
+        self.assertNotIn(moved.pk, Product.objects.get(pk=self.bath[0].pk).similar_ids)
+        self.assertEqual(Product.objects.get(pk=robe.pk).similar_ids, [moved.pk])
+
+    def test_saves_in_one_transaction_refresh_once(self):
+        with mock.patch.object(similarity, 'rebuild', wraps=similarity.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for product in Product.objects.filter(pk__in=[p.pk for p in self.bath]):
+                        product.price += 1
+                        product.save()
+        rebuild.assert_called_once()
+        self.assertIn(self.category.pk, rebuild.call_args.args[0])
+
+    @override_settings(SIMILAR_PRODUCTS_ASYNC=True)
+    def test_background_queue_merges_categories(self):
+        executor = mock.Mock()
+        with mock.patch.object(similarity, '_executor', executor), \
+                mock.patch.object(similarity, '_queued', set()), \
+                mock.patch.object(similarity, '_scheduled', False), \
+                mock.patch.object(similarity, 'connection'), \
+                mock.patch.object(similarity, 'close_old_connections'), \
+                mock.patch.object(similarity, 'refresh') as refresh:
+            # Пока фоновый проход не начался, новые категории добавляются к уже поставленному
+            for category_ids in ({1}, {2}, {1, 3}):
+                similarity.schedule_refresh(category_ids)
+                similarity._flush()
+            executor.submit.assert_called_once_with(similarity._run_in_background)
+            similarity._run_in_background()
+            refresh.assert_called_once_with({1, 2, 3})
+
+            similarity.schedule_refresh({4})
+            similarity._flush()
+            self.assertEqual(executor.submit.call_count, 2)
+
+    def test_large_category_compares_nearest_prices(self):
+        items = [
+            similarity._features({'id': pk, 'category_id': 1, 'name': f'Towel {pk}', 'material': 'cotton',
+                                  'size': '', 'color': '', 'price': Decimal(pk), 'similar_ids': []})
+            for pk in range(1, 31)
+        ]
+        with mock.patch.object(similarity, 'CANDIDATES', 6), \
+                mock.patch.object(similarity, 'score', wraps=similarity.score) as score:
+            result = similarity.category_neighbours(items)
+        self.assertEqual(score.call_count, 30 * 6)
+        self.assertEqual(set(result[15]), {12, 13, 14, 16, 17, 18})
+        self.assertEqual(set(result[1]), {2, 3, 4, 5, 6, 7})
+
+
+class RelatedPostsTests(CatalogTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        texts = {
+            'towel-care': ('Как стирать махровые полотенца', 'Стирка махровых полотенец при низкой температуре.'),
+            'towel-choice': ('Как выбрать махровое полотенце', 'Плотность махры и хлопок для полотенца.'),
+            'towel-uz': ('Sochiqlarni qanday yuvish kerak', 'Sochiqlar paxtadan tayyorlanadi.'),
+            'towel-uz-2': ('Paxta sochiqlar', 'Sochiqni tanlash va yuvish.'),
+            'recipe': ('Recipe for plov', 'Rice, carrots and lamb for a family dinner.'),
+        }
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.posts = {
+                slug: BlogPost.objects.create(title=title, slug=slug, content=content, is_published=True)
+                for slug, (title, content) in texts.items()
+            }
+
+    def test_stemming_merges_word_forms(self):
+        self.assertEqual(related_posts.tokenize('полотенца полотенцем'), ['полотенц', 'полотенц'])
+        self.assertEqual(related_posts.tokenize('sochiqlarni sochiqlar'), ['sochiq', 'sochiq'])
+        self.assertEqual(related_posts.tokenize('towels and the towel'), ['towel', 'towel'])
+
+    def test_related_posts_share_topic(self):
+        related = self.posts['towel-care'].get_related(3)
+        self.assertEqual(related[0], self.posts['towel-choice'])
+        self.assertNotIn(self.posts['recipe'], related)
+        self.assertEqual(self.posts['towel-uz'].get_related(1), [self.posts['towel-uz-2']])
+
+    def test_detail_page_reads_related_with_one_query(self):
+        post = self.posts['towel-care']
+        with self.assertNumQueries(1):
+            post.get_related(3)
+        response = self.client.get(post.get_absolute_url())
+        self.assertEqual(response.context['related_posts'][0], self.posts['towel-choice'])
+
+    def test_saving_and_unpublishing_updates_lists(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            new = BlogPost.objects.create(
+                title='Стирка махровых полотенец', slug='towel-wash',
+                content='Как стирать махровые полотенца.', is_published=True,
+            )
+        self.assertEqual(self.posts['towel-care'].get_related(1), [new])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new.is_published = False
+            new.save()
+        self.assertNotIn(new, self.posts['towel-care'].get_related(3))
+        self.assertFalse(RelatedPost.objects.filter(post=new).exists())
+
+    def test_rebuild_matches_incremental_lists(self):
+        before = list(RelatedPost.objects.values_list('post_id', 'related_id', 'rank'))
+        related_posts.rebuild()
+        self.assertEqual(list(RelatedPost.objects.values_list('post_id', 'related_id', 'rank')), before)
+
+
+class StaticPipelineTests(TestCase):
+    """collectstatic с main.storage.OptimizedStaticFilesStorage"""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.source, 'css'))
+        os.makedirs(os.path.join(self.source, 'images'))
+        with open(os.path.join(self.source, 'css', 'site.css'), 'w') as f:
+            f.write('/* шапка */\nbody {\n    color: red;\n}\n' + '.item { margin: 0 auto; }\n' * 50)
+        Image.new('RGBA', (32, 32), 'red').save(os.path.join(self.source, 'images', 'dot.png'))
+        settings = override_settings(
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_ROOT=self.root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'main.storage.OptimizedStaticFilesStorage'},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), 'rb') as f:
+            return f.read()
+
+    def test_css_minified_hashed_and_precompressed(self):
+        self.collect()
+        hashed = staticfiles_storage.stored_name('css/site.css')
+        self.assertNotEqual(hashed, 'css/site.css')
+        content = self.read(hashed)
+        self.assertNotIn(b'\n', content)
+        self.assertNotIn('шапка'.encode(), content)
+        self.assertEqual(gzip.decompress(self.read(hashed + '.gz')), content)
+        self.assertEqual(brotli.decompress(self.read(hashed + '.br')), content)
+
+    def test_image_variants_in_manifest(self):
+        self.collect()
+        for fmt in ('avif', 'webp'):
+            hashed = staticfiles_storage.stored_name(f'images/dot.png.{fmt}')
+            with Image.open(os.path.join(self.root, hashed)) as image:
+                self.assertEqual(image.format, fmt.upper())
+        # Бинарные картинки не сжимаются повторно
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'images', 'dot.png.gz')))
+
+        html = Template("{% load responsive_images %}{% static_picture 'images/dot.png' alt='Точка' %}").render(Context())
+        self.assertIn('<source type="image/avif" srcset="/static/images/dot.png.', html)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(f'src="/static/{staticfiles_storage.stored_name("images/dot.png")}"', html)
+
+    def test_repeat_collect_reuses_image_variants(self):
+        self.collect()
+        variant = os.path.join(self.root, staticfiles_storage.stored_name('images/dot.png.avif'))
+        mtime = os.path.getmtime(os.path.join(self.root, 'images', 'dot.png.avif'))
+        self.collect()
+        self.assertTrue(os.path.exists(variant))
+        self.assertEqual(os.path.getmtime(os.path.join(self.root, 'images', 'dot.png.avif')), mtime)
+
+
+class StaticPictureTests(CatalogTestCase):
+
+    def test_without_manifest_falls_back_to_original(self):
+        html = Template("{% load responsive_images %}{% static_picture 'images/logo2.png' alt='Лого' class='logo-img' %}").render(Context())
+        self.assertHTMLEqual(
+            html,
+            '<picture class="static-picture"><img src="/static/images/logo2.png" alt="Лого" class="logo-img"></picture>',
+        )
+
+
+class CriticalCssTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(CRITICAL_CSS_ROOT=root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @staticmethod
+    def fetch(url):
+        # Сторонние таблицы стилей в тестах не скачиваем
+        if url.startswith('/static/'):
+            return critical_css.fetch_stylesheet(url)
+        return '.navbar{display:flex}.modal-backdrop{opacity:.5}'
+
+    def test_selector_matching(self):
+        page = critical_css.PageParser(fold_sections=1)
+        page.feed(
+            '<html lang="ru"><body><nav class="navbar"><a class="nav-link" href="/">x</a></nav>'
+            '<main><section class="hero"><h1 id="title">x</h1></section>'
+            '<section class="below"></section></main><footer class="site-footer"></footer></body></html>'
+        )
+        self.assertTrue(page.matches('.navbar .nav-link'))
+        self.assertTrue(page.matches('.hero > h1#title::after'))
+        self.assertTrue(page.matches(':root'))
+        self.assertTrue(page.matches('[data-theme="dark"] .navbar'))
+        self.assertTrue(page.matches('a[href]'))
+        self.assertFalse(page.matches('.nav-link:hover'))
+        self.assertFalse(page.matches('.below'))
+        self.assertFalse(page.matches('.site-footer a'))
+        self.assertFalse(page.matches('.navbar .dropdown-menu'))
+
+    def test_extract_keeps_media_keyframes_and_fonts_in_use(self):
+        page = critical_css.PageParser(fold_sections=1)
+        page.feed('<body><main><section class="hero"><i class="icon"></i></section></main></body>')
+        css = critical_css.extract([
+            ('https://cdn.example.com/css/lib.css', (
+                '@font-face{font-family:"Icons";src:url(../fonts/icons.woff2)}'
+                '@font-face{font-family:"Unused";src:url(unused.woff2)}'
+                '.icon{font-family:"Icons"}.other{color:red}'
+            )),
+            ('/static/css/site.css', (
+                '@keyframes float{to{transform:none}}@keyframes spin{to{transform:rotate(1turn)}}'
+                '@media (max-width: 600px){.hero{animation:float 2s}.footer{color:red}}'
+            )),
+        ], page)
+        self.assertIn('url(https://cdn.example.com/fonts/icons.woff2)', css)
+        self.assertNotIn('Unused', css)
+        self.assertNotIn('.other', css)
+        self.assertIn('@media (max-width:600px){.hero{animation:float 2s}}', css)
+        self.assertIn('@keyframes float', css)
+        self.assertNotIn('spin', css)
+
+    def test_build_inlines_critical_css_and_defers_stylesheets(self):
+        response = self.client.get(reverse('main:home'))
+        self.assertNotContains(response, '<style>')
+        self.assertContains(response, '<link rel="stylesheet" href="/static/css/style.css">', html=True)
+
+        urls = critical_css.page_urls()
+        report = critical_css.build_page('home', urls['home'], fetch=self.fetch)
+        self.assertLess(report['blocking_3g_after'], report['blocking_3g_before'])
+        css = critical_css.load('home')
+        self.assertIn('.hero-section', css)
+        self.assertIn('.navbar{display:flex}', css)
+        self.assertNotIn('.modal-backdrop', css)
+        self.assertNotIn('.footer-bottom', css)
+
+        page_cache.invalidate(page_cache.CATALOG)
+        response = self.client.get(reverse('main:home'))
+        self.assertContains(response, '<style>')
+        self.assertContains(response, 'rel="preload" as="style" href="/static/css/style.css"')
+        self.assertContains(response, '<noscript><link rel="stylesheet" href="/static/css/pages/home.css"></noscript>')
+        # Страница без собранного критического CSS по-прежнему блокирует отрисовку до загрузки стилей
+        response = self.client.get(reverse('main:about'))
+        self.assertContains(response, '<link rel="stylesheet" href="/static/css/pages/about.css">', html=True)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    """ETag / Last-Modified и 304 для страниц каталога и блога (main/conditional.py)"""
+
+    def get(self, url, etag=None, **extra):
+        if etag:
+            extra['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(url, **extra)
+
+    def assert_not_modified(self, url, etag, queries=1):
+        page_cache.invalidate(page_cache.CATALOG, page_cache.BLOG)
+        # Промах кэша страниц: 304 после одного агрегатного запроса, без рендера
+        with self.assertNumQueries(queries):
+            response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_pages_answer_304_when_unchanged(self):
+        urls = [
+            reverse('main:catalog'),
+            reverse('main:category_detail', kwargs={'slug': self.category.slug}),
+            self.products[0].get_absolute_url(),
+            reverse('main:blog_list'),
+            reverse('main:blog_detail', kwargs={'slug': 'post-1'}),
+        ]
+        for url in urls:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(response['ETag'].startswith('"'), url)
+            # В состоянии страниц есть числа и id — только ETag
+            self.assertNotIn('Last-Modified', response)
+            self.assert_not_modified(url, response['ETag'])
+
+    def test_cached_page_answers_304_without_queries(self):
+        url = self.products[0].get_absolute_url()
+        etag = self.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_varies_per_language(self):
+        url = self.products[0].get_absolute_url()
+        with translation.override('en'):
+            en_url = self.products[0].get_absolute_url()
+        self.assertNotEqual(url, en_url)
+        etag = self.get(url)['ETag']
+        response = self.get(en_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_related_product_change_changes_etag(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        url = product.get_absolute_url()
+        etag = self.get(url)['ETag']
+        similar = Product.objects.get(pk=product.similar_ids[-1])
+        similar.price += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            similar.save()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_deleted_product_changes_category_etag(self):
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        etag = self.get(url)['ETag']
+        # Удаляем не самый свежий товар — max(updated_at) не меняется, меняется число
+        oldest = Product.objects.order_by('updated_at').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            oldest.delete()
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_deleted_product_is_not_hidden_by_if_modified_since(self):
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        since = http_date(time.time() + 3600)
+        self.assertEqual(self.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.get(url)['X-Page-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.order_by('updated_at').first().delete()
+        # Промах кэша страниц, затем попадание: оба без 304 по дате
+        for cache_status in ('MISS', 'HIT'):
+            response = self.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual((response.status_code, response['X-Page-Cache']), (200, cache_status))
+
+    def test_last_modified_only_for_dates(self):
+        request = RequestFactory().get('/')
+        request.LANGUAGE_CODE = 'ru'
+        older, newer = timezone.now() - timedelta(days=1), timezone.now()
+        etag, last_modified = conditional._validators(request, {'a': older, 'b': newer})
+        self.assertEqual(last_modified, int(newer.timestamp()))
+        self.assertIsNone(conditional._validators(request, {'a': newer, 'total': 3})[1])
+        self.assertIsNone(conditional._validators(request, {'a': newer, 'b': None})[1])
+
+    def test_related_posts_change_changes_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            related_posts.rebuild()
+        url = reverse('main:blog_detail', kwargs={'slug': 'post-1'})
+        etag = self.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            BlogPost.objects.create(title='Post new', slug='post-new', content='Text', is_published=True)
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_missing_object_is_404(self):
+        response = self.get(reverse('main:product_detail', kwargs={'slug': 'missing'}), '"x"')
+        self.assertEqual(response.status_code, 404)
+
+    def test_async_view_answers_304(self):
+        product = self.products[0]
+        etag = self.get(product.get_absolute_url())['ETag']
+        page_cache.invalidate(page_cache.CATALOG)
+        request = AsyncRequestFactory().get(product.get_absolute_url(), headers={'If-None-Match': etag})
+        request.LANGUAGE_CODE = 'ru'
+        response = async_to_sync(async_views.product_detail)(request, slug=product.slug)
+        self.assertEqual(response.status_code, 304)
+
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class AdminChangelistQueryTests(TestCase):
+    """Число запросов changelist админки не зависит от числа строк на странице"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        categories = ProductCategory.objects.bulk_create(
+            ProductCategory(name=f'Category {i}', slug=f'category-{i}') for i in range(5)
+        )
+        products = Product.objects.bulk_create(
+            Product(
+                category=categories[i % 5], name=f'Towel {i}', slug=f'towel-{i}',
+                size='50x90', color='white', material='cotton', price=10, stock=1,
+            )
+            for i in range(100)
+        )
+        ProductImage.objects.bulk_create(
+            ProductImage(product=product, image=f'products/towel-{i}.png', is_main=True)
+            for i, product in enumerate(products[:60])
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, rows, **params):
+        url = reverse(f'admin:main_{model._meta.model_name}_changelist')
+        with mock.patch.object(admin.site._registry[model], 'list_per_page', rows):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def assert_bounded(self, model, rows, max_queries):
+        _, few = self.changelist(model, 2)
+        response, many = self.changelist(model, rows)
+        self.assertEqual(len(response.context['cl'].result_list), rows)
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, max_queries)
+        return response
+
+    def test_product_changelist(self):
+        response = self.assert_bounded(Product, 100, 8)
+        # list_editable: у каждой строки свой <select> категорий из общего списка
+        self.assertContains(response, '>Category 4</option>', count=100)
+
+    def test_product_image_filter_uses_exists(self):
+        with CaptureQueriesContext(connection) as queries:
+            response, _ = self.changelist(Product, 100, has_image='no')
+        self.assertEqual(response.context['cl'].result_count, 40)
+        sql = ' '.join(query['sql'] for query in queries).upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+        response, _ = self.changelist(Product, 100, has_image='yes')
+        self.assertEqual(response.context['cl'].result_count, 60)
+
+    def test_category_changelist(self):
+        category_stats.refresh()
+        response = self.assert_bounded(ProductCategory, 5, 6)
+        counts = {category.name: category.active_product_count for category in response.context['cl'].result_list}
+        self.assertEqual(counts['Category 0'], 20)
+        self.assertContains(response, 'column-active_product_count')
+        self.assertContains(response, 'column-price_range')
+
+    def test_product_image_changelist(self):
+        response = self.assert_bounded(ProductImage, 60, 6)
+        self.assertContains(response, 'Towel 0 - 50x90 - white')
+
+
+class CatalogImportTests(CatalogTestCase):
+    HEADER = 'category;name;size;color;material;price;stock;is_featured;images\n'
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        Image.new('RGB', (800, 600), 'blue').save(os.path.join(self.dir, 'blue.jpg'))
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def catalog(self, rows):
+        return self.write('catalog.csv', self.HEADER + ''.join(f'{row}\n' for row in rows))
+
+    def run_import(self, path, **options):
+        stdout = StringIO()
+        call_command('import_catalog', path, workers=0, json=True, stdout=stdout, stderr=StringIO(), **options)
+        return json.loads(stdout.getvalue())
+
+    def test_import_upserts_products_and_images(self):
+        path = self.catalog([
+            'Towels;Towel 1;50x90;color-1;cotton;99,90;5;нет;',
+            'Халаты;Халат махровый;L;белый;Хлопок;250;3;да;blue.jpg',
+            'Халаты;Халат махровый;XL;белый;cotton;260;1;да;blue.jpg',
+        ])
+        report = self.run_import(path, batch_size=2)
+        self.assertEqual((report['created'], report['updated'], report['categories_created']), (2, 1, 1))
+        self.assertEqual(report['images'], 2)
+
+        existing = Product.objects.get(pk=self.products[1].pk)
+        self.assertEqual(str(existing.price), '99.90')
+        category = ProductCategory.objects.get(name='Халаты')
+        self.assertEqual(category.slug, 'halaty')
+        robe = Product.objects.get(slug='halat-mahrovyy-l-belyy')
+        self.assertEqual((robe.category, robe.material, robe.is_featured), (category, 'cotton', True))
+        image = robe.images.get()
+        self.assertTrue(image.is_main)
+        self.assertEqual(image.image_status, ProductImage.IMAGE_READY)
+        self.assertTrue(image.image.name.endswith('.webp'))
+        self.assertTrue(image.image_variants)
+        self.assertTrue(image.image.storage.exists(variant_name(image.image.name, 640, 'webp')))
+
+        # Повторный импорт того же файла ничего не меняет и не обрабатывает фото заново
+        report = self.run_import(path)
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (0, 0, 3))
+        self.assertEqual((report['images'], report['images_skipped']), (0, 2))
+        self.assertEqual(robe.images.count(), 1)
+
+    def test_queries_do_not_grow_with_rows(self):
+        def queries(count):
+            path = self.catalog(f'Towels;Bulk {count} {i};50x90;white;cotton;10;1;нет;' for i in range(count))
+            importer = catalog_import.CatalogImporter(self.dir, batch_size=100)
+            with CaptureQueriesContext(connection) as captured:
+                importer.run(catalog_import.read_rows(path))
+            self.assertEqual(importer.stats['created'], count)
+            return len(captured)
+
+        self.assertEqual(queries(5), queries(50))
+
+    def test_generated_slugs_are_unique(self):
+        Product.objects.create(category=self.category, name='Plaid', size='1', color='red', slug='plaid-1-red')
+        path = self.catalog([
+            'Towels;Plaid;1;RED!;;;;;',
+            'Towels;Plaid!;1;red;;;;;',
+        ])
+        self.run_import(path)
+        slugs = set(Product.objects.filter(name__startswith='Plaid').values_list('slug', flat=True))
+        self.assertEqual(slugs, {'plaid-1-red', 'plaid-1-red-2', 'plaid-1-red-3'})
+
+    def test_dry_run_validates_without_changes(self):
+        path = self.catalog([
+            'Towels;New towel;50x90;red;cotton;10;1;нет;',
+            ';Broken;;;wool;abc;-1;;',
+        ])
+        before = Product.objects.count()
+        stdout = StringIO()
+        with self.assertRaisesMessage(CommandError, 'Строк с ошибками: 1'):
+            call_command('import_catalog', path, dry_run=True, json=True, stdout=stdout, stderr=StringIO())
+        report = json.loads(stdout.getvalue())
+        self.assertEqual((report['rows'], report['invalid'], report['created']), (2, 1, 1))
+        self.assertEqual(Product.objects.count(), before)
+        self.assertFalse(os.path.exists(f'{path}.import-state'))
+
+    def test_resume_skips_committed_rows(self):
+        path = self.catalog(f'Towels;Resume {i};50x90;white;;;;;' for i in range(4))
+        catalog_import.save_state(f'{path}.import-state', path, 2)
+        report = self.run_import(path, resume=True)
+        self.assertEqual(report['rows'], 2)
+        self.assertEqual(
+            set(Product.objects.filter(name__startswith='Resume').values_list('name', flat=True)),
+            {'Resume 2', 'Resume 3'},
+        )
+        self.assertFalse(os.path.exists(f'{path}.import-state'))
+
+        catalog_import.save_state(f'{path}.import-state', path, 2)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('Towels;Resume 4;50x90;white;;;;;\n')
+        with self.assertRaisesMessage(CommandError, 'изменился'):
+            self.run_import(path, resume=True)
+
+    def test_resume_refreshes_categories_of_earlier_batches(self):
+        # Пачка прошлого запуска зафиксирована, но процесс упал до finish(): сводка категории устарела
+        robes = ProductCategory.objects.create(name='Robes', slug='robes')
+        Product.objects.bulk_create([Product(category=robes, name='Robe', slug='robe', price=50)])
+        path = self.catalog(f'Towels;Resume {i};50x90;white;;;;;' for i in range(3))
+        catalog_import.save_state(f'{path}.import-state', path, 2, {robes.pk})
+        self.assertEqual(catalog_import.load_state(f'{path}.import-state', path), (2, {robes.pk}))
+
+        self.run_import(path, resume=True)
+        robes.refresh_from_db()
+        self.assertEqual((robes.active_product_count, robes.min_price), (1, 50))
+
+    def test_failed_batch_removes_encoded_images(self):
+        def files():
+            return {
+                os.path.join(root, name) for root, _, names in os.walk(MEDIA_ROOT) for name in names
+                if not root.startswith(SITEMAP_ROOT)
+            }
+
+        path = self.catalog(['Towels;Broken batch;50x90;white;;;;;blue.jpg'])
+        before = files()
+        with mock.patch.object(catalog_import.CatalogImporter, '_attach', side_effect=RuntimeError('db')):
+            with self.assertRaisesMessage(RuntimeError, 'db'):
+                self.run_import(path)
+        self.assertFalse(Product.objects.filter(name='Broken batch').exists())
+        self.assertEqual(files(), before)
+
+    def test_json_array_is_streamed(self):
+        records = [{'category_slug': 'towels', 'name': f'Json {i}', 'images': []} for i in range(5)]
+        path = self.write('catalog.json', json.dumps(records, ensure_ascii=False, indent=1))
+        rows = list(catalog_import._read_json_array(path, chunk_size=7))
+        self.assertEqual([row['name'] for row in rows], [f'Json {i}' for i in range(5)])
+
+    def test_malformed_json_array_is_rejected(self):
+        path = self.write('garbage.json', '[{"name": "a"}, {"name": "b"} garbage ]')
+        with self.assertRaises(ValueError):
+            list(catalog_import._read_json_array(path, chunk_size=7))
+
+    def test_truncated_json_file_reports_read_error(self):
+        path = self.write('truncated.json', '[{"category_slug": "towels", "name": "Cut 1"}, {"category_slug": "tow')
+        with self.assertRaisesMessage(CommandError, 'Ошибка чтения файла'):
+            self.run_import(path)
+        self.assertFalse(Product.objects.filter(name='Cut 1').exists())
+
+
+class BackupRestoreTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def backup(self, **options):
+        call_command('backup_catalog', self.dir, stdout=StringIO(), **options)
+        return backup.read_manifest(self.dir)
+
+    def restore(self, **options):
+        stdout = StringIO()
+        call_command('restore_catalog', self.dir, json=True, stdout=stdout, stderr=StringIO(), **options)
+        return json.loads(stdout.getvalue())
+
+    def test_manifest_lists_models_and_media(self):
+        manifest = self.backup()
+        counts = {entry['model']: entry['count'] for entry in manifest['models']}
+        self.assertEqual(set(counts), set(backup.DEFAULT_MODELS))
+        self.assertEqual(counts['main.product'], 12)
+        # Оригинал и варианты каждого фото
+        image = ProductImage.objects.first()
+        self.assertEqual(manifest['media']['count'], ProductImage.objects.count() * (1 + 2 * len(image.image_variants)))
+        with gzip.open(os.path.join(self.dir, 'main.product.jsonl.gz'), 'rt', encoding='utf-8') as f:
+            first = json.loads(f.readline())
+        self.assertEqual(first['model'], 'main.product')
+
+    def test_restore_round_trip_without_reencoding(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.backup()
+        Product.objects.filter(pk=product.pk).update(name='Changed', updated_at=timezone.now())
+        ProductImage.objects.filter(product=product).delete()
+
+        with mock.patch('main.models.process_image') as process, self.captureOnCommitCallbacks() as callbacks:
+            stats = self.restore()
+        process.assert_not_called()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(stats['models']['main.product'], 12)
+        self.assertEqual((stats['media']['missing'], stats['media']['mismatch']), ([], []))
+
+        restored = Product.objects.get(pk=product.pk)
+        self.assertEqual((restored.name, restored.updated_at, restored.created_at),
+                         (product.name, product.updated_at, product.created_at))
+        images = list(restored.images.all())
+        self.assertEqual(len(images), 2)
+        self.assertTrue(all(image.image_status == ProductImage.IMAGE_READY and image.image_variants for image in images))
+
+    def test_restore_single_category_with_replace(self):
+        other = ProductCategory.objects.create(name='Robes', slug='robes')
+        robe = Product.objects.create(category=other, name='Robe', size='L', color='white')
+        # Списки похожих в копии устарели — после замены категории они пересчитываются
+        Product.objects.filter(category=self.category).update(similar_ids=[])
+        self.backup()
+        Product.objects.create(category=self.category, name='After backup', size='1', color='red')
+        Product.objects.filter(pk=robe.pk).update(name='Robe changed')
+
+        stats = self.restore(category='towels', replace=True)
+        self.assertEqual(stats['models'], {'main.productcategory': 1, 'main.product': 12, 'main.productimage': 24})
+        self.assertEqual(stats['deleted']['main.product'], 13)
+        self.assertFalse(Product.objects.filter(name='After backup').exists())
+        self.assertEqual(Product.objects.get(pk=robe.pk).name, 'Robe changed')
+        self.assertEqual(ProductImage.objects.filter(product__category=self.category).count(), 24)
+        self.assertTrue(Product.objects.get(pk=self.products[0].pk).similar_ids)
+        self.assertEqual(similarity.rebuild([self.category.pk]), 0)
+
+        with self.assertRaisesMessage(CommandError, 'Категории missing нет в копии'):
+            self.restore(category='missing')
+
+    def test_posts_restored_without_links_rebuild_related_posts(self):
+        related_posts.rebuild()
+        links = set(RelatedPost.objects.values_list('post_id', 'related_id'))
+        self.assertTrue(links)
+        self.backup()
+        RelatedPost.objects.all().delete()
+        self.restore(models=['main.blogpost'])
+        self.assertEqual(set(RelatedPost.objects.values_list('post_id', 'related_id')), links)
+
+    def test_missing_media_restored_from_backup_copy(self):
+        self.backup(with_media=True)
+        image = ProductImage.objects.first()
+        # MEDIA_ROOT общий для тестов класса — возвращаем файл на место
+        content = image.image.read()
+        image.image.close()
+        self.addCleanup(lambda: image.image.storage.exists(image.image.name)
+                        or image.image.storage.save(image.image.name, ContentFile(content)))
+        image.image.storage.delete(image.image.name)
+        stats = self.restore(models=['main.productimage'])
+        self.assertEqual(stats['media']['restored'], 1)
+        self.assertTrue(image.image.storage.exists(image.image.name))
+
+        shutil.rmtree(os.path.join(self.dir, backup.MEDIA_DIR))
+        image.image.storage.delete(image.image.name)
+        with self.assertRaisesMessage(CommandError, 'Проблемных файлов: 1'):
+            self.restore(models=['main.productimage'])
+
+    def test_corrupted_backup_changes_nothing(self):
+        self.backup()
+        path = os.path.join(self.dir, 'main.productimage.jsonl.gz')
+        with open(path, 'ab') as f:
+            f.write(b'\0')
+        Product.objects.filter(pk=self.products[0].pk).update(name='Changed')
+        with self.assertRaisesMessage(CommandError, 'контрольная сумма не совпадает'):
+            self.restore()
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).name, 'Changed')
+
+
+class RequestMetricsTests(CatalogTestCase):
+    """Server-Timing, лог main.requests и профили медленных запросов (main/instrumentation.py)"""
+
+    def get_logged(self, url, level='INFO'):
+        with self.assertLogs('main.requests', level) as logs:
+            response = self.client.get(url)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_server_timing_and_log_line(self):
+        url = reverse('main:category_detail', kwargs={'slug': self.category.slug})
+        response, data = self.get_logged(url)
+        self.assertEqual(data['view'], 'main:category_detail')
+        self.assertEqual(data['db_queries'], 9)
+        self.assertGreater(data['template_ms'], 0)
+        self.assertEqual(data['cache'], {'page': {'hits': 0, 'misses': 1}, 'facets': {'hits': 0, 'misses': 1}})
+        timing = response['Server-Timing']
+        self.assertIn('desc="9 queries"', timing)
+        self.assertIn('cache;desc="page:miss facets:miss"', timing)
+        self.assertIn('view;desc="main:category_detail"', timing)
+
+        response, data = self.get_logged(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertEqual((data['db_queries'], data['template_ms']), (0, 0))
+        self.assertIn('cache;desc="page:hit"', response['Server-Timing'])
+
+    def test_slow_requests_are_profiled(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with self.settings(REQUEST_SLOW_MS=0, REQUEST_PROFILE_RATE=1, REQUEST_PROFILE_ROOT=root,
+                           REQUEST_PROFILE_MAX_FILES=2):
+            for post in ('post-0', 'post-1', 'post-2'):
+                _, data = self.get_logged(reverse('main:blog_detail', kwargs={'slug': post}), 'WARNING')
+        files = sorted(os.listdir(root))
+        self.assertEqual(len(files), 2)
+        self.assertIn(data['profile'], files)
+        self.assertIn('main.blog_detail', data['profile'])
+        pstats.Stats(os.path.join(root, data['profile']))
+
+    def test_busy_profiler_is_skipped(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        url = reverse('main:blog_detail', kwargs={'slug': 'post-0'})
+        with self.settings(REQUEST_SLOW_MS=0, REQUEST_PROFILE_RATE=1, REQUEST_PROFILE_ROOT=root):
+            # Другой поток уже профилирует запрос
+            with instrumentation._profile_lock:
+                response, data = self.get_logged(url, 'WARNING')
+            self.assertEqual((response.status_code, 'profile' in data), (200, False))
+            # Профилировщик занят чем-то вне middleware
+            with mock.patch.object(instrumentation.cProfile.Profile, 'enable', side_effect=ValueError):
+                response, data = self.get_logged(url, 'WARNING')
+            self.assertEqual((response.status_code, 'profile' in data), (200, False))
+            self.assertFalse(instrumentation._profile_lock.locked())
+            _, data = self.get_logged(url, 'WARNING')
+        self.assertIn('profile', data)
+
+    def test_server_timing_only_for_internal_ips_and_staff(self):
+        url = reverse('main:catalog')
+        visitor = {'REMOTE_ADDR': '203.0.113.5'}
+        self.assertNotIn('Server-Timing', self.client.get(url, **visitor))
+        # Начало X-Forwarded-For задает клиент — подделка адреса не открывает заголовок
+        self.assertNotIn('Server-Timing', self.client.get(url, HTTP_X_FORWARDED_FOR='127.0.0.1', **visitor))
+        spoofed = self.client.get(url, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='127.0.0.1, 203.0.113.5')
+        self.assertNotIn('Server-Timing', spoofed)
+        # Клиент, которого прокси видел с внутреннего адреса
+        internal = self.client.get(url, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='127.0.0.1')
+        self.assertIn('Server-Timing', internal)
+        with self.settings(SERVER_TIMING=True):
+            # Настройка читается при создании middleware — нужен новый клиент
+            self.assertIn('Server-Timing', Client().get(url, **visitor))
+
+        staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertIn('Server-Timing', self.client.get(url, **visitor))
+        staff.is_staff = False
+        staff.save()
+        self.assertNotIn('Server-Timing', self.client.get(url, **visitor))
+
+    def test_fast_requests_are_not_profiled(self):
+        parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parent, ignore_errors=True)
+        root = os.path.join(parent, 'profiles')
+        with self.settings(REQUEST_SLOW_MS=60_000, REQUEST_PROFILE_RATE=1, REQUEST_PROFILE_ROOT=root):
+            _, data = self.get_logged(reverse('main:catalog'))
+        self.assertNotIn('profile', data)
+        self.assertFalse(os.path.exists(root))
+
+    def test_async_view(self):
+        async def view(request):
+            await Product.objects.acount()
+            instrumentation.record_cache('page', False)
+            return HttpResponse('ok')
+
+        middleware = instrumentation.RequestMetricsMiddleware(view)
+        with self.assertLogs('main.requests', 'INFO'):
+            response = async_to_sync(middleware)(AsyncRequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('page:miss', response['Server-Timing'])
+        self.assertIsNone(instrumentation.current())
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('main:catalog'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class SyntheticCatalogTests(CatalogTestCase):
+    """generate_catalog (main/synthetic.py)"""
+
+    def generate(self, *args):
+        call_command(
+            'generate_catalog', '--categories', '3', '--products', '40', '--images', '2', '--posts', '6',
+            *args, stdout=StringIO(),
+        )
+
+    def synthetic_products(self):
+        return Product.objects.filter(slug__startswith=synthetic.SLUG_PREFIX)
+
+    def test_generates_requested_scale(self):
+        self.generate('--seed', '3')
+        products = self.synthetic_products()
+        self.assertEqual(products.count(), 40)
+        self.assertEqual(ProductCategory.objects.filter(slug__startswith=synthetic.SLUG_PREFIX).count(), 3)
+        self.assertEqual(ProductImage.objects.filter(product__in=products, is_main=True).count(), 40)
+        self.assertEqual(ProductImage.objects.filter(product__in=products).count(), 80)
+        self.assertEqual(BlogPost.objects.filter(slug__startswith=synthetic.SLUG_PREFIX).count(), 6)
+        image = ProductImage.objects.filter(product__in=products).first()
+        self.assertTrue(image.image_ready)
+        self.assertTrue(image.image.storage.exists(variant_name(image.image.name, image.image_variants[0], 'webp')))
+        # Категории и статьи появились в sitemap и поиске
+        self.assertEqual(self.client.get('/sitemap-products-1.xml').status_code, 200)
+        word = BlogPost.objects.filter(slug__startswith=synthetic.SLUG_PREFIX).first().title.split(',')[0]
+        self.assertTrue(search.search_posts(word))
+
+    def test_same_seed_same_data_and_clear(self):
+        fields = ('slug', 'name', 'price', 'size', 'color', 'stock')
+        self.generate('--seed', '5')
+        first = list(self.synthetic_products().order_by('slug').values_list(*fields))
+        self.generate('--seed', '5', '--clear')
+        self.assertEqual(list(self.synthetic_products().order_by('slug').values_list(*fields)), first)
+        # Без --clear данные дописываются с новыми номерами
+        self.generate()
+        self.assertEqual(self.synthetic_products().count(), 80)
+
+        call_command('generate_catalog', '--only-clear', stdout=StringIO())
+        self.assertFalse(self.synthetic_products().exists())
+        self.assertFalse(BlogPost.objects.filter(slug__startswith=synthetic.SLUG_PREFIX).exists())
+        self.assertEqual(Product.objects.count(), len(self.products))
+
+
+class BenchmarkTests(CatalogTestCase):
+    """benchmark_urls (main/benchmark.py)"""
+
+    def test_scenarios_cover_all_urls(self):
+        covered = {scenario['url'] for scenario in benchmark.scenarios(include_contact=True)}
+        self.assertEqual(
+            [name for name in benchmark.url_names() if name not in covered],
+            ['set_language'],
+        )
+
+    def test_contact_form_is_opt_in(self):
+        self.assertNotIn('submit_contact', {scenario['name'] for scenario in benchmark.scenarios()})
+        options = {'requests': 1, 'warmup': 0, 'concurrency': 1, 'stdout': StringIO(), 'stderr': StringIO()}
+        call_command('benchmark_urls', scenarios=['about'], **options)
+        with self.assertRaisesMessage(CommandError, '--include-contact'):
+            call_command('benchmark_urls', scenarios=['submit_contact'], **options)
+
+        def submit(scenario, *args):
+            ContactMessage.objects.create(name=benchmark.CONTACT_NAME, phone='+998901234567', message='Load')
+            return {}
+
+        with mock.patch.object(benchmark, 'run_scenario', side_effect=submit):
+            report = benchmark.run(['submit_contact'], include_contact=True)
+        self.assertEqual(list(report['results']), ['submit_contact'])
+        # Заявки прогона не остаются в очереди уведомлений
+        self.assertFalse(ContactMessage.objects.filter(name=benchmark.CONTACT_NAME).exists())
+
+    def test_scenarios_respond(self):
+        with benchmark.server_timing_for_all():
+            for scenario in benchmark.scenarios():
+                if scenario['method'] == 'GET':
+                    status, timing = benchmark.InProcessClient(cold=False).request(scenario, 1)
+                    self.assertIn(status, (200, 404), scenario['name'])
+                    self.assertIn('queries', timing)
+
+    def test_run_scenario_stats(self):
+        calls = []
+
+        class Client:
+            def request(self, scenario, i):
+                calls.append(i)
+                return (500 if i == 9 else 200), 'db;dur=1.5;desc="3 queries", tpl;dur=2'
+
+            def close(self):
+                pass
+
+        scenario = {'name': 'home', 'method': 'GET', 'path': '/'}
+        result = benchmark.run_scenario(scenario, Client, requests_count=10, concurrency=3, warmup=2)
+        self.assertEqual(sorted(calls), [0, 1] + list(range(2, 12)))
+        self.assertEqual((result['requests'], result['errors']), (10, 1))
+        self.assertEqual(result['statuses'], {'200': 9, '500': 1})
+        self.assertEqual((result['queries_mean'], result['db_ms_mean'], result['template_ms_mean']), (3, 1.5, 2))
+        self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+
+    def test_percentile_and_compare(self):
+        values = list(range(1, 101))
+        self.assertEqual(
+            [benchmark.percentile(values, p) for p in (50, 95, 99, 100)],
+            [50, 95, 99, 100],
+        )
+        old = {'results': {'home': {'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 40, 'rps': 100, 'queries_mean': 4}}}
+        new = {'results': {'home': {'p50_ms': 5, 'p95_ms': 20, 'p99_ms': 50, 'rps': 150, 'queries_mean': 4}}}
+        diff = benchmark.compare(old, new)['home']
+        self.assertEqual(diff['p50_ms'], [10, 5, -50.0])
+        self.assertEqual(diff['rps'], [100, 150, 50.0])
+
+
+class ListingIndexTests(CatalogTestCase):
+    """Планировщик выбирает индексы миграции 0011_listing_indexes для запросов списков"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        synthetic.CatalogGenerator(seed=1).run(categories=5, products=3000, images=1, posts=300)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.big = ProductCategory.objects.get(slug=f'{synthetic.SLUG_PREFIX}category-1')
+
+    def assert_uses(self, queryset, index, ordered=True):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        if ordered:
+            # Порядок берется из индекса, а не сортировкой всех строк категории
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+            self.assertNotRegex(plan, r'(?m)^\s*(->\s*)?Sort\b')
+
+    def postgres(self, portable, postgres_only):
+        return postgres_only if connection.vendor == 'postgresql' else portable
+
+    def test_category_sorts(self):
+        products = Product.objects.filter(category=self.big, is_active=True)
+        expected = {
+            '-created_at': 'product_active_created_idx',
+            'created_at': 'product_active_created_idx',
+            'price': 'product_active_price_idx',
+            '-price': self.postgres('product_active_price_idx', 'product_active_price_desc_idx'),
+            'name': 'product_active_name_idx',
+            '-name': 'product_active_name_idx',
+        }
+        for sort, index in expected.items():
+            with self.subTest(sort=sort):
+                paginator = KeysetPaginator(products, 12, PRODUCT_ORDERINGS[sort], cache_key='plan')
+                self.assert_uses(paginator.object_list[:12], index)
+                # Страницы ближе к концу читаются в обратном порядке — тем же индексом
+                self.assert_uses(paginator.reversed_list[:12], index)
+
+    def test_home_and_blog(self):
+        self.assert_uses(Product.objects.filter(is_active=True, is_featured=True)[:8], 'product_featured_idx')
+        self.assert_uses(BlogPost.objects.filter(is_published=True)[:3], 'blogpost_published_idx')
+        paginator = KeysetPaginator(
+            BlogPost.objects.filter(is_published=True), 9, ['-published_at', '-created_at', '-id'], cache_key='plan'
+        )
+        self.assert_uses(
+            paginator.object_list[:9], self.postgres('blogpost_published_idx', 'blogpost_published_desc_idx')
+        )
+
+    def test_product_images(self):
+        product = Product.objects.filter(category=self.big).first()
+        self.assert_uses(ProductImage.objects.filter(product=product), 'productimage_order_idx')
+        # Главных фото у товара одно — сортировать его планировщик может и сам
+        self.assert_uses(
+            ProductImage.objects.filter(product=product, is_main=True)[:1], 'productimage_order_idx', ordered=False
+        )
+
+
+class CategoryStatsTests(CatalogTestCase):
+    """Сводки категорий (main/category_stats.py) следуют за товарами и фото"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def assert_stats(self, category, **expected):
+        category.refresh_from_db()
+        self.assertEqual({name: getattr(category, name) for name in expected}, expected)
+
+    def test_initial_stats(self):
+        # Цены 10..21, остаток i (у первого товара 0), обложка — главное фото последнего рекомендуемого
+        self.assert_stats(
+            self.category, active_product_count=12, in_stock_count=11, min_price=10, max_price=21,
+            cover_image_id=self.products[7].main_image.pk,
+        )
+
+    def test_move_and_deactivate(self):
+        other = ProductCategory.objects.create(name='Robes', slug='robes')
+        product = Product.objects.get(pk=self.products[11].pk)
+        product.category = other
+        product.save()
+        self.assert_stats(self.category, active_product_count=11, max_price=20)
+        self.assert_stats(other, active_product_count=1, in_stock_count=1, min_price=21, max_price=21)
+
+        product.is_active = False
+        product.save()
+        self.assert_stats(other, active_product_count=0, in_stock_count=0, min_price=None, cover_image_id=None)
+
+        self.products[0].delete()
+        self.assert_stats(self.category, active_product_count=10, in_stock_count=10, min_price=11)
+
+    def test_cover_follows_images(self):
+        self.products[7].images.all().delete()
+        self.assert_stats(self.category, cover_image_id=self.products[6].main_image.pk)
+        self.products[6].delete()
+        self.assert_stats(self.category, cover_image_id=self.products[5].main_image.pk)
+
+    def test_unchanged_stats_keep_updated_at(self):
+        updated_at = ProductCategory.objects.get(pk=self.category.pk).updated_at
+        Product.objects.get(pk=self.products[3].pk).save()
+        self.assert_stats(self.category, updated_at=updated_at)
+        Product.objects.filter(pk=self.products[3].pk).update(stock=0)
+        Product.objects.get(pk=self.products[3].pk).save()
+        self.category.refresh_from_db()
+        self.assertGreater(self.category.updated_at, updated_at)
+        self.assertEqual(self.category.in_stock_count, 10)
+
+    def test_deferred_refreshes_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with category_stats.deferred():
+                for product in self.products[:3]:
+                    product.is_active = False
+                    product.save()
+                self.assert_stats(self.category, active_product_count=12)
+        self.assert_stats(self.category, active_product_count=9, min_price=13)
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "main_productcategory"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_admin_bulk_delete(self):
+        url = reverse('admin:main_product_changelist')
+        response = self.client.post(url, {
+            'action': 'delete_selected',
+            '_selected_action': [product.pk for product in self.products[:4]],
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_stats(self.category, active_product_count=8, in_stock_count=8, min_price=14)
+
+    def test_rebuild_command(self):
+        ProductCategory.objects.filter(pk=self.category.pk).update(
+            active_product_count=0, min_price=None, cover_image=None
+        )
+        out = StringIO()
+        call_command('rebuild_category_stats', stdout=out)
+        self.assertIn('Исправлено категорий: 1', out.getvalue())
+        self.assert_stats(
+            self.category, active_product_count=12, min_price=10, cover_image_id=self.products[7].main_image.pk
+        )
+
+    def test_catalog_uses_cover_image(self):
+        self.client.logout()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('main:catalog'))
+        self.assertContains(response, 'catalog-pill-count')
+        cover = os.path.splitext(os.path.basename(self.products[7].main_image.image.name))[0]
+        self.assertContains(response, cover)
+
+
+class CacheWarmupTests(CatalogTestCase):
+    """warm_cache (main/warmup.py)"""
+
+    def test_urls_from_sitemaps_in_all_languages(self):
+        items = warmup.urls()
+        paths = [item['path'] for item in items]
+        self.assertEqual(paths[:2], ['/', '/catalog/'])
+        self.assertEqual(len(paths), len(set(paths)))
+        with translation.override('ru'):
+            category = self.category.get_absolute_url()
+            product = self.products[0].get_absolute_url()
+        for prefix in ('', '/en', '/uz'):
+            self.assertIn(f'{prefix}/', paths)
+            self.assertIn(f'{prefix}{category}', paths)
+            self.assertIn(f'{prefix}{category}?sort=price', paths)
+            self.assertIn(f'{prefix}{product}', paths)
+        self.assertNotIn(f'{category}?sort=-created_at', paths)
+        # Статические страницы всех языков — раньше категорий, товары — раньше блога
+        sections = [item['section'] for item in items]
+        self.assertEqual(list(dict.fromkeys(sections)), ['static', 'categories', 'products', 'blog'])
+        per_language = 5 + 6 + 12 + 3
+        self.assertEqual(len(items), per_language * 3)
+        self.assertEqual(len(warmup.urls(langs=['en'], sorts=False)), per_language - 5)
+
+    def test_traffic_order(self):
+        lines = [
+            '2026-10-18 10:00:00,000 INFO main.requests {"method": "GET", "path": "/en/blog/"}',
+            '{"method": "GET", "path": "/en/blog/"}',
+            '{"method": "GET", "path": "/catalog/"}',
+            '{"method": "POST", "path": "/contact/"}',
+            'not json {',
+        ]
+        hits = warmup.read_traffic(lines)
+        self.assertEqual(hits, {'/en/blog/': 2, '/catalog/': 1})
+        items = warmup.prioritize(warmup.urls(sections=['static']), hits)
+        self.assertEqual([item['path'] for item in items[:3]], ['/en/blog/', '/catalog/', '/'])
+
+    def test_run_fills_page_cache(self):
+        items = warmup.urls(sections=['static', 'categories'], langs=['ru', 'en'], sorts=False)
+        report = warmup.run(items, concurrency=1)
+        self.assertEqual(report['summary']['urls'], len(items))
+        self.assertEqual(report['summary']['errors'], 0)
+        # «О нас» и «Контакты» (CSRF-токен формы) в кэш страниц не попадают
+        uncached = {'/about/', '/contact/', '/en/about/', '/en/contact/'}
+        self.assertEqual(
+            {result['path'] for result in report['results'] if result['cache'] != 'MISS'}, uncached
+        )
+        self.assertTrue(all(result['queries'] is not None for result in report['results']))
+        again = warmup.run(items, concurrency=1)
+        self.assertEqual(again['summary']['already_cached'], len(items) - len(uncached))
+        self.assertEqual(set(again['sections']), {'static', 'categories'})
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('warm_cache', sections=['static'], languages=['en'], concurrency=1, stdout=out, stderr=err)
+        self.assertIn('Прогрето страниц: 5', out.getvalue())
+        self.assertIn('LocMemCache', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('warm_cache', sections=['static'], concurrency=1, max_ms=0.001, stdout=out, stderr=err)
+        with self.assertRaises(CommandError):
+            call_command('warm_cache', languages=['de'], stdout=out, stderr=err)
@@ -1,20 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'main'
 
+# Под ASGI (config/asgi.py) страницы каталога, блога и API формы обслуживают async-версии.
+# Списки товаров категории и статей всегда синхронные: фильтры, пагинация и поиск в них синхронные
+pages = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     # Главная страница
-    path('', views.home, name='home'),
+    path('', pages.home, name='home'),
 
     # Каталог
-    path('catalog/', views.catalog, name='catalog'),
+    path('catalog/', pages.catalog, name='catalog'),
     path('category/<slug:slug>/', views.category_products, name='category_detail'),
-    path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('product/<slug:slug>/', pages.product_detail, name='product_detail'),
 
     # Блог
     path('blog/', views.blog_list, name='blog_list'),
-    path('blog/<slug:slug>/', views.blog_detail, name='blog_detail'),
+    path('blog/<slug:slug>/', pages.blog_detail, name='blog_detail'),
 
     # Статические страницы
     path('about/', views.about, name='about'),
@@ -23,5 +28,5 @@ urlpatterns = [
 
 # API endpoints (без языкового префикса)
 api_urlpatterns = [
-    path('api/submit-contact/', views.submit_contact_form, name='submit_contact'),
+    path('api/submit-contact/', pages.submit_contact_form, name='submit_contact'),
 ]
\ No newline at end of file
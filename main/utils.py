@@ -1,7 +1,21 @@
+from django.conf import settings
+
+
 def get_client_ip(request):
     """Реальный IP клиента: за nginx REMOTE_ADDR всегда 127.0.0.1,
     настоящий адрес приходит в X-Forwarded-For (см. /etc/nginx/sites-available/hometerry)."""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
         return x_forwarded_for.split(',')[0].strip()
-    return request.META.get('REMOTE_ADDR', 'Unknown')
\ No newline at end of file
+    return request.META.get('REMOTE_ADDR', 'Unknown')
+
+
+def get_trusted_client_ip(request):
+    """IP клиента для проверок доступа: начало X-Forwarded-For задает сам клиент,
+    поэтому берется последний адрес — его дописал прокси из TRUSTED_PROXIES.
+    Запрос не от прокси — REMOTE_ADDR как есть."""
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for and remote_addr in settings.TRUSTED_PROXIES:
+        return x_forwarded_for.split(',')[-1].strip()
+    return remote_addr
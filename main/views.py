@@ -1,25 +1,43 @@
 from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from django.views.decorators.http import require_POST
-from django.conf import settings
-import html
 import json
 import logging
-import requests
 import re
 
-from .models import Product, ProductCategory, BlogPost
+from . import cache as page_cache
+from . import conditional
+from . import facets
+from . import search
+from . import sitemap_files
+from .cache import cache_page_for_anonymous
+from .models import Product, ProductCategory, BlogPost, ContactMessage
+from .pagination import KeysetPaginator
 from .utils import get_client_ip
 
 logger = logging.getLogger(__name__)
 
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
+# Сортировки каталога -> порядок для keyset-пагинации
+PRODUCT_ORDERINGS = {
+    '-created_at': ['-created_at', '-id'],
+    'created_at': ['created_at', 'id'],
+    'price': ['price', 'id'],
+    '-price': ['-price', '-id'],
+    'name': ['name', 'id'],
+    '-name': ['-name', '-id'],
+}
+
+
+@cache_page_for_anonymous([page_cache.CATALOG, page_cache.BLOG])
 def home(request):
     """Главная страница"""
-    featured_products = Product.objects.filter(is_active=True, is_featured=True)[:8]
-    categories = ProductCategory.objects.filter(is_active=True)[:6]
+    featured_products = Product.objects.filter(is_active=True, is_featured=True).with_main_image()[:8]
+    categories = ProductCategory.objects.filter(is_active=True).select_related('cover_image')[:6]
     latest_posts = BlogPost.objects.filter(is_published=True)[:3]
 
     context = {
@@ -30,9 +48,11 @@ def home(request):
     return render(request, 'main/home.html', context)
 
 
+@cache_page_for_anonymous([page_cache.CATALOG])
+@conditional.conditional_page(conditional.catalog_state)
 def catalog(request):
     """Каталог - показываем категории"""
-    categories = ProductCategory.objects.filter(is_active=True)
+    categories = ProductCategory.objects.filter(is_active=True).select_related('cover_image')
 
     context = {
         'categories': categories,
@@ -40,36 +60,65 @@ def catalog(request):
     return render(request, 'main/catalog.html', context)
 
 
+@cache_page_for_anonymous([page_cache.CATALOG], params=('sort', 'page') + facets.FILTER_PARAMS)
+@conditional.conditional_page(conditional.category_state)
 def category_products(request, slug):
     """Товары по категории"""
     category = get_object_or_404(ProductCategory, slug=slug, is_active=True)
-    products = Product.objects.filter(category=category, is_active=True)
+    return render(request, 'main/category_products.html', category_products_context(request, category))
 
-    # Сортировка
-    sort = request.GET.get('sort', '-created_at')
-    if sort in ['price', '-price', 'name', '-name']:
-        products = products.order_by(sort)
 
-    # Пагинация
-    paginator = Paginator(products, 12)
+def category_products_context(request, category):
+    """Фильтры, счетчики и страница товаров категории (общее для sync и async view)"""
+    category_products = Product.objects.filter(category=category, is_active=True)
+
+    # Фильтры и счетчики значений (см. main/facets.py)
+    filters = facets.parse_filters(request.GET)
+    facet_counts = facets.get_facet_counts(category, category_products, filters)
+    products = category_products.filter(facets.filter_conditions(filters)).with_main_image()
+
+    # Сортировка: id в конце делает порядок однозначным для keyset-пагинации
+    sort = request.GET.get('sort', '-created_at')
+    if sort not in PRODUCT_ORDERINGS:
+        sort = '-created_at'
+
+    # Пагинация по курсору; границы страниц кэшируются до изменения каталога
+    paginator = KeysetPaginator(
+        products,
+        12,
+        ordering=PRODUCT_ORDERINGS[sort],
+        cache_key=f'category:{category.pk}:{facets.filter_key(filters)}',
+        cache_groups=[page_cache.CATALOG],
+    )
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
-    context = {
+    # Параметры фильтров и сортировки для ссылок пагинации
+    filter_query = request.GET.copy()
+    filter_query.pop('page', None)
+
+    return {
         'category': category,
         'page_obj': page_obj,
         'current_sort': sort,
+        'facets': facets.build_facets(facet_counts, filters),
+        'filters': filters,
+        'price_range': facet_counts['price'],
+        'in_stock_count': facet_counts['in_stock'],
+        'filter_query': filter_query.urlencode(),
     }
-    return render(request, 'main/category_products.html', context)
 
 
+@cache_page_for_anonymous([page_cache.CATALOG])
+@conditional.conditional_page(conditional.product_state)
 def product_detail(request, slug):
     """Детальная страница товара"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
-    related_products = Product.objects.filter(
-        category=product.category,
+    product = get_object_or_404(
+        Product.objects.select_related('category').prefetch_related('images'),
+        slug=slug,
         is_active=True
-    ).exclude(id=product.id)[:4]
+    )
+    related_products = product.get_similar(4)
 
     context = {
         'product': product,
@@ -78,37 +127,52 @@ def product_detail(request, slug):
     return render(request, 'main/product_detail.html', context)
 
 
+@cache_page_for_anonymous([page_cache.BLOG], params=('q', 'page'))
+@conditional.conditional_page(conditional.blog_state)
 def blog_list(request):
     """Список статей блога"""
+    return render(request, 'main/blog_list.html', blog_list_context(request))
+
+
+def blog_list_context(request):
+    """Страница статей или результатов поиска (общее для sync и async view)"""
     posts = BlogPost.objects.filter(is_published=True)
 
-    # Поиск
-    search_query = request.GET.get('q', '')
+    # Поиск: полнотекстовый индекс, результаты по релевантности (см. main/search.py)
+    search_query = request.GET.get('q', '').strip()
+    page_number = request.GET.get('page')
     if search_query:
-        posts = posts.filter(
-            Q(title__icontains=search_query) |
-            Q(content__icontains=search_query) |
-            Q(excerpt__icontains=search_query)
+        # Пагинируем id, статьи и подсветку загружаем только для текущей страницы
+        paginator = Paginator(search.search_posts(search_query), 9)
+        page_obj = paginator.get_page(page_number)
+        posts_by_id = posts.in_bulk(page_obj.object_list)
+        page_obj.object_list = search.attach_snippets(
+            [posts_by_id[pk] for pk in page_obj.object_list if pk in posts_by_id],
+            search_query
         )
+    else:
+        # Пагинация по курсору (без OFFSET и COUNT на каждый запрос)
+        paginator = KeysetPaginator(
+            posts,
+            9,
+            ordering=['-published_at', '-created_at', '-id'],
+            cache_key='blog',
+            cache_groups=[page_cache.BLOG],
+        )
+        page_obj = paginator.get_page(page_number)
 
-    # Пагинация
-    paginator = Paginator(posts, 9)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    context = {
+    return {
         'page_obj': page_obj,
         'search_query': search_query,
     }
-    return render(request, 'main/blog_list.html', context)
 
 
+@cache_page_for_anonymous([page_cache.BLOG])
+@conditional.conditional_page(conditional.post_state)
 def blog_detail(request, slug):
     """Детальная страница статьи"""
     post = get_object_or_404(BlogPost, slug=slug, is_published=True)
-    related_posts = BlogPost.objects.filter(
-        is_published=True
-    ).exclude(id=post.id)[:3]
+    related_posts = post.get_related(3)
 
     context = {
         'post': post,
@@ -127,128 +191,103 @@ def contact(request):
     return render(request, 'main/contact.html')
 
 
-@require_POST
-def submit_contact_form(request):
-    """Обработка контактной формы с отправкой в Telegram"""
+CONTACT_SUCCESS = {
+    'success': True,
+    'message': 'Спасибо! Ваше сообщение успешно отправлено.'
+}
+
+
+def contact_form_error(error, status=400):
+    return JsonResponse({'success': False, 'error': error}, status=status)
+
+
+def parse_contact_form(request):
+    """
+    Проверяет JSON контактной формы.
+    Возвращает (поля ContactMessage, None) или (None, ответ с ошибкой).
+    """
     try:
         data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return None, contact_form_error('Неверный формат данных')
+
+    # Получаем данные из формы
+    name = data.get('name', '').strip()
+    phone = data.get('phone', '').strip()
+    email = data.get('email', '').strip()
+    company = data.get('company', '').strip()
+    subject = data.get('subject', '').strip()
+    message = data.get('message', '').strip()
+    contact_type = data.get('type', 'general')  # general, wholesale, cooperation
+
+    # Улучшенная валидация
+    if not all([name, phone, email, subject, message]):
+        return None, contact_form_error('Пожалуйста, заполните все обязательные поля')
+
+    # Проверка длины данных (защита от переполнения)
+    if len(name) > 100 or len(email) > 150 or len(subject) > 200 or len(message) > 500:
+        return None, contact_form_error('Одно из полей превышает максимально допустимую длину')
+
+    # Проверка формата email
+    email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
+    if not re.match(email_regex, email):
+        return None, contact_form_error('Неправильный формат email адреса')
+
+    # Проверка формата телефона
+    phone_clean = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+    if not phone_clean.startswith('+998') or len(phone_clean) != 13:
+        return None, contact_form_error('Неправильный формат номера телефона')
+
+    return {
+        'contact_type': contact_type if contact_type in dict(ContactMessage.TYPE_CHOICES) else 'general',
+        'name': name,
+        'phone': phone[:30],
+        'email': email,
+        'company': company[:200],
+        'subject': subject,
+        'message': message,
+        'ip_address': get_client_ip(request)[:45],
+    }, None
 
-        # Получаем данные из формы
-        name = data.get('name', '').strip()
-        phone = data.get('phone', '').strip()
-        email = data.get('email', '').strip()
-        company = data.get('company', '').strip()
-        subject = data.get('subject', '').strip()
-        message = data.get('message', '').strip()
-        contact_type = data.get('type', 'general')  # general, wholesale, cooperation
-
-        # Улучшенная валидация
-        if not all([name, phone, email, subject, message]):
-            return JsonResponse({
-                'success': False,
-                'error': 'Пожалуйста, заполните все обязательные поля'
-            }, status=400)
-
-        # Проверка длины данных (защита от переполнения)
-        if len(name) > 100 or len(email) > 150 or len(subject) > 200 or len(message) > 500:
-            return JsonResponse({
-                'success': False,
-                'error': 'Одно из полей превышает максимально допустимую длину'
-            }, status=400)
-
-        # Проверка формата email
-        email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
-        if not re.match(email_regex, email):
-            return JsonResponse({
-                'success': False,
-                'error': 'Неправильный формат email адреса'
-            }, status=400)
-
-        # Проверка формата телефона
-        phone_clean = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-        if not phone_clean.startswith('+998') or len(phone_clean) != 13:
-            return JsonResponse({
-                'success': False,
-                'error': 'Неправильный формат номера телефона'
-            }, status=400)
-
-        # Проверяем наличие Telegram настроек
-        if not settings.TELEGRAM_BOT_TOKEN or not settings.TELEGRAM_CHAT_ID:
-            return JsonResponse({
-                'success': False,
-                'error': 'Telegram бот не настроен. Проверьте настройки в .env файле'
-            }, status=500)
-
-        # Типы обращений на русском
-        type_labels = {
-            'general': '❓ Общий вопрос',
-            'wholesale': '📦 Оптовый заказ',
-            'cooperation': '🤝 Сотрудничество',
-        }
-        type_label = type_labels.get(contact_type, '❓ Общий вопрос')
-
-        # Экранируем пользовательский ввод — сообщение отправляется с parse_mode=HTML,
-        # без экранирования можно внедрить кликабельную ссылку/теги в текст для Telegram
-        name_safe = html.escape(name)
-        phone_safe = html.escape(phone)
-        email_safe = html.escape(email)
-        company_safe = html.escape(company) if company else 'Не указана'
-        subject_safe = html.escape(subject)
-        message_safe = html.escape(message)
-
-        # Формируем красивое сообщение для Telegram с HTML форматированием
-        telegram_message = f"""
-🆕 <b>Новое сообщение с сайта HomeTerry</b>
-
-📋 <b>Тип обращения:</b> {type_label}
-━━━━━━━━━━━━━━━━━━━━
-
-👤 <b>Имя:</b> {name_safe}
-📱 <b>Телефон:</b> <code>{phone_safe}</code>
-📧 <b>Email:</b> {email_safe}
-🏢 <b>Компания:</b> {company_safe}
-
-📌 <b>Тема:</b> {subject_safe}
-
-💬 <b>Сообщение:</b>
-{message_safe}
-
-━━━━━━━━━━━━━━━━━━━━
-🌐 IP: {get_client_ip(request)}
-"""
-
-        # Отправляем в Telegram через Bot API
-        telegram_url = f'https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage'
-        telegram_data = {
-            'chat_id': settings.TELEGRAM_CHAT_ID,
-            'text': telegram_message,
-            'parse_mode': 'HTML'
-        }
-
-        response = requests.post(telegram_url, data=telegram_data, timeout=10)
-
-        if response.status_code != 200:
-            raise Exception(f'Telegram API вернул ошибку: {response.status_code}')
-
-        return JsonResponse({
-            'success': True,
-            'message': 'Спасибо! Ваше сообщение успешно отправлено.'
-        })
 
-    except json.JSONDecodeError:
-        return JsonResponse({
-            'success': False,
-            'error': 'Неверный формат данных'
-        }, status=400)
-    except requests.exceptions.RequestException as e:
-        logger.error('Ошибка соединения с Telegram: %s', e)
-        return JsonResponse({
-            'success': False,
-            'error': 'Ошибка соединения с Telegram. Попробуйте позже.'
-        }, status=500)
+@require_POST
+def submit_contact_form(request):
+    """Обработка контактной формы: заявка сохраняется в очередь отправки в Telegram"""
+    try:
+        fields, error = parse_contact_form(request)
+        if error:
+            return error
+        # В Telegram заявку отправит send_contact_notifications, поэтому ответ
+        # не ждет Telegram и заявка не теряется при его недоступности
+        ContactMessage.objects.create(**fields)
+        return JsonResponse(CONTACT_SUCCESS)
     except Exception as e:
         logger.error('Ошибка отправки формы контактов: %s', e)
-        return JsonResponse({
-            'success': False,
-            'error': 'Ошибка отправки. Попробуйте позже.'
-        }, status=500)
+        return contact_form_error('Ошибка отправки. Попробуйте позже.', status=500)
+
+
+def sitemap_file(request, filename):
+    """
+    Отдает готовый sitemap-файл (индекс или шард) из SITEMAP_ROOT.
+    Устаревшие шарды пересобираются перед отдачей; если их уже собирает другой процесс,
+    отдается прежний файл. Клиентам с gzip отдается .gz.
+    """
+    use_gzip = bool(ACCEPTS_GZIP_RE.search(request.headers.get('Accept-Encoding', '')))
+    path = sitemap_files.sitemap_root() / (filename + '.gz' if use_gzip else filename)
+    # Ждем чужую сборку, только если файла еще нет (первая сборка или новый шард)
+    sitemap_files.build(wait=not path.exists())
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise Http404
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-gzip" if use_gzip else ""}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = FileResponse(open(path, 'rb'), content_type='application/xml; charset=utf-8')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,180 @@
+"""
+Прогрев кэша страниц после выкладки или сброса кэша (команда warm_cache).
+
+Адреса берутся из разделов sitemap (main/sitemaps.py) на каждом языке из LANGUAGES
+(язык по умолчанию — без префикса, i18n_patterns с prefix_default_language=False);
+для категорий добавляются сортировки. Порядок — по ожидаемому трафику: главные и разделы,
+категории, товары, блог, внутри уровня сначала язык по умолчанию; с журналом запросов
+(логгер main.requests, main/instrumentation.py) — по числу обращений к адресу.
+Страницы запрашиваются в этом же процессе тестовым клиентом Django без cookie, как у
+анонимного посетителя, в N потоков — и попадают в кэш страниц (main/cache.py).
+"""
+import json
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone, translation
+
+from .benchmark import (
+    close_thread_connections, parse_server_timing, percentile, server_timing_for_all, site_host,
+)
+
+# Разделы sitemap в порядке убывания трафика
+SECTION_ORDER = ('static', 'categories', 'products', 'blog')
+
+# Сортировка категории по умолчанию — адрес без ?sort=
+DEFAULT_SORT = '-created_at'
+
+
+# Кэши, которые живут в памяти процесса: прогрев из manage.py не дойдет до воркеров сервера
+LOCAL_CACHES = ('LocMemCache', 'DummyCache')
+
+
+def cache_backend():
+    return settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1]
+
+
+def languages():
+    """Коды языков: сначала LANGUAGE_CODE, затем остальные из LANGUAGES"""
+    codes = [code for code, _ in settings.LANGUAGES]
+    return sorted(codes, key=lambda code: code != settings.LANGUAGE_CODE)
+
+
+def urls(sections=None, langs=None, sorts=True):
+    """[{'path', 'section', 'language'}] по разделам sitemap в порядке SECTION_ORDER"""
+    from .sitemaps import SITEMAPS
+    from .views import PRODUCT_ORDERINGS
+
+    sections = [name for name in SECTION_ORDER if name in SITEMAPS and (not sections or name in sections)]
+    langs = [code for code in languages() if not langs or code in langs]
+    extra_sorts = [key for key in PRODUCT_ORDERINGS if key != DEFAULT_SORT] if sorts else []
+
+    items = []
+    for section in sections:
+        sitemap = SITEMAPS[section]()
+        objects = sitemap.items()
+        if isinstance(objects, QuerySet):
+            objects = objects.iterator(chunk_size=2000)
+        paths = {code: [] for code in langs}
+        for obj in objects:
+            for code in langs:
+                with translation.override(code):
+                    path = sitemap.location(obj)
+                paths[code].append(path)
+                if section == 'categories':
+                    paths[code] += [f'{path}?sort={key}' for key in extra_sorts]
+        for code in langs:
+            items += [{'path': path, 'section': section, 'language': code} for path in paths[code]]
+    return items
+
+
+def read_traffic(lines):
+    """Число GET-запросов по путям из строк журнала main.requests (JSON на строку)"""
+    hits = Counter()
+    for line in lines:
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            data = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(data, dict) and data.get('method') == 'GET' and data.get('path'):
+            hits[data['path']] += 1
+    return hits
+
+
+def prioritize(items, hits):
+    """Сначала самые посещаемые пути; в журнале путь без query — сортировки идут за своей категорией"""
+    return sorted(items, key=lambda item: -hits.get(item['path'].split('?', 1)[0], 0))
+
+
+class Warmer:
+    """Клиент на поток: запрос без cookie сессии, чтобы ответ сохранился в кэше страниц"""
+
+    def __init__(self, host=None):
+        from django.test import Client
+
+        # Host входит в ключ кэша страниц — должен совпадать с адресом сайта
+        self.client = Client(raise_request_exception=False, HTTP_HOST=host or site_host())
+
+    def fetch(self, item):
+        # LocaleMiddleware оставляет язык запроса активным в потоке — после запроса вернется прежний
+        with translation.override(translation.get_language()):
+            started = time.perf_counter()
+            response = self.client.get(item['path'], secure=True)
+            elapsed = time.perf_counter() - started
+        self.client.cookies.clear()
+        timing = parse_server_timing(response.headers.get('Server-Timing'))
+        return {
+            **item,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 2),
+            'cache': response.headers.get('X-Page-Cache'),
+            'queries': int(timing['queries']) if 'queries' in timing else None,
+            'db_ms': timing.get('db_ms'),
+        }
+
+
+def _stats(results):
+    times = sorted(result['ms'] for result in results)
+    return {
+        'urls': len(results),
+        'errors': sum(1 for result in results if result['status'] >= 400),
+        'already_cached': sum(1 for result in results if result['cache'] == 'HIT'),
+        'mean_ms': round(statistics.fmean(times), 2) if times else None,
+        'p50_ms': percentile(times, 50),
+        'p95_ms': percentile(times, 95),
+        'max_ms': times[-1] if times else None,
+    }
+
+
+def run(items, concurrency=4, host=None, on_result=None):
+    """Запрашивает items по порядку в concurrency потоков; возвращает отчет для JSON"""
+    numbers = count()
+    results = [None] * len(items)
+
+    def worker(_):
+        warmer = Warmer(host)
+        try:
+            while True:
+                # Потоки берут адреса по очереди — первыми прогреваются самые посещаемые
+                i = next(numbers)
+                if i >= len(items):
+                    break
+                results[i] = warmer.fetch(items[i])
+                if on_result:
+                    on_result(results[i])
+        finally:
+            close_thread_connections()
+
+    started_at = timezone.now()
+    started = time.perf_counter()
+    # Число запросов к БД в отчете — из Server-Timing
+    with server_timing_for_all():
+        if concurrency == 1:
+            worker(0)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'meta': {
+            'started_at': started_at.isoformat(),
+            'concurrency': concurrency,
+            'seconds': round(elapsed, 2),
+            'cache': cache_backend(),
+        },
+        'summary': _stats(results),
+        'sections': {
+            section: _stats([result for result in results if result['section'] == section])
+            for section in dict.fromkeys(result['section'] for result in results)
+        },
+        'results': results,
+    }